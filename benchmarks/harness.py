@@ -0,0 +1,96 @@
+"""
+Timing harness for the benchmarks, reporting throughput and latency percentiles.
+"""
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+PERCENTILES = [50, 90, 99]
+
+
+class Benchmark:
+    """
+    A prepared benchmark: `func` is timed once per iteration and does `ops` operations,
+    `teardown` runs once after timing.
+    """
+
+    def __init__(self, func, ops: int = 1, teardown=None):
+        self.func = func
+        self.ops = ops
+        self.teardown = teardown
+
+
+def measure(benchmark: Benchmark, min_time: float = 1.0, min_iterations: int = 10, max_iterations: int = 100_000):
+    """Time a benchmark until both `min_time` seconds and `min_iterations` iterations have passed."""
+    benchmark.func()  # warm up caches and connections outside of the timings
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_iterations and (len(timings) < min_iterations or time.perf_counter() - started < min_time):
+        start = time.perf_counter_ns()
+        benchmark.func()
+        timings.append(time.perf_counter_ns() - start)
+    if benchmark.teardown:
+        benchmark.teardown()
+    timings = np.array(timings) / 1000
+    result = {
+        "iterations": len(timings),
+        "ops_per_iteration": benchmark.ops,
+        "ops_per_sec": benchmark.ops * len(timings) / (timings.sum() / 1e6),
+    }
+    result.update({f"p{p}_us": float(v) for p, v in zip(PERCENTILES, np.percentile(timings, PERCENTILES))})
+    return result
+
+
+def load_fixture(name: str):
+    """Load a recorded fixture, json lines files load as a list of raw lines."""
+    path = FIXTURES / name
+    if path.suffix == ".jsonl":
+        return path.read_bytes().splitlines()
+    return json.loads(path.read_text())
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare_results(results: dict, baseline: dict) -> dict:
+    """The ratio of ops/sec and median latency of each case against a baseline, above 1 is faster."""
+    ratios = {}
+    for name, result in results["cases"].items():
+        before = baseline["cases"].get(name)
+        if before:
+            ratios[name] = {
+                "ops_per_sec": result["ops_per_sec"] / before["ops_per_sec"],
+                "p50_us": before["p50_us"] / result["p50_us"],
+            }
+    return ratios
+
+
+def print_results(results: dict, ratios: dict = None):
+    print(f"{'case':<28} {'ops/sec':>12} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10}")
+    for name, result in results["cases"].items():
+        line = (
+            f"{name:<28} {result['ops_per_sec']:>12,.1f} "
+            f"{result['p50_us']:>10,.1f} {result['p90_us']:>10,.1f} {result['p99_us']:>10,.1f}"
+        )
+        if ratios and name in ratios:
+            line += f"  x{ratios[name]['ops_per_sec']:.2f}"
+        print(line)
+
+
+def save_results(results: dict, path):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+
+
+def environment() -> dict:
+    return {"commit": get_commit(), "python": sys.version.split()[0], "timestamp": int(time.time())}
@@ -0,0 +1,212 @@
+"""
+Benchmarks of the client hot paths, run offline against recorded fixtures and the mock exchange.
+
+    python -m benchmarks.hot_paths --output before.json
+    python -m benchmarks.hot_paths --compare before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+
+from benchmarks.harness import (
+    FIXTURES,
+    Benchmark,
+    compare_results,
+    environment,
+    load_fixture,
+    measure,
+    print_results,
+    save_results,
+)
+from benchmarks.startup import CASES as STARTUP_CASES
+from benchmarks.startup import time_case
+
+TICKER_FAN_IN = 100
+
+
+def make_client():
+    from lyra.constants import TEST_PRIVATE_KEY
+    from lyra.enums import Environment
+    from lyra.lyra import LyraClient
+
+    return LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+
+
+def bench_sign_order():
+    """`_define_order` followed by `_sign_order`, the cost of every order before it is sent."""
+    from lyra.enums import InstrumentType, OrderSide, UnderlyingCurrency
+
+    client = make_client()
+
+    def sign():
+        order = client._define_order(instrument_name="ETH-PERP", price="2000", amount="1", side=OrderSide.BUY)
+        client._sign_order(order, 0, InstrumentType.PERP, UnderlyingCurrency.ETH)
+
+    return Benchmark(sign)
+
+
+def bench_encode_quote():
+    """Encoding quotes of a repeated two leg structure at changing prices, the rfq module data of every quote."""
+    from lyra.mock_exchange import make_instrument
+
+    client = make_client()
+    names = ["ETH-20240329-2400-C", "ETH-20240329-2600-C"]
+    client.instruments.update(
+        {name: make_instrument(name, base_asset_sub_id=str(i + 1)) for i, name in enumerate(names)}
+    )
+    prices = itertools.cycle(["160", "161.5", "159.25"])
+    legs = [
+        {"instrument_name": names[0], "amount": "1", "direction": "buy"},
+        {"instrument_name": names[1], "amount": "1", "direction": "sell"},
+    ]
+
+    def encode():
+        price = next(prices)
+        quote = {"direction": "sell", "max_fee": "10", "legs": [{**leg, "price": price} for leg in legs]}
+        client._encode_quote_data(quote)
+
+    return Benchmark(encode)
+
+
+def bench_validate_orders():
+    """Checking a ladder of 100 orders against the cached instrument specs, before any of them is signed."""
+    from lyra.mock_exchange import DEFAULT_INSTRUMENTS
+    from lyra.validation import check_orders
+
+    instruments = {i["instrument_name"]: i for i in DEFAULT_INSTRUMENTS}
+    orders = [
+        {"instrument_name": "ETH-PERP", "side": "buy", "price": f"{2000 - i * 0.25:.2f}", "amount": "0.5"}
+        for i in range(100)
+    ]
+    return Benchmark(lambda: check_orders(orders, instruments))
+
+
+def bench_auth_header():
+    """The signed headers of private REST requests."""
+    client = make_client()
+    return Benchmark(client._create_signature_headers)
+
+
+def bench_ticker_fan_in():
+    """Concurrent `public/get_ticker` requests over one ws to the mock exchange, per request."""
+    from lyra.async_client import AsyncClient
+    from lyra.constants import TEST_PRIVATE_KEY
+    from lyra.enums import Environment
+    from lyra.mock_exchange import MockExchange
+
+    exchange = MockExchange().start()
+    client = exchange.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+    loop = asyncio.new_event_loop()
+
+    async def fan_in():
+        payload = {"instrument_name": "ETH-PERP"}
+        futures = [await client._send_request("public/get_ticker", payload) for _ in range(TICKER_FAN_IN)]
+        await asyncio.gather(*futures)
+
+    def teardown():
+        loop.run_until_complete(client.close())
+        loop.close()
+        exchange.stop()
+
+    return Benchmark(lambda: loop.run_until_complete(fan_in()), ops=TICKER_FAN_IN, teardown=teardown)
+
+
+def bench_order_book_messages():
+    """Decoding recorded order book notifications and handling them in `AsyncClient.handle_message`."""
+    from lyra.async_client import AsyncClient
+    from lyra.codec import loads
+    from lyra.constants import TEST_PRIVATE_KEY
+    from lyra.enums import Environment
+
+    client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    messages = load_fixture("orderbook_messages.jsonl")
+    client.channel_handlers["orderbook.ETH-PERP.1.10"] = [client.handle_message]
+
+    def handle():
+        for message in messages:
+            client.dispatch(loads(message))
+
+    return Benchmark(handle, ops=len(messages))
+
+
+def bench_replay_order_book():
+    """A recorded order book session replayed as fast as possible into `watch_order_book`, per update."""
+    from lyra.async_client import AsyncClient
+    from lyra.constants import TEST_PRIVATE_KEY
+    from lyra.enums import Environment
+    from lyra.replay import ReplayTransport, load_session
+
+    client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    updates = load_session(FIXTURES / "orderbook_messages.jsonl")
+    loop = asyncio.new_event_loop()
+
+    async def replay():
+        ReplayTransport(updates).connect(client)
+        client.channel_handlers.clear()
+        await client.watch_order_book("ETH-PERP", depth="10")
+        await client.listener
+
+    return Benchmark(lambda: loop.run_until_complete(replay()), ops=len(updates), teardown=loop.close)
+
+
+def bench_portfolio_analyser():
+    """Building a `PortfolioAnalyser` from a recorded subaccount and summing its greeks."""
+    from lyra.analyser import PortfolioAnalyser
+
+    subaccount = load_fixture("subaccount.json")
+    return Benchmark(lambda: PortfolioAnalyser(subaccount).get_total_greeks("ETH"))
+
+
+def bench_cli_import():
+    """Starting a fresh interpreter which imports the cli."""
+    args = STARTUP_CASES["import lyra.cli"]
+    return Benchmark(lambda: time_case(args, 1))
+
+
+BENCHMARKS = {
+    "sign_order": bench_sign_order,
+    "encode_quote": bench_encode_quote,
+    "validate_orders": bench_validate_orders,
+    "auth_header": bench_auth_header,
+    "ticker_fan_in": bench_ticker_fan_in,
+    "order_book_messages": bench_order_book_messages,
+    "replay_order_book": bench_replay_order_book,
+    "portfolio_analyser": bench_portfolio_analyser,
+    "cli_import": bench_cli_import,
+}
+
+
+def run(names=None, min_time: float = 1.0, min_iterations: int = 10):
+    """Run the benchmarks, all of them unless `names` are given."""
+    cases = {}
+    for name in names or BENCHMARKS:
+        cases[name] = measure(BENCHMARKS[name](), min_time=min_time, min_iterations=min_iterations)
+    return {**environment(), "cases": cases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run, defaults to all of {list(BENCHMARKS)}.")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum seconds to time each benchmark.")
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    parser.add_argument("--compare", help="Compare against results saved by an earlier run.")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}")
+
+    results = run(args.names, min_time=args.min_time)
+    ratios = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        ratios = compare_results(results, baseline)
+        print(f"compared against {baseline.get('commit') or args.compare}")
+    print_results(results, ratios)
+    if args.output:
+        save_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Record the benchmark fixtures from the demo exchange, the benchmarks themselves never touch the network.
+
+    python -m benchmarks.record --messages 100 --subaccount-id 5
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.harness import FIXTURES
+
+
+async def record_order_book(client, channel, messages):
+    """Record raw order book notifications, exactly as they arrive on the ws."""
+    from lyra.codec import dumps
+
+    recorded = []
+    done = asyncio.Event()
+
+    def handler(channel, data):
+        recorded.append(dumps({"method": "subscription", "params": {"channel": channel, "data": data}}))
+        if len(recorded) >= messages:
+            done.set()
+
+    await client.subscribe_channels([channel], handler)
+    await done.wait()
+    await client.close()
+    return recorded
+
+
+def main():
+    from lyra.async_client import AsyncClient
+    from lyra.lyra import LyraClient
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--channel", default="orderbook.ETH-PERP.1.10")
+    parser.add_argument("--subaccount-id", type=int, default=None)
+    args = parser.parse_args()
+
+    recorded = asyncio.run(record_order_book(AsyncClient(), args.channel, args.messages))
+    (FIXTURES / "orderbook_messages.jsonl").write_text("\n".join(recorded) + "\n")
+
+    client = LyraClient(subaccount_id=args.subaccount_id)
+    subaccount = client.fetch_subaccount(client.subaccount_id)
+    (FIXTURES / "subaccount.json").write_text(json.dumps(subaccount, indent=1))
+
+
+if __name__ == "__main__":
+    main()
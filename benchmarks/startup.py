@@ -0,0 +1,68 @@
+"""
+Startup benchmark for the lyra package and cli.
+
+Each case runs in a fresh interpreter, as that is what a user pays when calling the cli from a shell.
+
+    python -m benchmarks.startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+CASES = {
+    "import lyra": ["-c", "import lyra"],
+    "import lyra.cli": ["-c", "import lyra.cli"],
+    "lyra --help": ["-m", "lyra.cli", "--help"],
+    "lyra instruments --help": ["-m", "lyra.cli", "instruments", "--help"],
+    "lyra orders --help": ["-m", "lyra.cli", "orders", "--help"],
+    "lyra subaccounts --help": ["-m", "lyra.cli", "subaccounts", "--help"],
+    "lyra tickers --help": ["-m", "lyra.cli", "tickers", "--help"],
+}
+
+# modules that must not be imported just to start the cli
+HEAVY_MODULES = ["pandas", "numpy", "web3", "eth_abi", "aiohttp", "lyra.lyra", "lyra.analyser"]
+
+
+def time_case(args, runs):
+    """Time a case over several fresh interpreters, in milliseconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(timings), "median_ms": statistics.median(timings), "max_ms": max(timings)}
+
+
+def heavy_imports(module="lyra.cli"):
+    """Return the heavy modules pulled in by importing `module`."""
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return output.split()
+
+
+def run(runs=5):
+    """Run every case and return the results."""
+    results = {name: time_case(args, runs) for name, args in CASES.items()}
+    return {"runs": runs, "python": sys.version.split()[0], "heavy_imports": heavy_imports(), "cases": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as json to this file.")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    for name, timing in results["cases"].items():
+        print(f"{name:<28} median {timing['median_ms']:8.1f}ms  min {timing['min_ms']:8.1f}ms")
+    print(f"heavy modules imported by lyra.cli: {results['heavy_imports'] or 'none'}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
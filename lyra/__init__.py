@@ -1,6 +1,14 @@
 """
 Init for the lyra client
 """
-from .lyra import LyraClient
 
-LyraClient
+__all__ = ["LyraClient"]
+
+
+def __getattr__(name):
+    # the client pulls in web3, so we only import it once it is asked for.
+    if name == "LyraClient":
+        from .lyra import LyraClient
+
+        return LyraClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,14 +2,58 @@
 Class based analyser for portfolios.
 """
 
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
+import numpy as np
 import pandas as pd
 
+from lyra.pricing import black76_price, implied_vol
+from lyra.utils import DELTA_COLUMNS, EXPIRY_FORMAT, EXPIRY_HOUR
+
 pd.set_option('display.precision', 2)
 
 
-DELTA_COLUMNS = ['delta', 'gamma', 'vega', 'theta']
+# numeric fields of a position as returned by `private/get_subaccount`
+NUMERIC_COLUMNS = [
+    'amount',
+    'average_price',
+    'cumulative_funding',
+    'index_price',
+    'initial_margin',
+    'leverage',
+    'liquidation_price',
+    'maintenance_margin',
+    'mark_price',
+    'mark_value',
+    'net_settlements',
+    'open_orders_margin',
+    'pending_funding',
+    'realized_pnl',
+    'unrealized_pnl',
+] + DELTA_COLUMNS
+
+INSTRUMENT_COLUMNS = ['currency', 'expiry', 'strike', 'option_type']
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+
+def parse_instrument_names(instrument_names: pd.Series) -> pd.DataFrame:
+    """
+    Split instrument names such as `ETH-PERP` or `ETH-20240329-2400-C` into typed
+    currency, expiry, strike and option type columns in a single vectorised pass.
+    """
+    parts = instrument_names.str.split('-', expand=True).reindex(columns=range(4))
+    is_option = parts[3].isin(['C', 'P'])
+    expiry = pd.to_datetime(parts[1].where(is_option), format=EXPIRY_FORMAT, utc=True) + pd.Timedelta(hours=EXPIRY_HOUR)
+    return pd.DataFrame(
+        {
+            'currency': parts[0].astype('category'),
+            'expiry': expiry,
+            'strike': pd.to_numeric(parts[2].where(is_option)).astype('float64'),
+            'option_type': parts[3].where(is_option).astype('category'),
+        },
+        index=instrument_names.index,
+    )
 
 
 class PortfolioAnalyser:
@@ -18,27 +62,152 @@ class PortfolioAnalyser:
 
     def __init__(self, raw_data: List[dict]):
         self.raw_data = raw_data
-        self.positions = pd.DataFrame.from_records(raw_data['positions'])
-        self.positions["amount"] = pd.to_numeric(self.positions["amount"])
-        for col in DELTA_COLUMNS:
-            self.positions[col] = pd.to_numeric(self.positions[col])
-            adjusted_greek = self.positions[col] * self.positions.amount
-            self.positions[col] = adjusted_greek
+        positions = pd.DataFrame.from_records(raw_data['positions'])
+        if 'instrument_name' not in positions:
+            positions['instrument_name'] = pd.Series(dtype='object')
+        if 'subaccount_id' not in positions:
+            positions['subaccount_id'] = raw_data.get('subaccount_id')
+        for col in NUMERIC_COLUMNS:
+            if col in positions:
+                positions[col] = pd.to_numeric(positions[col]).astype('float64')
+        for col in ['amount'] + DELTA_COLUMNS:
+            if col not in positions:
+                positions[col] = np.zeros(len(positions))
+        positions[DELTA_COLUMNS] = positions[DELTA_COLUMNS].mul(positions['amount'], axis=0)
+        parsed = parse_instrument_names(positions['instrument_name'])
+        self.positions = pd.concat([positions.drop(columns=INSTRUMENT_COLUMNS, errors='ignore'), parsed], axis=1)
+        self._cache = {}
 
-        self.positions = self.positions.apply(pd.to_numeric, errors='ignore')
+    @classmethod
+    def from_subaccounts(cls, subaccounts: Iterable[dict]) -> "PortfolioAnalyser":
+        """
+        Merge several `fetch_subaccount` payloads into a single portfolio.
+        Each position is tagged with the subaccount it belongs to.
+        """
+        merged = {"subaccount_ids": [], "positions": [], "collaterals": [], "subaccount_value": 0.0}
+        for subaccount in subaccounts:
+            subaccount_id = subaccount['subaccount_id']
+            merged["subaccount_ids"].append(subaccount_id)
+            merged["positions"].extend({**p, "subaccount_id": subaccount_id} for p in subaccount['positions'])
+            merged["collaterals"].extend({**c, "subaccount_id": subaccount_id} for c in subaccount['collaterals'])
+            merged["subaccount_value"] += float(subaccount['subaccount_value'])
+        return cls(merged)
+
+    def _cached(self, key, build):
+        """The positions never change after construction, so every derived frame is computed once."""
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def open_positions(self) -> pd.DataFrame:
+        return self._cached('open', lambda: self.positions[self.positions['amount'] != 0])
+
+    def _by_currency(self, df: pd.DataFrame, underlying_currency: str) -> pd.DataFrame:
+        return df[df['currency'] == underlying_currency.upper()]
 
     def get_positions(self, underlying_currency: str) -> pd.DataFrame:
-        df = self.positions
-        df = df[df['instrument_name'].str.contains(underlying_currency.upper())]
-        return df
+        currency = underlying_currency.upper()
+        return self._cached(('positions', currency), lambda: self._by_currency(self.positions, currency))
 
     def get_open_positions(self, underlying_currency: str) -> pd.DataFrame:
-        df = self.get_positions(underlying_currency)
-        return df[df['amount'] != 0]
+        currency = underlying_currency.upper()
+        return self._cached(('open', currency), lambda: self._by_currency(self.open_positions, currency))
 
-    def get_total_greeks(self, underlying_currency: str) -> pd.DataFrame:
+    def get_greeks_by(self, keys: List[str]) -> pd.DataFrame:
+        """
+        Sum the greeks of the open positions grouped by any of the position columns,
+        e.g. `['currency', 'expiry']` or `['subaccount_id', 'currency']`.
+        """
+        return self._cached(
+            ('greeks', tuple(keys)),
+            lambda: self.open_positions.groupby(keys, observed=True, dropna=False)[DELTA_COLUMNS].sum(),
+        )
+
+    def get_total_greeks(self, underlying_currency: str) -> pd.Series:
+        greeks = self.get_greeks_by(['currency'])
+        currency = underlying_currency.upper()
+        if currency not in greeks.index:
+            return pd.Series(0.0, index=DELTA_COLUMNS)
+        return greeks.loc[currency]
+
+    def get_greeks_by_subaccount(self, underlying_currency: str) -> pd.DataFrame:
+        greeks = self.get_greeks_by(['currency', 'subaccount_id'])
+        currency = underlying_currency.upper()
+        if currency not in greeks.index.get_level_values('currency'):
+            return greeks.iloc[:0].droplevel('currency')
+        return greeks.xs(currency, level='currency')
+
+    def get_scenario_pnl(
+        self,
+        underlying_currency: str,
+        spot_shocks: Iterable[float],
+        vol_shocks: Iterable[float],
+        tickers: Optional[Dict[str, dict]] = None,
+        as_of: Optional[pd.Timestamp] = None,
+        rate: float = 0.0,
+    ) -> pd.DataFrame:
+        """
+        Reprice every open position over a grid of relative spot moves and absolute vol shocks
+        with Black-76, in a single vectorised pass over positions x spot shocks x vol shocks.
+        Forwards and vols come from `tickers` (as returned by `fetch_tickers`) when given,
+        otherwise from the index price and the vol implied by the mark price of the position.
+        Returns the PnL of the portfolio indexed by spot shock, with a column per vol shock.
+        """
+        spot_shocks = np.asarray(list(spot_shocks), dtype=float)
+        vol_shocks = np.asarray(list(vol_shocks), dtype=float)
         df = self.get_open_positions(underlying_currency)
-        return df[DELTA_COLUMNS].sum()
+        pnl = np.zeros((len(spot_shocks), len(vol_shocks)))
+        grid = {'index': pd.Index(spot_shocks, name='spot_shock'), 'columns': pd.Index(vol_shocks, name='vol_shock')}
+        if df.empty:
+            return pd.DataFrame(pnl, **grid)
+        as_of = pd.Timestamp.now(tz='UTC') if as_of is None else pd.Timestamp(as_of)
+        if as_of.tzinfo is None:
+            as_of = as_of.tz_localize('UTC')
+
+        amount = df['amount'].to_numpy()
+        forward = df['index_price'].to_numpy(dtype=float, copy=True)
+        vol = np.full(len(df), np.nan)
+        if tickers:
+            for i, instrument_name in enumerate(df['instrument_name']):
+                pricing = (tickers.get(instrument_name) or {}).get('option_pricing') or {}
+                if pricing.get('forward_price') is not None:
+                    forward[i] = float(pricing['forward_price'])
+                if pricing.get('iv') is not None:
+                    vol[i] = float(pricing['iv'])
+
+        is_option = df['option_type'].notna().to_numpy()
+        perp_exposure = float((amount[~is_option] * forward[~is_option]).sum())
+        pnl += (perp_exposure * spot_shocks)[:, None]
+
+        if is_option.any():
+            options = df[is_option]
+            amount, forward, vol = amount[is_option], forward[is_option], vol[is_option]
+            strike = options['strike'].to_numpy()
+            is_call = (options['option_type'] == 'C').to_numpy()
+            time = np.maximum((options['expiry'] - as_of).dt.total_seconds().to_numpy() / SECONDS_PER_YEAR, 0.0)
+            missing = np.isnan(vol)
+            if missing.any():
+                vol[missing] = implied_vol(
+                    options['mark_price'].to_numpy()[missing],
+                    forward[missing],
+                    strike[missing],
+                    time[missing],
+                    is_call[missing],
+                    rate,
+                )
+            base = black76_price(forward, strike, time, vol, is_call, rate)
+            shocked = black76_price(
+                forward[:, None, None] * (1.0 + spot_shocks[None, :, None]),
+                strike[:, None, None],
+                time[:, None, None],
+                vol[:, None, None] + vol_shocks[None, None, :],
+                is_call[:, None, None],
+                rate,
+            )
+            pnl += np.einsum('p,pnm->nm', amount, shocked) - amount @ base
+
+        return pd.DataFrame(pnl, **grid)
 
     def get_subaccount_value(self) -> float:
         return float(self.raw_data['subaccount_value'])
@@ -48,3 +217,100 @@ class PortfolioAnalyser:
         if columns:
             df = df[[c for c in columns if c not in DELTA_COLUMNS] + DELTA_COLUMNS]
         print(df)
+
+
+# numeric fields of an order as returned by `private/get_orders`
+ORDER_NUMERIC_COLUMNS = ['amount', 'filled_amount', 'limit_price', 'average_price', 'order_fee']
+
+ORDER_AGGREGATE_COLUMNS = ['orders', 'amount', 'filled_amount', 'filled_notional', 'fees']
+
+
+class OrderAnalyser:
+    """
+    Analytics over an order history: fill weighted average prices, fill ratios,
+    realised PnL and aggregates per instrument and side, all from a single groupby.
+    """
+
+    def __init__(self, orders: Iterable[dict]):
+        df = pd.DataFrame.from_records(list(orders))
+        for col in ['instrument_name', 'direction']:
+            if col not in df:
+                df[col] = pd.Series(dtype='object')
+        for col in ORDER_NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col]).astype('float64') if col in df else np.zeros(len(df))
+        df['filled_notional'] = df['average_price'] * df['filled_amount']
+        df['fees'] = df['order_fee']
+        self.orders = df
+        self._cache = {}
+
+    @classmethod
+    def from_client(cls, client, instrument_name: Optional[str] = None, regex: Optional[str] = None, **kwargs):
+        """
+        Analyse the full order history of a client, paging through it with `iter_orders`.
+        Orders can be narrowed to instrument names containing `regex`.
+        """
+        orders = client.iter_orders(instrument_name=instrument_name, **kwargs)
+        return cls(o for o in orders if not regex or regex in o['instrument_name'])
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @staticmethod
+    def _with_ratios(df: pd.DataFrame) -> pd.DataFrame:
+        df['fill_ratio'] = df['filled_amount'] / df['amount'].where(df['amount'] != 0)
+        df['average_fill_price'] = df['filled_notional'] / df['filled_amount'].where(df['filled_amount'] != 0)
+        return df
+
+    def get_aggregates(self) -> pd.DataFrame:
+        """Totals per instrument and side, the one pass over the orders every other view is built from."""
+
+        def build():
+            grouped = self.orders.groupby(['instrument_name', 'direction'])
+            df = grouped[ORDER_AGGREGATE_COLUMNS[1:]].sum()
+            df.insert(0, 'orders', grouped.size())
+            return self._with_ratios(df)
+
+        return self._cached('aggregates', build)
+
+    def get_side_summary(self) -> pd.DataFrame:
+        """Totals per side across every instrument."""
+        return self._cached(
+            'sides',
+            lambda: self._with_ratios(self.get_aggregates().groupby(level='direction')[ORDER_AGGREGATE_COLUMNS].sum()),
+        )
+
+    def get_instrument_summary(self) -> pd.DataFrame:
+        """
+        Per instrument fills by side, the net filled amount and the realised PnL of the
+        amount bought and sold back, valued at the fill weighted average prices, net of fees.
+        """
+
+        def build():
+            by_side = self.get_aggregates()[['filled_amount', 'average_fill_price', 'fees']].unstack('direction')
+            by_side = by_side.reindex(
+                columns=pd.MultiIndex.from_product([['filled_amount', 'average_fill_price', 'fees'], ['buy', 'sell']])
+            )
+            bought, sold = by_side['filled_amount'].fillna(0.0).to_numpy().T
+            buy_price, sell_price = by_side['average_fill_price'].to_numpy().T
+            fees = by_side['fees'].fillna(0.0).sum(axis=1).to_numpy()
+            matched = np.minimum(bought, sold)
+            spread = np.where(matched > 0, np.nan_to_num(sell_price - buy_price), 0.0)
+            return pd.DataFrame(
+                {
+                    'bought': bought,
+                    'sold': sold,
+                    'average_buy_price': buy_price,
+                    'average_sell_price': sell_price,
+                    'net_amount': bought - sold,
+                    'fees': fees,
+                    'realised_pnl': matched * spread - fees,
+                },
+                index=by_side.index,
+            )
+
+        return self._cached('instruments', build)
+
+    def get_realised_pnl(self) -> float:
+        return float(self.get_instrument_summary()['realised_pnl'].sum())
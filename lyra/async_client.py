@@ -3,18 +3,31 @@ Async client for Lyra
 """
 
 import asyncio
-import json
+import inspect
+import itertools
+import random
 import time
 from datetime import datetime
+from typing import Callable, Iterable
 
 import aiohttp
 from web3 import Web3
 
+from lyra.codec import dumps, loads
 from lyra.constants import CONTRACTS, TEST_PRIVATE_KEY
 from lyra.enums import Environment, InstrumentType, OrderSide, OrderType, TimeInForce, UnderlyingCurrency
-from lyra.utils import get_logger
+from lyra.metrics import MESSAGES_DROPPED, MESSAGES_RECEIVED, NULL_METRICS
+from lyra.rfq import RfqFeed
+from lyra.tracker import OrderTracker
+from lyra.utils import get_instrument_type, get_logger
+from lyra.validation import validate_orders
 from lyra.ws_client import WsClient as BaseClient
 
+# newer aiohttp versions can hand us the raw bytes of text frames, which the codec decodes directly.
+WS_CONNECT_KWARGS = (
+    {"decode_text": False} if "decode_text" in inspect.signature(aiohttp.ClientSession.ws_connect).parameters else {}
+)
+
 
 class AsyncClient(BaseClient):
     """
@@ -22,11 +35,10 @@ class AsyncClient(BaseClient):
     We us the ws client to make async requests to the lyra ws API
     """
 
-    current_subscriptions = {}
-
     listener = None
-    subscribing = False
+    order_tracker = None
     _ws = None
+    _session = None
 
     def __init__(
         self,
@@ -36,13 +48,17 @@ class AsyncClient(BaseClient):
         verbose=False,
         subaccount_id=None,
         wallet=None,
+        metrics=None,
+        rfq_module_address=None,
     ):
         """
         Initialize the LyraClient class.
         """
+        self.metrics = metrics or NULL_METRICS
         self.verbose = verbose
         self.env = env
         self.contracts = CONTRACTS[env]
+        self.rfq_module_address = rfq_module_address or self.contracts.get('RFQ_MODULE_ADDRESS')
         self.logger = logger or get_logger()
         self.web3_client = Web3()
         self.signer = self.web3_client.eth.account.from_key(private_key)
@@ -51,38 +67,55 @@ class AsyncClient(BaseClient):
         if wallet:
             print(f"Using wallet: {wallet}")
         self.subaccount_id = subaccount_id
-        print(f"Using subaccount id: {self.subaccount_id}")
-        self.message_queues = {}
+        if subaccount_id:
+            print(f"Using subaccount id: {subaccount_id}")
+        self.instruments = {}
+        self.current_subscriptions = {}
+        self.channel_handlers = {}
+        self.pending_requests = {}
+        self.request_ids = itertools.count()
+        # from a random offset, so clients defining orders in the same millisecond don't share nonces
+        self.nonces = itertools.count(random.randrange(1000))
+        self.sent_at = {}
         self.connecting = False
         # we make sure to get the event loop
 
     @property
     async def ws(self):
-        if self._ws is None:
-            self._ws = await self.connect_ws()
-        if not self._ws.connected:
+        if self._ws is None or self._ws.closed:
             self._ws = await self.connect_ws()
         return self._ws
 
+    async def _send_request(self, method: str, params: dict) -> asyncio.Future:
+        """
+        Send a json rpc request, returning a future resolved by the listener with the response.
+        Requests and subscriptions share the connection, so many requests can be in flight at once.
+        """
+        ws = await self.ws
+        self._ensure_listener()
+        id = f"{int(time.time() * 1000)}_{next(self.request_ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[id] = future
+        with self.metrics.stage('send'):
+            await ws.send_json({"method": method, "params": params, "id": id}, dumps=dumps)
+        if self.metrics.enabled:
+            self.sent_at[id] = (method, time.perf_counter())
+        return future
+
+    async def _request(self, method: str, params: dict):
+        """Send a json rpc request and wait for its result."""
+        message = await (await self._send_request(method, params))
+        if "error" in message:
+            raise Exception(f"{method} failed: {message['error']}")
+        return message["result"]
+
     async def fetch_ticker(self, instrument_name: str):
         """
         Fetch the ticker for a symbol
         """
-        id = str(int(time.time()))
-        payload = {"instrument_name": instrument_name}
-        if not self.ws:
-            await self.connect_ws()
-
-        self.ws.send(json.dumps({"method": "public/get_ticker", "params": payload, "id": id}))
-
-        # we now wait for the response
-        while True:
-            response = self.ws.recv()
-            response = json.loads(response)
-            if response["id"] == id:
-                close = float(response["result"]["best_bid_price"]) + float(response["result"]["best_ask_price"]) / 2
-                response["result"]["close"] = close
-                return response["result"]
+        result = await self._request("public/get_ticker", {"instrument_name": instrument_name})
+        result["close"] = float(result["best_bid_price"]) + float(result["best_ask_price"]) / 2
+        return result
 
     def get_subscription_id(self, instrument_name: str, group: str = "1", depth: str = "100"):
         return f"orderbook.{instrument_name}.{group}.{depth}"
@@ -91,67 +124,117 @@ class AsyncClient(BaseClient):
         """
         Subscribe to the order book for a symbol
         """
-        # if self.listener is None or self.listener.done():
-        asyncio.create_task(self.listen_for_messages())
         channel = self.get_subscription_id(instrument_name, group, depth)
-        if channel not in self.message_queues:
-            self.message_queues[channel] = asyncio.Queue()
-            msg = {"method": "subscribe", "params": {"channels": [channel]}}
-            await self.ws.send_json(msg)
-            return
-
+        await self.subscribe_channels([channel], self.handle_message)
         while instrument_name not in self.current_subscriptions:
             await asyncio.sleep(0.01)
         return self.current_subscriptions[instrument_name]
 
+    async def subscribe_channels(self, channels: Iterable[str], handler: Callable[[str, dict], None]):
+        """
+        Subscribe to channels, calling `handler(channel, data)` from the listener for every update.
+        Handlers run inline on the listener, so they should hand off anything slow.
+        """
+        new_channels = []
+        for channel in channels:
+            if channel not in self.channel_handlers:
+                self.channel_handlers[channel] = []
+                new_channels.append(channel)
+            self.channel_handlers[channel].append(handler)
+        if new_channels:
+            result = await self._request("subscribe", {"channels": new_channels})
+            for channel, value in result.get('status', {}).items():
+                if "error" in value:
+                    raise Exception(f"Subscription error for channel: {channel} error: {value['error']}")
+
+    async def unsubscribe_channels(self, channels: Iterable[str]):
+        """Unsubscribe from channels and drop their handlers."""
+        channels = [c for c in channels if self.channel_handlers.pop(c, None) is not None]
+        if channels:
+            await self._request("unsubscribe", {"channels": channels})
+
     async def connect_ws(self):
         self.connecting = True
-        session = aiohttp.ClientSession()
-        ws = await session.ws_connect(self.contracts['WS_ADDRESS'])
+        self._session = session = aiohttp.ClientSession()
+        ws = await session.ws_connect(self.contracts['WS_ADDRESS'], **WS_CONNECT_KWARGS)
         self._ws = ws
         self.connecting = False
         return ws
 
+    def _ensure_listener(self):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen_for_messages())
+
     async def listen_for_messages(
         self,
     ):
-        while True:
-            try:
-                msg = await self.ws.receive_json()
-            except TypeError:
-                continue
-            if "error" in msg:
-                print(msg)
-                raise Exception(msg["error"])
-            if "result" in msg:
-                result = msg["result"]
-                if "status" in result:
-                    # print(f"Succesfully subscribed to {result['status']}")
-                    for channel, value in result['status'].items():
-                        # print(f"Channel {channel} has value {value}")
-                        if "error" in value:
-                            raise Exception(f"Subscription error for channel: {channel} error: {value['error']}")
+        ws = await self.ws
+        try:
+            while True:
+                message = await ws.receive()
+                if message.type in (
+                    aiohttp.WSMsgType.CLOSE,
+                    aiohttp.WSMsgType.CLOSING,
+                    aiohttp.WSMsgType.CLOSED,
+                    aiohttp.WSMsgType.ERROR,
+                ):
+                    break
+                if message.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
                     continue
-            #  default to putting the message in the queue
-            subscription = msg['params']['channel']
-            data = msg['params']['data']
-            self.handle_message(subscription, data)
+                self.metrics.inc(MESSAGES_RECEIVED)
+                self.dispatch(loads(message.data))
+        finally:
+            for future in self.pending_requests.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("ws connection closed"))
+            self.pending_requests.clear()
+
+    def dispatch(self, msg: dict):
+        """Route a decoded message to the request waiting on it, or to the handlers of its channel."""
+        if "id" in msg:
+            future = self.pending_requests.pop(msg["id"], None)
+            if self.metrics.enabled:
+                self._observe_ack(msg["id"])
+            if future is not None and not future.done():
+                future.set_result(msg)
+            else:
+                self.metrics.inc(MESSAGES_DROPPED)
+            return
+        if "error" in msg:
+            self.logger.error(f"Error from ws: {msg['error']}")
+            return
+        if "params" not in msg:
+            self.metrics.inc(MESSAGES_DROPPED)
+            return
+        subscription = msg['params']['channel']
+        data = msg['params']['data']
+        handlers = self.channel_handlers.get(subscription)
+        if not handlers:
+            self.metrics.inc(MESSAGES_DROPPED)
+            return
+        for handler in handlers:
+            handler(subscription, data)
 
     async def login_client(
         self,
     ):
-        login_request = {
-            'method': 'public/login',
-            'params': self.sign_authentication_header(),
-            'id': str(int(time.time())),
-        }
-        await self._ws.send_json(login_request)
-        async for data in self._ws:
-            message = json.loads(data.data)
-            if message['id'] == login_request['id']:
-                if "result" not in message:
-                    raise Exception(f"Unable to login {message}")
-                break
+        await self._request('public/login', self.sign_authentication_header())
+        self._authenticated_ws = self._ws
+
+    async def _ensure_login(self):
+        ws = await self.ws
+        if getattr(self, '_authenticated_ws', None) is not ws:
+            await self.login_client()
+        return ws
+
+    async def warmup(self):
+        """
+        Open and log in the ws while discovering the subaccount, ahead of the first request.
+        """
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(self._ensure_login(), loop.run_in_executor(None, lambda: self.subaccount_id))
+        return self
 
     def handle_message(self, subscription, data):
         bids = data['bids']
@@ -162,8 +245,8 @@ class AsyncClient(BaseClient):
 
         instrument_name = subscription.split(".")[1]
 
-        if subscription in self.current_subscriptions:
-            old_params = self.current_subscriptions[subscription]
+        if instrument_name in self.current_subscriptions:
+            old_params = self.current_subscriptions[instrument_name]
             _asks, _bids = old_params["asks"], old_params["bids"]
             if not asks:
                 asks = _asks
@@ -187,73 +270,82 @@ class AsyncClient(BaseClient):
         Watch the order book for a symbol
         orderbook.{instrument_name}.{group}.{depth}
         """
-
-        if not self.ws and not self.connecting:
-            await self.connect_ws()
-            await self.login_client()
-
         subscription = self.get_subscription_id(instrument_name, group, depth)
 
-        if subscription not in self.message_queues:
-            while any([self.subscribing, self.ws is None, self.connecting]):
-                await asyncio.sleep(1)
-            await self.subscribe(instrument_name, group, depth)
+        if subscription not in self.channel_handlers:
+            return await self.subscribe(instrument_name, group, depth)
 
-        while instrument_name not in self.current_subscriptions and not self.connecting:
+        while instrument_name not in self.current_subscriptions:
             await asyncio.sleep(0.01)
 
         return self.current_subscriptions[instrument_name]
 
+    async def watch_rfqs(self, on_rfq=None, on_close=None) -> RfqFeed:
+        """
+        Stream the RFQs sent to the wallet, calling `on_rfq` for each new one,
+        or iterate the returned feed with `async for`.
+        """
+        return await RfqFeed(self, on_rfq=on_rfq, on_close=on_close).start()
+
+    async def track_orders(self, on_fill=None, on_update=None, seed: bool = True) -> OrderTracker:
+        """
+        Keep the subaccount's orders from the private order and trade channels, instead of polling `fetch_orders`.
+        """
+        tracker = OrderTracker(self.subaccount_id, on_fill=on_fill, on_update=on_update)
+        self.order_tracker = await tracker.start(self, seed=seed)
+        return tracker
+
     async def fetch_instruments(
         self,
         expired=False,
         instrument_type: InstrumentType = InstrumentType.PERP,
         currency: UnderlyingCurrency = UnderlyingCurrency.BTC,
     ):
-        return super().fetch_instruments(expired, instrument_type, currency)
+        """
+        Fetch the instruments over the ws, rather than blocking the loop on a REST request.
+        """
+        payload = {"expired": expired, "instrument_type": instrument_type.value, "currency": currency.name}
+        return await self._request("public/get_instruments", payload)
+
+    async def load_instrument(self, instrument_name: str, refresh: bool = False):
+        """
+        Return the details of an instrument from the local cache, like `get_instrument` without blocking the loop.
+        On a miss every active instrument of the same type and currency is fetched over the ws and cached.
+        """
+        if refresh or instrument_name not in self.instruments:
+            currency = UnderlyingCurrency[instrument_name.split("-")[0]]
+            instruments = await self.fetch_instruments(
+                instrument_type=get_instrument_type(instrument_name), currency=currency
+            )
+            self.instruments.update({i['instrument_name']: i for i in instruments})
+        return self.instruments[instrument_name]
 
     async def close(self):
         """
         Close the connection
         """
-        self.ws.close()
+        if self._ws is not None:
+            await self._ws.close()
+        if self._session is not None:
+            await self._session.close()
 
     async def fetch_tickers(
         self,
         instrument_type: InstrumentType = InstrumentType.OPTION,
         currency: UnderlyingCurrency = UnderlyingCurrency.BTC,
     ):
-        if not self._ws:
-            await self.connect_ws()
         instruments = await self.fetch_instruments(instrument_type=instrument_type, currency=currency)
-        instrument_names = [i['instrument_name'] for i in instruments]
-        id_base = str(int(time.time()))
-        ids_to_instrument_names = {
-            f'{id_base}_{enumerate}': instrument_name for enumerate, instrument_name in enumerate(instrument_names)
-        }
-        for id, instrument_name in ids_to_instrument_names.items():
-            payload = {"instrument_name": instrument_name}
-            await self._ws.send_json({'method': 'public/get_ticker', 'params': payload, 'id': id})
+        requests = []
+        for instrument in instruments:
+            payload = {"instrument_name": instrument['instrument_name']}
+            requests.append(await self._send_request('public/get_ticker', payload))
             await asyncio.sleep(0.1)  # otherwise we get rate limited...
         results = {}
-        while ids_to_instrument_names:
-            message = await self._ws.receive()
-            if message is None:
-                continue
-            if 'error' in message:
-                raise Exception(f"Error fetching ticker {message}")
-            if message.type == aiohttp.WSMsgType.CLOSED:
-                # we try to reconnect
-                print(f"Erorr fetching ticker {message}...")
-                self._ws = await self.connect_ws()
-                return await self.fetch_tickers(instrument_type, currency)
-            message = json.loads(message.data)
-            if message['id'] in ids_to_instrument_names:
-                try:
-                    results[message['result']['instrument_name']] = message['result']
-                except KeyError:
-                    print(f"Error fetching ticker {message}")
-                del ids_to_instrument_names[message['id']]
+        for message in await asyncio.gather(*requests):
+            try:
+                results[message['result']['instrument_name']] = message['result']
+            except KeyError:
+                print(f"Error fetching ticker {message}")
         return results
 
     async def get_collaterals(self):
@@ -282,6 +374,14 @@ class AsyncClient(BaseClient):
         """
         if side.name.upper() not in OrderSide.__members__:
             raise Exception(f"Invalid side {side}")
+        try:
+            instrument = await self.load_instrument(instrument_name)
+        except (KeyError, IndexError):
+            # reported as an unknown instrument by the validation
+            instrument = None
+        validate_orders(
+            [{"instrument_name": instrument_name, "side": side, "price": price, "amount": amount}], self.instruments
+        )
         order = self._define_order(
             instrument_name=instrument_name,
             price=price,
@@ -289,17 +389,77 @@ class AsyncClient(BaseClient):
             side=side,
         )
         _currency = UnderlyingCurrency[instrument_name.split("-")[0]]
-        if instrument_name.split("-")[1] == "PERP":
-            instruments = await self.fetch_instruments(instrument_type=InstrumentType.PERP, currency=_currency)
-            instruments = {i['instrument_name']: i for i in instruments}
-            base_asset_sub_id = instruments[instrument_name]['base_asset_sub_id']
-            instrument_type = InstrumentType.PERP
-        else:
-            instruments = await self.fetch_instruments(instrument_type=InstrumentType.OPTION, currency=_currency)
-            instruments = {i['instrument_name']: i for i in instruments}
-            base_asset_sub_id = instruments[instrument_name]['base_asset_sub_id']
-            instrument_type = InstrumentType.OPTION
+        base_asset_sub_id = instrument['base_asset_sub_id']
+        instrument_type = get_instrument_type(instrument_name)
 
         signed_order = self._sign_order(order, base_asset_sub_id, instrument_type, _currency)
-        response = self.submit_order(signed_order)
+        response = await self.submit_order(signed_order)
         return response
+
+    async def submit_order(self, order):
+        await self._ensure_login()
+        result = await self._request('private/order', order)
+        return result['order']
+
+    async def cancel(self, order_id: str, instrument_name: str):
+        """Cancel an order over the logged in ws, other messages are handled by the listener meanwhile."""
+        await self._ensure_login()
+        payload = {"order_id": order_id, "subaccount_id": self.subaccount_id, "instrument_name": instrument_name}
+        return await self._request('private/cancel', payload)
+
+    async def cancel_all(self):
+        """Cancel all orders, logging in only if the ws is not already authenticated."""
+        await self._ensure_login()
+        return await self._request('private/cancel_all', {"subaccount_id": self.subaccount_id})
+
+    async def replace_orders(self, replacements, orders=None):
+        """
+        Replace orders with new prices and amounts, given as `(order_id, price, amount)` tuples, such as a whole ladder.
+        `orders` maps the ids to the orders being replaced, by default the orders of `track_orders`.
+        The replacements are signed off the loop before anything is sent, then all go out at once using
+        `private/replace`, or as a cancel and an order in flight together where the exchange has no replace method.
+        The fallback is not atomic, the new order is placed even if the cancel fails.
+        Returns a result per replacement, in the order given.
+        """
+        if orders is None:
+            if self.order_tracker is None:
+                raise Exception("Pass the orders being replaced, or call `track_orders` first")
+            orders = self.order_tracker.orders
+        loop = asyncio.get_running_loop()
+        # resolved once up front, rather than lazily from the signing thread.
+        self.subaccount_id
+        signed = await loop.run_in_executor(None, self._sign_replacements, replacements, orders)
+        await self._ensure_login()
+        return await asyncio.gather(*(self._replace(order_id, order) for order_id, order in signed))
+
+    async def _replace(self, order_id: str, order: dict) -> dict:
+        messages = await self._send_replacement(order_id, order)
+        if len(messages) == 1 and self._is_method_not_found(messages):
+            self.supports_replace = False
+            messages = await self._send_replacement(order_id, order)
+        return self._replace_result(order_id, messages)
+
+    async def _send_replacement(self, order_id: str, order: dict) -> list:
+        requests = self._replace_requests(order_id, order)
+        futures = [await self._send_request(method, params) for method, params in requests]
+        return await asyncio.gather(*futures)
+
+    async def kill_switch(self, subaccount_ids=None, instrument_names=None):
+        """
+        Cancel all orders of the subaccounts, or only those of the given instruments, as fast as possible.
+        The cancels are in flight at once, returning a result per cancel with the seconds since the switch was hit.
+        """
+        start = time.perf_counter()
+        await self._ensure_login()
+
+        async def cancel(method, params):
+            message = await (await self._send_request(method, params))
+            return self._kill_switch_result(params, message, time.perf_counter() - start)
+
+        requests = self._kill_switch_requests(subaccount_ids, instrument_names)
+        return await asyncio.gather(*(cancel(method, params) for method, params in requests))
+
+    async def send_quote(self, quote):
+        """Send a signed quote over the logged in ws."""
+        await self._ensure_login()
+        return await self._request('private/send_quote', quote)
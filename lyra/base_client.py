@@ -1,10 +1,12 @@
 """
 Base Client for the lyra dex.
 """
-import json
+import itertools
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 
 import eth_abi
 import requests
@@ -13,6 +15,7 @@ from rich import print
 from web3 import Web3
 from websocket import WebSocketConnectionClosedException, create_connection
 
+from lyra.codec import decode_response, dumpb, dumps, loads
 from lyra.constants import CONTRACTS, PUBLIC_HEADERS, TEST_PRIVATE_KEY
 from lyra.enums import (
     ActionType,
@@ -27,12 +30,23 @@ from lyra.enums import (
     TimeInForce,
     UnderlyingCurrency,
 )
-from lyra.utils import get_logger
+from lyra.metrics import MESSAGES_DROPPED, MESSAGES_RECEIVED, NULL_METRICS, REST_LATENCY, RPC_LATENCY
+from lyra.rfq import QuoteTemplates
+from lyra.utils import get_instrument_type, get_logger
+from lyra.validation import validate_orders
+
+METHOD_NOT_FOUND = -32601
 
 
 class BaseClient:
     """Client for the lyra dex."""
 
+    metrics = NULL_METRICS
+    quote_templates = None
+    rfq_module_address = None
+    # cleared the first time the exchange answers `private/replace` as an unknown method
+    supports_replace = True
+
     def __init__(
         self,
         private_key: str = TEST_PRIVATE_KEY,
@@ -41,13 +55,19 @@ class BaseClient:
         verbose=False,
         subaccount_id=None,
         wallet=None,
+        metrics=None,
+        rfq_module_address=None,
     ):
         """
         Initialize the LyraClient class.
+        Pass a `lyra.metrics.Metrics` as `metrics` to record latencies, by default nothing is recorded.
+        Quotes are signed for `rfq_module_address`, or the rfq module of the environment's contracts.
         """
+        self.metrics = metrics or NULL_METRICS
         self.verbose = verbose
         self.env = env
         self.contracts = CONTRACTS[env]
+        self.rfq_module_address = rfq_module_address or self.contracts.get('RFQ_MODULE_ADDRESS')
         self.logger = logger or get_logger()
         self.web3_client = Web3()
         self.signer = self.web3_client.eth.account.from_key(private_key)
@@ -55,11 +75,38 @@ class BaseClient:
         print(f"Signing address: {self.signer.address}")
         if wallet:
             print(f"Using wallet: {wallet}")
-        if not subaccount_id:
-            self.subaccount_id = self.fetch_subaccounts()['subaccount_ids'][0]
-        else:
-            self.subaccount_id = subaccount_id
-        print(f"Using subaccount id: {self.subaccount_id}")
+        # no network io happens here, the subaccount is discovered and the ws logged in on first use.
+        self.subaccount_id = subaccount_id
+        self.instruments = {}
+        self.request_ids = itertools.count()
+        # from a random offset, so clients defining orders in the same millisecond don't share nonces
+        self.nonces = itertools.count(random.randrange(1000))
+        self.sent_at = {}
+        # responses read while waiting on another request, by id
+        self._responses = {}
+        if subaccount_id:
+            print(f"Using subaccount id: {subaccount_id}")
+
+    @property
+    def subaccount_id(self):
+        if not self._subaccount_id:
+            self._subaccount_id = self.fetch_subaccounts()['subaccount_ids'][0]
+            print(f"Using subaccount id: {self._subaccount_id}")
+        return self._subaccount_id
+
+    @subaccount_id.setter
+    def subaccount_id(self, subaccount_id):
+        self._subaccount_id = subaccount_id
+
+    def warmup(self):
+        """
+        Discover the subaccount and open and log in the ws concurrently, ahead of the first request.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(lambda: self.subaccount_id), executor.submit(self._ensure_login)]
+            for future in futures:
+                future.result()
+        return self
 
     def sign_authentication_header(self):
         timestamp = str(int(time.time() * 1000))
@@ -79,16 +126,21 @@ class BaseClient:
         ws = create_connection(self.contracts['WS_ADDRESS'], enable_multithread=True, timeout=60)
         return ws
 
+    def _post(self, url, payload, headers=None):
+        """
+        Post a json payload and return the decoded response.
+        Both directions go through the codec rather than the json handling of `requests`.
+        """
+        headers = {**PUBLIC_HEADERS, **headers} if headers else PUBLIC_HEADERS
+        with self.metrics.time(REST_LATENCY, method=url.split('/', 3)[-1]):
+            response = requests.post(url, data=dumpb(payload), headers=headers)
+            return decode_response(response)
+
     def create_account(self, wallet):
         """Call the create account endpoint."""
         payload = {"wallet": wallet}
         url = f"{self.contracts['BASE_URL']}/public/create_account"
-        result = requests.post(
-            headers=PUBLIC_HEADERS,
-            url=url,
-            json=payload,
-        )
-        result_code = json.loads(result.content)
+        result_code = self._post(url, payload)
 
         if "error" in result_code:
             raise Exception(result_code["error"])
@@ -111,10 +163,35 @@ class BaseClient:
             "instrument_type": instrument_type.value,
             "currency": currency.name,
         }
-        response = requests.post(url, json=payload, headers=PUBLIC_HEADERS)
-        results = response.json()["result"]
+        results = self._post(url, payload)["result"]
         return results
 
+    def get_instrument(self, instrument_name: str, refresh: bool = False):
+        """
+        Return the details of an instrument from the local cache.
+        On a miss every active instrument of the same type and currency is fetched and cached in one request.
+        """
+        if refresh or instrument_name not in self.instruments:
+            currency = UnderlyingCurrency[instrument_name.split("-")[0]]
+            instruments = BaseClient.fetch_instruments(
+                self, instrument_type=get_instrument_type(instrument_name), currency=currency
+            )
+            self.instruments.update({i['instrument_name']: i for i in instruments})
+        return self.instruments[instrument_name]
+
+    def validate_orders(self, orders, round_first: bool = False):
+        """
+        Check orders against the cached instrument specs before anything is signed, raising an
+        `OrderValidationError` for those the exchange would reject. Uncached instruments are fetched once.
+        """
+        for instrument_name in {order['instrument_name'] for order in orders}:
+            try:
+                self.get_instrument(instrument_name)
+            except (KeyError, IndexError):
+                # reported as an unknown instrument by the validation
+                pass
+        return validate_orders(orders, self.instruments, round_first=round_first)
+
     def fetch_subaccounts(self):
         """
         Returns the subaccounts for a given wallet
@@ -122,8 +199,7 @@ class BaseClient:
         url = f"{self.contracts['BASE_URL']}/private/get_subaccounts"
         payload = {"wallet": self.wallet}
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = json.loads(response.content)["result"]
+        results = self._post(url, payload, headers)["result"]
         return results
 
     def fetch_subaccount(self, subaccount_id):
@@ -133,10 +209,20 @@ class BaseClient:
         url = f"{self.contracts['BASE_URL']}/private/get_subaccount"
         payload = {"subaccount_id": subaccount_id}
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]
+        results = self._post(url, payload, headers)["result"]
         return results
 
+    def fetch_many_subaccounts(self, subaccount_ids=None, max_workers: int = 8):
+        """
+        Fetch several subaccounts concurrently, with at most `max_workers` requests in flight.
+        Defaults to every subaccount of the wallet, returns a dict keyed by subaccount id.
+        """
+        if subaccount_ids is None:
+            subaccount_ids = self.fetch_subaccounts()['subaccount_ids']
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(self.fetch_subaccount, subaccount_ids)
+            return dict(zip(subaccount_ids, results))
+
     def create_order(
         self,
         price,
@@ -152,6 +238,7 @@ class BaseClient:
         """
         if side.name.upper() not in OrderSide.__members__:
             raise Exception(f"Invalid side {side}")
+        self.validate_orders([{"instrument_name": instrument_name, "side": side, "price": price, "amount": amount}])
         order = self._define_order(
             instrument_name=instrument_name,
             price=price,
@@ -159,16 +246,8 @@ class BaseClient:
             side=side,
         )
         _currency = UnderlyingCurrency[instrument_name.split("-")[0]]
-        if instrument_name.split("-")[1] == "PERP":
-            instruments = self.fetch_instruments(instrument_type=InstrumentType.PERP, currency=_currency)
-            instruments = {i['instrument_name']: i for i in instruments}
-            base_asset_sub_id = instruments[instrument_name]['base_asset_sub_id']
-            instrument_type = InstrumentType.PERP
-        else:
-            instruments = self.fetch_instruments(instrument_type=InstrumentType.OPTION, currency=_currency)
-            instruments = {i['instrument_name']: i for i in instruments}
-            base_asset_sub_id = instruments[instrument_name]['base_asset_sub_id']
-            instrument_type = InstrumentType.OPTION
+        base_asset_sub_id = self.get_instrument(instrument_name)['base_asset_sub_id']
+        instrument_type = get_instrument_type(instrument_name)
 
         signed_order = self._sign_order(order, base_asset_sub_id, instrument_type, _currency)
         response = self.submit_order(signed_order)
@@ -185,34 +264,33 @@ class BaseClient:
         """
         Define the order, in preparation for encoding and signing
         """
-        ts = int(datetime.now().timestamp() * 1000)
-        return {
-            'instrument_name': instrument_name,
-            'subaccount_id': self.subaccount_id,
-            'direction': side.name.lower(),
-            'limit_price': price,
-            'amount': amount,
-            'signature_expiry_sec': int(ts) + 3000,
-            'max_fee': '200.01',
-            'nonce': int(f"{int(ts)}{random.randint(100, 999)}"),
-            'signer': self.signer.address,
-            'order_type': 'limit',
-            'mmp': False,
-            'time_in_force': time_in_force.value,
-            'signature': 'filled_in_below',
-        }
+        with self.metrics.stage('define'):
+            ts = int(datetime.now().timestamp() * 1000)
+            return {
+                'instrument_name': instrument_name,
+                'subaccount_id': self.subaccount_id,
+                'direction': side.name.lower(),
+                'limit_price': price,
+                'amount': amount,
+                'signature_expiry_sec': int(ts) + 3000,
+                'max_fee': '200.01',
+                # a per client counter keeps nonces unique within a millisecond, for up to 1000 orders
+                'nonce': int(ts) * 1000 + next(self.nonces) % 1000,
+                'signer': self.signer.address,
+                'order_type': 'limit',
+                'mmp': False,
+                'time_in_force': time_in_force.value,
+                'signature': 'filled_in_below',
+            }
 
     def submit_order(self, order):
-        id = str(int(time.time()))
-        self.ws.send(json.dumps({'method': 'private/order', 'params': order, 'id': id}))
-        while True:
-            message = json.loads(self.ws.recv())
-            if message['id'] == id:
-                try:
-                    return message['result']['order']
-                except KeyError as error:
-                    print(message)
-                    raise Exception(f"Unable to submit order {message}") from error
+        self._ensure_login()
+        message = self._wait_rpc(self._send_rpc('private/order', order))
+        try:
+            return message['result']['order']
+        except KeyError as error:
+            print(message)
+            raise Exception(f"Unable to submit order {message}") from error
 
     def _encode_trade_data(self, order, base_asset_sub_id, instrument_type, currency):
         encoded_data = eth_abi.encode(
@@ -231,69 +309,83 @@ class BaseClient:
         return self.web3_client.keccak(encoded_data)
 
     def _sign_order(self, order, base_asset_sub_id, instrument_type, currency):
-        trade_module_data = self._encode_trade_data(order, base_asset_sub_id, instrument_type, currency)
-        encoded_action_hash = eth_abi.encode(
-            ['bytes32', 'uint256', 'uint256', 'address', 'bytes32', 'uint256', 'address', 'address'],
-            [
-                bytes.fromhex(self.contracts['ACTION_TYPEHASH'][2:]),
-                order['subaccount_id'],
-                order['nonce'],
-                self.contracts['TRADE_MODULE_ADDRESS'],
-                trade_module_data,
-                order['signature_expiry_sec'],
-                self.wallet,
-                order['signer'],
-            ],
-        )
-
-        action_hash = self.web3_client.keccak(encoded_action_hash)
-        encoded_typed_data_hash = "".join(['0x1901', self.contracts['DOMAIN_SEPARATOR'][2:], action_hash.hex()[2:]])
-        typed_data_hash = self.web3_client.keccak(hexstr=encoded_typed_data_hash)
-        order['signature'] = self.signer.signHash(typed_data_hash).signature.hex()
+        with self.metrics.stage('encode'):
+            trade_module_data = self._encode_trade_data(order, base_asset_sub_id, instrument_type, currency)
+            encoded_action_hash = eth_abi.encode(
+                ['bytes32', 'uint256', 'uint256', 'address', 'bytes32', 'uint256', 'address', 'address'],
+                [
+                    bytes.fromhex(self.contracts['ACTION_TYPEHASH'][2:]),
+                    order['subaccount_id'],
+                    order['nonce'],
+                    self.contracts['TRADE_MODULE_ADDRESS'],
+                    trade_module_data,
+                    order['signature_expiry_sec'],
+                    self.wallet,
+                    order['signer'],
+                ],
+            )
+
+        with self.metrics.stage('sign'):
+            action_hash = self.web3_client.keccak(encoded_action_hash)
+            encoded_typed_data_hash = "".join(['0x1901', self.contracts['DOMAIN_SEPARATOR'][2:], action_hash.hex()[2:]])
+            typed_data_hash = self.web3_client.keccak(hexstr=encoded_typed_data_hash)
+            order['signature'] = self.signer.signHash(typed_data_hash).signature.hex()
         return order
 
     def _sign_quote(self, quote):
         """
         Sign the quote
         """
-        rfq_module_data = self._encode_quote_data(quote)
+        with self.metrics.stage('encode'):
+            rfq_module_data = self._encode_quote_data(quote)
         return self._sign_quote_data(quote, rfq_module_data)
 
-    def _encode_quote_data(self, quote, underlying_currency: UnderlyingCurrency = UnderlyingCurrency.ETH):
-        """
-        Convert the quote to encoded data.
-        """
-        instruments = self.fetch_instruments(instrument_type=InstrumentType.OPTION, currency=underlying_currency)
-        ledgs_to_subids = {i['instrument_name']: i['base_asset_sub_id'] for i in instruments}
-        dir_sign = 1 if quote['direction'] == 'buy' else -1
-        quote['price'] = '10'
-
-        def encode_leg(leg):
-            print(quote)
-            sub_id = ledgs_to_subids[leg['instrument_name']]
-            leg_sign = 1 if leg['direction'] == 'buy' else -1
-            signed_amount = self.web3_client.to_wei(leg['amount'], 'ether') * leg_sign * dir_sign
-            return [
-                self.contracts[f"{underlying_currency.name}_OPTION_ADDRESS"],
-                sub_id,
-                self.web3_client.to_wei(quote['price'], 'ether'),
-                signed_amount,
-            ]
+    def _encode_quote_leg(self, leg, direction_sign: int):
+        """The abi values of a priced leg, the asset and sub id come from the instrument cache."""
+        instrument = self.get_instrument(leg['instrument_name'])
+        currency = UnderlyingCurrency[leg['instrument_name'].split("-")[0]]
+        instrument_type = get_instrument_type(leg['instrument_name'])
+        leg_sign = 1 if leg['direction'] == 'buy' else -1
+        return (
+            self.contracts[f"{currency.name}_{instrument_type.name}_ADDRESS"],
+            int(instrument['base_asset_sub_id']),
+            self.web3_client.to_wei(leg['price'], 'ether'),
+            self.web3_client.to_wei(leg['amount'], 'ether') * leg_sign * direction_sign,
+        )
 
-        encoded_legs = [encode_leg(leg) for leg in quote['legs']]
-        rfq_data = [self.web3_client.to_wei(quote['max_fee'], 'ether'), encoded_legs]
+    def _encode_quote_data(self, quote):
+        """
+        Convert the quote, with a price on each leg, to encoded data.
+        Repeated leg structures are encoded from cached templates.
+        """
+        if self.quote_templates is None:
+            self.quote_templates = QuoteTemplates(self._encode_quote_leg)
+        return self.web3_client.keccak(self.quote_templates.encode(quote, self.web3_client.to_wei))
 
-        encoded_data = eth_abi.encode(
-            # ['uint256(address,uint256,uint256,int256)[]'],
-            [
-                'uint256',
-                'address',
-                'uint256',
-                'int256',
-            ],
-            [rfq_data],
-        )
-        return self.web3_client.keccak(encoded_data)
+    def _sign_quote_data(self, quote, rfq_module_data):
+        """
+        Sign the encoded quote as an action of the rfq module.
+        """
+        if not self.rfq_module_address:
+            raise Exception(f"No rfq module address for {self.env}, pass `rfq_module_address` to sign quotes")
+        with self.metrics.stage('encode'):
+            encoded_action_hash = eth_abi.encode(
+                ['bytes32', 'uint256', 'uint256', 'address', 'bytes32', 'uint256', 'address', 'address'],
+                [
+                    bytes.fromhex(self.contracts['ACTION_TYPEHASH'][2:]),
+                    quote['subaccount_id'],
+                    quote['nonce'],
+                    self.rfq_module_address,
+                    rfq_module_data,
+                    quote['signature_expiry_sec'],
+                    self.wallet,
+                    quote['signer'],
+                ],
+            )
+        with self.metrics.stage('sign'):
+            typed_data_hash = self._generate_typed_data_hash(self.web3_client.keccak(encoded_action_hash))
+            quote['signature'] = self.signer.signHash(typed_data_hash).signature.hex()
+        return quote
 
     @property
     def ws(self):
@@ -307,34 +399,86 @@ class BaseClient:
         self,
         retries=3,
     ):
-        login_request = {
-            'method': 'public/login',
-            'params': self.sign_authentication_header(),
-            'id': str(int(time.time())),
-        }
         try:
-            self.ws.send(json.dumps(login_request))
-            # we need to wait for the response
-            while True:
-                message = json.loads(self.ws.recv())
-                if message['id'] == login_request['id']:
-                    if "result" not in message:
-                        raise Exception(f"Unable to login {message}")
-                    break
+            message = self._wait_rpc(self._send_rpc('public/login', self.sign_authentication_header()))
+            if "result" not in message:
+                raise Exception(f"Unable to login {message}")
+            self._authenticated_ws = self._ws
         except (WebSocketConnectionClosedException, Exception) as error:
             if retries:
                 time.sleep(1)
-                self.login_client(retries=retries - 1)
+                return self.login_client(retries=retries - 1)
             raise error
 
+    def _send_rpc(self, method, params):
+        """
+        Send a json rpc request over the ws without waiting for the response, returning its id.
+        Ids are unique per client, so several requests can be in flight on the connection.
+        """
+        id = f"{int(time.time() * 1000)}_{next(self.request_ids)}"
+        with self.metrics.stage('send'):
+            self.ws.send(dumps({'method': method, 'params': params, 'id': id}))
+        if self.metrics.enabled:
+            self.sent_at[id] = (method, time.perf_counter())
+        return id
+
+    def _recv_rpc(self):
+        """
+        Receive the next json rpc response, buffered or from the ws.
+        """
+        if self._responses:
+            return self._responses.pop(next(iter(self._responses)))
+        return self._read_rpc()
+
+    def _wait_rpc(self, id):
+        """
+        Wait for the response to a request. Responses to other requests in flight on the connection
+        are buffered for `_recv_rpc` rather than dropped.
+        """
+        message = self._responses.pop(id, None)
+        while message is None:
+            message = self._read_rpc()
+            if message['id'] != id:
+                self._responses[message['id']] = message
+                message = None
+        return message
+
+    def _read_rpc(self):
+        """
+        Read the next json rpc response from the ws, skipping subscription notifications.
+        """
+        while True:
+            message = loads(self.ws.recv())
+            self.metrics.inc(MESSAGES_RECEIVED)
+            if 'id' in message:
+                if self.metrics.enabled:
+                    self._observe_ack(message['id'])
+                return message
+            self.metrics.inc(MESSAGES_DROPPED)
+
+    def _observe_ack(self, id):
+        """Record the time from sending a request to its response, per method."""
+        sent = self.sent_at.pop(id, None)
+        if sent is not None:
+            method, sent_at = sent
+            self.metrics.observe(RPC_LATENCY, time.perf_counter() - sent_at, method=method)
+
+    def _ensure_login(self):
+        """
+        Log in unless the current ws connection is already authenticated.
+        """
+        ws = self.ws
+        if getattr(self, '_authenticated_ws', None) is not ws:
+            self.login_client()
+        return ws
+
     def fetch_ticker(self, instrument_name):
         """
         Fetch the ticker for a given instrument name.
         """
         url = f"{self.contracts['BASE_URL']}/public/get_ticker"
         payload = {"instrument_name": instrument_name}
-        response = requests.post(url, json=payload, headers=PUBLIC_HEADERS)
-        results = json.loads(response.content)["result"]
+        results = self._post(url, payload)["result"]
         return results
 
     def fetch_orders(
@@ -348,41 +492,247 @@ class BaseClient:
         """
         Fetch the orders for a given instrument name.
         """
+        return self._fetch_orders_page(instrument_name, label, page, page_size, status)['orders']
+
+    def _fetch_orders_page(
+        self,
+        instrument_name: str = None,
+        label: str = None,
+        page: int = 1,
+        page_size: int = 100,
+        status: OrderStatus = None,
+    ):
+        """
+        Fetch a single page of orders, including the pagination metadata.
+        """
+        if isinstance(status, OrderStatus):
+            status = status.value
         url = f"{self.contracts['BASE_URL']}/private/get_orders"
         payload = {"instrument_name": instrument_name, "subaccount_id": self.subaccount_id}
         for key, value in {"label": label, "page": page, "page_size": page_size, "status": status}.items():
             if value:
                 payload[key] = value
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]['orders']
-        return results
+        return self._post(url, payload, headers)["result"]
+
+    def iter_order_pages(
+        self,
+        instrument_name: str = None,
+        label: str = None,
+        page_size: int = 100,
+        status: OrderStatus = None,
+        max_orders: int = None,
+        since: int = None,
+        prefetch: bool = True,
+    ):
+        """
+        Yield the order history one page at a time, so memory stays flat regardless of its size.
+        When `prefetch` is set the next page is requested while the current one is being processed.
+        Stops after `max_orders` orders, or once orders created before `since` (ms timestamp) are reached,
+        as the exchange returns the newest orders first.
+        """
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+
+        def request(page):
+            args = (instrument_name, label, page, page_size, status)
+            if executor is None:
+                return partial(self._fetch_orders_page, *args)
+            return executor.submit(self._fetch_orders_page, *args)
+
+        page = 1
+        remaining = max_orders
+        pending = request(page)
+        try:
+            while pending is not None:
+                result = pending.result() if executor is not None else pending()
+                orders = result['orders']
+                num_pages = result.get('pagination', {}).get('num_pages')
+                exhausted = not orders or (num_pages is not None and page >= num_pages)
+                if since is not None:
+                    exhausted = exhausted or any(o['creation_timestamp'] < since for o in orders)
+                    orders = [o for o in orders if o['creation_timestamp'] >= since]
+                if remaining is not None:
+                    orders = orders[:remaining]
+                    remaining -= len(orders)
+                    exhausted = exhausted or remaining <= 0
+                page += 1
+                pending = None if exhausted else request(page)
+                if orders:
+                    yield orders
+        finally:
+            if executor is not None:
+                if pending is not None:
+                    pending.cancel()
+                executor.shutdown(wait=False)
+
+    def iter_orders(self, *args, **kwargs):
+        """
+        Yield orders one at a time across all pages, see `iter_order_pages` for the arguments.
+        """
+        for orders in self.iter_order_pages(*args, **kwargs):
+            yield from orders
 
     def cancel(self, order_id, instrument_name):
         """
         Cancel an order
         """
 
-        id = str(int(time.time()))
+        self._ensure_login()
         payload = {"order_id": order_id, "subaccount_id": self.subaccount_id, "instrument_name": instrument_name}
-        self.ws.send(json.dumps({'method': 'private/cancel', 'params': payload, 'id': id}))
-        while True:
-            message = json.loads(self.ws.recv())
-            if message['id'] == id:
-                return message['result']
+        return self._wait_rpc(self._send_rpc('private/cancel', payload))['result']
 
     def cancel_all(self):
         """
-        Cancel all orders
+        Cancel all orders, logging in only if the ws is not already authenticated.
         """
-        id = str(int(time.time()))
         payload = {"subaccount_id": self.subaccount_id}
-        self.login_client()
-        self.ws.send(json.dumps({'method': 'private/cancel_all', 'params': payload, 'id': id}))
-        while True:
-            message = json.loads(self.ws.recv())
-            if message['id'] == id:
-                return message['result']
+        self._ensure_login()
+        return self._wait_rpc(self._send_rpc('private/cancel_all', payload))['result']
+
+    def _sign_replacement(self, order: dict, price, amount) -> dict:
+        """Define and sign the order replacing `order`, on the same instrument and side with a new price and amount."""
+        instrument_name = order['instrument_name']
+        defined = self._define_order(
+            instrument_name=instrument_name,
+            price=str(price),
+            amount=str(amount),
+            side=OrderSide(order['direction']),
+            time_in_force=TimeInForce(order.get('time_in_force', TimeInForce.GTC.value)),
+        )
+        if order.get('label'):
+            defined['label'] = order['label']
+        return self._sign_order(
+            defined,
+            self.get_instrument(instrument_name)['base_asset_sub_id'],
+            get_instrument_type(instrument_name),
+            UnderlyingCurrency[instrument_name.split("-")[0]],
+        )
+
+    def _sign_replacements(self, replacements, orders: dict) -> list:
+        for order_id, _, _ in replacements:
+            if order_id not in orders:
+                raise Exception(f"Unknown order {order_id}, pass its instrument and side in `orders`")
+        self.validate_orders(
+            [
+                {**orders[order_id], "side": orders[order_id]['direction'], "price": price, "amount": amount}
+                for order_id, price, amount in replacements
+            ]
+        )
+        signed = []
+        for order_id, price, amount in replacements:
+            signed.append((order_id, self._sign_replacement(orders[order_id], price, amount)))
+        return signed
+
+    def _replace_requests(self, order_id: str, order: dict) -> list:
+        """The requests replacing an order, in one `private/replace` or as a cancel followed by the new order."""
+        if self.supports_replace:
+            return [('private/replace', {**order, 'order_id_to_cancel': order_id})]
+        cancel = {
+            "order_id": order_id,
+            "subaccount_id": order['subaccount_id'],
+            "instrument_name": order['instrument_name'],
+        }
+        return [('private/cancel', cancel), ('private/order', order)]
+
+    @staticmethod
+    def _replace_result(order_id: str, messages: list) -> dict:
+        """Combine the responses of a replacement into the shape of the `private/replace` result."""
+        if len(messages) == 1:
+            result = messages[0].get('result') or {}
+            error = messages[0].get('error') or result.get('create_order_error')
+        else:
+            cancelled, created = messages
+            result = {'cancelled_order': cancelled.get('result'), **(created.get('result') or {})}
+            error = cancelled.get('error') or created.get('error')
+        return {
+            "order_id_to_cancel": order_id,
+            "cancelled_order": result.get('cancelled_order'),
+            "order": result.get('order'),
+            "trades": result.get('trades', []),
+            "error": error,
+        }
+
+    @staticmethod
+    def _is_method_not_found(messages: list) -> bool:
+        return any((message.get('error') or {}).get('code') == METHOD_NOT_FOUND for message in messages)
+
+    def replace_orders(self, replacements, orders: dict) -> list:
+        """
+        Replace orders with new prices and amounts, given as `(order_id, price, amount)` tuples, such as a whole ladder.
+        `orders` maps the ids to the orders being replaced, for their instrument and side, e.g. `OrderTracker.orders`.
+        All replacements are signed before anything is sent, then pipelined over the ws using `private/replace`,
+        falling back to a cancel followed by the new order where the exchange has no replace method. The fallback
+        is not atomic, the new order is placed even if the cancel fails.
+        Returns a result per replacement, in the order given.
+        """
+        signed = self._sign_replacements(replacements, orders)
+        self._ensure_login()
+        results = self._send_replacements(signed)
+        if not self.supports_replace:
+            # the exchange refused the replace method, send the refused ones again as a cancel and an order
+            retry = [i for i, result in enumerate(results) if result is None]
+            for i, result in zip(retry, self._send_replacements([signed[i] for i in retry])):
+                results[i] = result
+        return results
+
+    def _send_replacements(self, signed: list) -> list:
+        sent = [
+            [self._send_rpc(method, params) for method, params in self._replace_requests(order_id, order)]
+            for order_id, order in signed
+        ]
+        results = []
+        for (order_id, _), ids in zip(signed, sent):
+            messages = [self._wait_rpc(id) for id in ids]
+            if len(messages) == 1 and self._is_method_not_found(messages):
+                self.supports_replace = False
+                results.append(None)
+            else:
+                results.append(self._replace_result(order_id, messages))
+        return results
+
+    def _kill_switch_requests(self, subaccount_ids=None, instrument_names=None):
+        """The cancels of a kill switch, one per subaccount or one per subaccount and instrument."""
+        requests = []
+        for subaccount_id in subaccount_ids or [self.subaccount_id]:
+            if not instrument_names:
+                requests.append(('private/cancel_all', {"subaccount_id": subaccount_id}))
+            for instrument_name in instrument_names or []:
+                params = {"subaccount_id": subaccount_id, "instrument_name": instrument_name}
+                requests.append(('private/cancel_by_instrument', params))
+        return requests
+
+    @staticmethod
+    def _kill_switch_result(params, message, seconds):
+        return {
+            "subaccount_id": params["subaccount_id"],
+            "instrument_name": params.get("instrument_name"),
+            "status": "error" if "error" in message else "ok",
+            "result": message.get("result"),
+            "error": message.get("error"),
+            "seconds": seconds,
+        }
+
+    def kill_switch(self, subaccount_ids=None, instrument_names=None):
+        """
+        Cancel all orders of the subaccounts, or only those of the given instruments, as fast as possible.
+        The cancels are pipelined over the ws, logging in first only if it is not already authenticated.
+        Returns a result per cancel, in the order they completed, with the seconds since the switch was hit.
+        """
+        start = time.perf_counter()
+        self._ensure_login()
+        pending = {
+            self._send_rpc(method, params): params
+            for method, params in self._kill_switch_requests(subaccount_ids, instrument_names)
+        }
+        results = []
+        while pending:
+            message = self._read_rpc()
+            params = pending.pop(message['id'], None)
+            if params is None:
+                self._responses[message['id']] = message
+                continue
+            results.append(self._kill_switch_result(params, message, time.perf_counter() - start))
+        return results
 
     def get_positions(self):
         """
@@ -391,8 +741,7 @@ class BaseClient:
         url = f"{self.contracts['BASE_URL']}/private/get_positions"
         payload = {"subaccount_id": self.subaccount_id}
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]['positions']
+        results = self._post(url, payload, headers)["result"]['positions']
         return results
 
     def get_collaterals(self):
@@ -402,8 +751,7 @@ class BaseClient:
         url = f"{self.contracts['BASE_URL']}/private/get_collaterals"
         payload = {"subaccount_id": self.subaccount_id}
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]['collaterals']
+        results = self._post(url, payload, headers)["result"]['collaterals']
         return results.pop()
 
     def fetch_tickers(
@@ -416,17 +764,14 @@ class BaseClient:
         """
         instruments = self.fetch_instruments(instrument_type=instrument_type, currency=currency)
         instrument_names = [i['instrument_name'] for i in instruments]
-        id_base = str(int(time.time()))
-        ids_to_instrument_names = {
-            f'{id_base}_{enumerate}': instrument_name for enumerate, instrument_name in enumerate(instrument_names)
-        }
-        for id, instrument_name in ids_to_instrument_names.items():
-            payload = {"instrument_name": instrument_name}
-            self.ws.send(json.dumps({'method': 'public/get_ticker', 'params': payload, 'id': id}))
+        ids_to_instrument_names = {}
+        for instrument_name in instrument_names:
+            id = self._send_rpc('public/get_ticker', {"instrument_name": instrument_name})
+            ids_to_instrument_names[id] = instrument_name
             time.sleep(0.05)  # otherwise we get rate limited...
         results = {}
         while ids_to_instrument_names:
-            message = json.loads(self.ws.recv())
+            message = self._recv_rpc()
             if message['id'] in ids_to_instrument_names:
                 results[message['result']['instrument_name']] = message['result']
                 del ids_to_instrument_names[message['id']]
@@ -484,14 +829,14 @@ class BaseClient:
         print(f"Payload: {payload}")
 
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
+        response = self._post(url, payload, headers)
 
-        if "error" in response.json():
-            raise Exception(response.json()["error"])
-        print(response.text)
-        if "result" not in response.json():
-            raise Exception(f"Unable to create subaccount {response.json()}")
-        return response.json()["result"]
+        if "error" in response:
+            raise Exception(response["error"])
+        print(response)
+        if "result" not in response:
+            raise Exception(f"Unable to create subaccount {response}")
+        return response["result"]
 
     def _encode_deposit_data(self, amount: int, contract_key: str):
         """Encode the deposit data"""
@@ -604,15 +949,15 @@ class BaseClient:
 
         print(payload)
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
+        response = self._post(url, payload, headers)
 
-        print(response.json())
+        print(response)
 
-        if "error" in response.json():
-            raise Exception(response.json()["error"])
-        if "result" not in response.json():
-            raise Exception(f"Unable to transfer collateral {response.json()}")
-        return response.json()["result"]
+        if "error" in response:
+            raise Exception(response["error"])
+        if "result" not in response:
+            raise Exception(f"Unable to transfer collateral {response}")
+        return response["result"]
 
     def encode_transfer(self, amount: int, to: str, asset_sub_id=0, signature_expiry=300):
         """
@@ -704,8 +1049,7 @@ class BaseClient:
         if currency:
             payload['currency'] = currency.name
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]
+        results = self._post(url, payload, headers)["result"]
         return results
 
     def set_mmp_config(
@@ -728,16 +1072,14 @@ class BaseClient:
             "mmp_delta_limit": mmp_delta_limit,
         }
         headers = self._create_signature_headers()
-        response = requests.post(url, json=payload, headers=headers)
-        results = response.json()["result"]
+        results = self._post(url, payload, headers)["result"]
         return results
 
     def send_rfq(self, rfq):
         """Send an RFQ."""
         url = f"{self.contracts['BASE_URL']}/private/send_rfq"
         headers = self._create_signature_headers()
-        response = requests.post(url, json=rfq, headers=headers)
-        results = response.json()["result"]
+        results = self._post(url, rfq, headers)["result"]
         return results
 
     def poll_rfqs(self):
@@ -761,15 +1103,14 @@ class BaseClient:
             "status": RfqStatus.OPEN.value,
         }
         response = requests.post(url, headers=headers, params=params)
-        results = response.json()["result"]
+        results = decode_response(response)["result"]
         return results
 
     def send_quote(self, quote):
         """Send a quote."""
         url = f"{self.contracts['BASE_URL']}/private/send_quote"
         headers = self._create_signature_headers()
-        response = requests.post(url, json=quote, headers=headers)
-        results = response.json()["result"]
+        results = self._post(url, quote, headers)["result"]
         return results
 
     #   pricedLegs[0].price = direction == 'buy' ? '160' : '180';
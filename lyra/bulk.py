@@ -0,0 +1,172 @@
+"""
+Bulk order submission, streaming orders from a file over a single ws connection.
+"""
+import csv
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from lyra.codec import dumps, loads
+from lyra.enums import OrderSide, TimeInForce, UnderlyingCurrency
+from lyra.utils import get_instrument_type
+from lyra.validation import check_orders
+
+# fields of an order echoed into its result, so results can be matched to the input.
+ECHOED_FIELDS = ['line', 'instrument_name', 'side', 'price', 'amount', 'label']
+
+RESULT_FIELDS = ECHOED_FIELDS + ['status', 'order_id', 'order_status', 'error']
+
+
+def read_orders(path) -> Iterator[dict]:
+    """
+    Stream orders from a csv file with a header row, or from a file of json lines.
+    Each order is a dict with `instrument_name`, `side`, `price` and `amount`, and optionally
+    `time_in_force` and `label`, tagged with the line it came from.
+    """
+    path = Path(path)
+    with open(path, newline='') as file:
+        if path.suffix == '.csv':
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                yield {**{k: v for k, v in row.items() if v not in (None, '')}, 'line': line}
+        else:
+            for line, row in enumerate(file, start=1):
+                if row.strip():
+                    yield {**loads(row), 'line': line}
+
+
+def check_order(order: dict, instrument: Optional[dict]) -> Optional[str]:
+    """Return why an order would be rejected by the exchange, or None if it looks valid."""
+    instruments = {order.get('instrument_name'): instrument} if instrument is not None else {}
+    return check_orders([order], instruments)[0]
+
+
+class BulkOrderSubmitter:
+    """
+    Checks orders against the cached instrument details, signs them on a thread pool and
+    pipelines them over the client ws, with at most `window` orders awaiting a response.
+    Results are yielded as responses arrive, so they are not in the order of the input.
+    """
+
+    def __init__(self, client, window: int = 32, max_workers: int = 4, dry_run: bool = False):
+        self.client = client
+        self.window = window
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.in_flight = {}
+
+    def _instrument(self, instrument_name: str) -> Optional[dict]:
+        try:
+            UnderlyingCurrency[instrument_name.split("-")[0]]
+            return self.client.get_instrument(instrument_name)
+        except (KeyError, IndexError):
+            return None
+
+    def _instruments(self, orders: List[dict]) -> Dict[str, dict]:
+        instruments = {}
+        for instrument_name in {order.get('instrument_name') or '' for order in orders}:
+            instrument = self._instrument(instrument_name)
+            if instrument is not None:
+                instruments[instrument_name] = instrument
+        return instruments
+
+    def _result(self, order: dict, **result) -> dict:
+        return {**{f: order.get(f) for f in ECHOED_FIELDS}, **result}
+
+    def sign(self, order: dict) -> dict:
+        """Define and sign an order, this is the expensive step which runs on the pool."""
+        instrument = self.client.instruments[order['instrument_name']]
+        defined = self.client._define_order(
+            instrument_name=order['instrument_name'],
+            price=str(order['price']),
+            amount=str(order['amount']),
+            side=OrderSide(order['side']),
+            time_in_force=TimeInForce(order.get('time_in_force', TimeInForce.GTC.value)),
+        )
+        if order.get('label'):
+            defined['label'] = order['label']
+        return self.client._sign_order(
+            defined,
+            instrument['base_asset_sub_id'],
+            get_instrument_type(order['instrument_name']),
+            UnderlyingCurrency[order['instrument_name'].split("-")[0]],
+        )
+
+    def _receive(self) -> dict:
+        message = self.client._recv_rpc()
+        order = self.in_flight.pop(message['id'], None)
+        if order is None:
+            return None
+        if 'error' in message:
+            error = message['error']
+            return self._result(
+                order, status='error', error=error.get('message', error) if isinstance(error, dict) else error
+            )
+        result = message['result']['order']
+        return self._result(order, status='ok', order_id=result['order_id'], order_status=result['order_status'])
+
+    def _send(self, order: dict, signed: dict) -> Iterator[dict]:
+        if self.dry_run:
+            yield self._result(order, status='signed')
+            return
+        while len(self.in_flight) >= self.window:
+            result = self._receive()
+            if result is not None:
+                yield result
+        self.in_flight[self.client._send_rpc('private/order', signed)] = order
+
+    def submit(self, orders: Iterable[dict]) -> Iterator[dict]:
+        """Submit the orders, yielding a result per order."""
+        if not self.dry_run:
+            self.client._ensure_login()
+        # resolved once up front, rather than lazily from the signing threads.
+        self.client.subaccount_id
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            orders = iter(orders)
+            for window in iter(lambda: list(itertools.islice(orders, self.window)), []):
+                # each window is checked in one pass before any of it is signed
+                for order, error in zip(window, check_orders(window, self._instruments(window))):
+                    if error:
+                        yield self._result(order, status='rejected', error=error)
+                        continue
+                    pending.append((order, executor.submit(self.sign, order)))
+                    # keep the pool busy without signing the whole file ahead of the connection.
+                    while len(pending) > self.window:
+                        order, future = pending.popleft()
+                        yield from self._send(order, future.result())
+            while pending:
+                order, future = pending.popleft()
+                yield from self._send(order, future.result())
+        while self.in_flight:
+            result = self._receive()
+            if result is not None:
+                yield result
+
+
+class ResultWriter:
+    """Writes one result per line, as csv or json lines depending on the suffix of the path."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, 'w', newline='')
+        self.writer = None
+        if self.path.suffix == '.csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, result: dict):
+        if self.writer:
+            self.writer.writerow(result)
+        else:
+            self.file.write(dumps(result) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
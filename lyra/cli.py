@@ -1,14 +1,15 @@
 """
 Cli module in order to allow interaction.
 """
+import functools
 import os
+import sys
+import time
 
-import pandas as pd
 import rich_click as click
 from dotenv import load_dotenv
 from rich import print
 
-from lyra.analyser import PortfolioAnalyser
 from lyra.enums import (
     CollateralAsset,
     Environment,
@@ -19,11 +20,23 @@ from lyra.enums import (
     SubaccountType,
     UnderlyingCurrency,
 )
-from lyra.lyra import LyraClient
+from lyra.output import FORMATS
 from lyra.utils import get_logger
 
 click.rich_click.USE_RICH_MARKUP = True
-pd.set_option('display.precision', 2)
+
+# heavy dependencies (pandas, web3 through the client) are imported by the commands that need them,
+# so that `lyra --help` and friends start quickly.
+
+
+def import_pandas():
+    """Import pandas, configured for printing."""
+    import pandas as pd
+
+    pd.set_option('display.precision', 2)
+    # we set to show 4 decimal places
+    pd.options.display.float_format = '{:,.4f}'.format
+    return pd
 
 
 def set_logger(ctx, level):
@@ -34,35 +47,80 @@ def set_logger(ctx, level):
     return ctx.logger
 
 
-def set_client(ctx):
-    """Set the client."""
+def get_client_kwargs(ctx):
+    """The client configuration, read from the env vars and the `.env` file of the working directory."""
     # we use dotenv to load the env vars from DIRECTORY where the cli tool is executed
     _path = os.getcwd()
     env_path = os.path.join(_path, ".env")
     load_dotenv(dotenv_path=env_path)
+    chain = os.environ.get("ENVIRONMENT")
+    if chain == Environment.PROD.value:
+        env = Environment.PROD
+    else:
+        env = Environment.TEST
+
+    subaccount_id = os.environ.get("SUBACCOUNT_ID", None)
+    if subaccount_id:
+        subaccount_id = int(subaccount_id)
+    return {
+        "private_key": os.environ.get("ETH_PRIVATE_KEY"),
+        "logger": ctx.logger,
+        "verbose": ctx.logger.level == "DEBUG",
+        "env": env,
+        "subaccount_id": subaccount_id,
+        "wallet": os.environ.get("WALLET"),
+        "rfq_module_address": os.environ.get("RFQ_MODULE_ADDRESS"),
+    }
+
+
+def set_client(ctx):
+    """Set the client."""
     if not hasattr(ctx, "client"):
-        auth = {
-            "private_key": os.environ.get("ETH_PRIVATE_KEY"),
-            "logger": ctx.logger,
-            "verbose": ctx.logger.level == "DEBUG",
-        }
-        chain = os.environ.get("ENVIRONMENT")
-        if chain == Environment.PROD.value:
-            env = Environment.PROD
-        else:
-            env = Environment.TEST
-
-        subaccount_id = os.environ.get("SUBACCOUNT_ID", None)
-        if subaccount_id:
-            subaccount_id = int(subaccount_id)
-        wallet = os.environ.get("WALLET")
-        ctx.client = LyraClient(**auth, env=env, subaccount_id=subaccount_id, wallet=wallet)
+        from lyra.lyra import LyraClient
+
+        ctx.client = LyraClient(**get_client_kwargs(ctx))
+        set_session(ctx, ctx.client)
 
     if ctx.logger.level == "DEBUG":
         print(f"Client created for environment `{ctx.client.env.value}`")
     return ctx.client
 
 
+def get_async_client(ctx):
+    """Create an async client for the streaming commands, sharing the configuration of the cli client."""
+    from lyra.async_client import AsyncClient
+
+    client = AsyncClient(**get_client_kwargs(ctx.find_root()))
+    set_session(ctx.find_root(), client)
+    return client
+
+
+def set_session(ctx, client):
+    """Seed the client from the session cache, and save what it discovers when the command finishes."""
+    ttl = ctx.obj.get("session_ttl")
+    if not ttl:
+        return None
+    from lyra.session import SessionCache
+
+    session = SessionCache(client.env, client.wallet, ttl=ttl)
+    restored = session.restore(client)
+    before = (client._subaccount_id, len(client.instruments))
+
+    def persist():
+        if not restored or before != (client._subaccount_id, len(client.instruments)):
+            session.persist(client)
+
+    ctx.call_on_close(persist)
+    return session
+
+
+def get_client(ctx):
+    """Get the client, creating it on first use so that commands which do not need one never pay for it."""
+    if "client" not in ctx.obj:
+        ctx.obj["client"] = set_client(ctx.find_root())
+    return ctx.obj["client"]
+
+
 @click.group("Lyra Client")
 @click.option(
     "--log-level",
@@ -71,12 +129,60 @@ def set_client(ctx):
     type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]),
     help="Logging level.",
 )
+@click.option(
+    "--session-ttl",
+    type=int,
+    default=0,
+    envvar="LYRA_SESSION_TTL",
+    help="Cache the subaccount and instrument details for this many seconds across calls, 0 disables the cache.",
+)
+@click.option(
+    "--format",
+    "-f",
+    "output_format",
+    default="table",
+    type=click.Choice(FORMATS),
+    help="Output format, anything but `table` streams records to stdout and moves diagnostics to stderr.",
+)
 @click.pass_context
-def cli(ctx, log_level):
+def cli(ctx, log_level, session_ttl, output_format):
     """Lyra v2 client command line interface."""
     ctx.ensure_object(dict)
+    ctx.obj["format"] = output_format
+    if output_format != "table":
+        set_output(ctx)
     ctx.obj["logger"] = set_logger(ctx, log_level)
-    ctx.obj["client"] = set_client(ctx)
+    ctx.obj["session_ttl"] = session_ttl
+
+
+def set_output(ctx):
+    """Keep stdout for the records, everything else printed while the command runs goes to stderr."""
+    ctx.obj["output"] = sys.stdout
+    sys.stdout = sys.stderr
+
+    def restore():
+        sys.stdout = ctx.obj["output"]
+
+    ctx.call_on_close(restore)
+
+
+def write_output(ctx, records):
+    """
+    Stream records to stdout in the selected machine readable format.
+    Returns False for the `table` format, which commands print themselves.
+    """
+    root = ctx.find_root()
+    if root.obj["format"] == "table":
+        return False
+    from lyra.output import write_records
+
+    write_records(records, root.obj["format"], root.obj["output"])
+    return True
+
+
+@cli.group("session")
+def session():
+    """Interact with the local session cache."""
 
 
 @cli.group("instruments")
@@ -99,6 +205,11 @@ def orders():
     """Interact with orders."""
 
 
+@cli.group("orderbook")
+def orderbook():
+    """Interact with order books."""
+
+
 @cli.group("collateral")
 def collateral():
     """Interact with collateral."""
@@ -114,6 +225,35 @@ def mmp():
     """Interact with market making parameters."""
 
 
+@session.command("show")
+@click.pass_context
+def show_session(ctx):
+    """Show the cached session."""
+    from lyra.session import SessionCache
+
+    client = get_client(ctx)
+    cache = SessionCache(client.env, client.wallet)
+    state = cache.load()
+    print(f"Session file: {cache.path}")
+    if not state:
+        print("No valid session")
+        return
+    print(f"Subaccount id: {state.get('subaccount_id')}")
+    print(f"Instruments: {len(state.get('instruments', {}))}")
+    print(f"Expires in: {state['expires_at'] - time.time():.0f}s")
+
+
+@session.command("clear")
+@click.pass_context
+def clear_session(ctx):
+    """Clear the cached session."""
+    from lyra.session import SessionCache
+
+    client = get_client(ctx)
+    SessionCache(client.env, client.wallet).clear()
+    print("Session cleared")
+
+
 @mmp.command("fetch")
 @click.option(
     "--underlying-currency",
@@ -130,7 +270,7 @@ def mmp():
 @click.pass_context
 def fetch_mmp(ctx, underlying_currency, subaccount_id):
     """Fetch market making parameters."""
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     mmp = client.get_mmp_config(subaccount_id=subaccount_id, currency=UnderlyingCurrency(underlying_currency))
     print(mmp)
 
@@ -186,7 +326,7 @@ def fetch_mmp(ctx, underlying_currency, subaccount_id):
 @click.pass_context
 def set_mmp(ctx, underlying_currency, subaccount_id, frozen_time, interval, amount_limit, delta_limit):
     """Set market making parameters."""
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     mmp = client.set_mmp_config(
         subaccount_id=subaccount_id,
         currency=UnderlyingCurrency(underlying_currency),
@@ -203,9 +343,10 @@ def set_mmp(ctx, underlying_currency, subaccount_id, frozen_time, interval, amou
 def fetch_positions(ctx):
     """Fetch positions."""
     print("Fetching positions")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     positions = client.get_positions()
-    print(positions)
+    if not write_output(ctx, positions):
+        print(positions)
 
 
 @collateral.command("fetch")
@@ -213,7 +354,7 @@ def fetch_positions(ctx):
 def fetch_collateral(ctx):
     """Fetch collateral."""
     print("Fetching collateral")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     collateral = client.get_collaterals()
     print(collateral)
 
@@ -234,11 +375,12 @@ def fetch_collateral(ctx):
 )
 def fetch_instruments(ctx, instrument_type, currency):
     """Fetch markets."""
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     markets = client.fetch_instruments(
         instrument_type=InstrumentType(instrument_type), currency=UnderlyingCurrency(currency)
     )
-    print(markets)
+    if not write_output(ctx, markets):
+        print(markets)
 
 
 @tickers.command("fetch")
@@ -249,11 +391,112 @@ def fetch_instruments(ctx, instrument_type, currency):
 )
 def fetch_tickers(ctx, instrument_name):
     """Fetch tickers."""
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     ticker = client.fetch_ticker(instrument_name=instrument_name)
     print(ticker)
 
 
+def stream_options(func):
+    """Options shared by the streaming commands."""
+    func = click.option(
+        "--duration",
+        type=float,
+        default=None,
+        help="Stop after this many seconds, by default runs until interrupted.",
+    )(func)
+    func = click.option(
+        "--jsonl",
+        is_flag=True,
+        default=False,
+        help="Write every update as a json line to stdout, the live view moves to stderr. Same as `--format jsonl`.",
+    )(func)
+    func = click.option(
+        "--record",
+        type=click.Path(file_okay=False),
+        default=None,
+        help="Record every update to compact binary files in this directory.",
+    )(func)
+    func = click.option(
+        "--refresh-rate",
+        type=float,
+        default=4.0,
+        help="Maximum number of times a second the live view is redrawn.",
+    )(func)
+    return click.argument("instrument_names", nargs=-1, required=True)(func)
+
+
+def run_stream(ctx, channels, updates, render, refresh_rate, jsonl, duration, record=None):
+    """Run a stream of channels, rendering a live view and optionally writing json lines or recording."""
+    import asyncio
+
+    from rich.console import Console
+
+    from lyra.recorder import MarketDataRecorder
+    from lyra.streaming import JsonlWriter, LiveRenderer, watch_channels
+
+    root = ctx.find_root()
+    if root.obj["format"] not in ("table", "jsonl"):
+        raise click.UsageError(f"Streams are written as jsonl, not {root.obj['format']}.")
+    jsonl = jsonl or root.obj["format"] == "jsonl"
+    client = get_async_client(ctx)
+    # the global format has already moved sys.stdout to stderr, updates go to the real stdout
+    writer = JsonlWriter(root.obj.get("output", sys.stdout)).start() if jsonl else None
+    recorder = MarketDataRecorder(record).start() if record else None
+    renderer = LiveRenderer(updates, render, refresh_rate=refresh_rate, console=Console(stderr=jsonl)).start()
+    handlers = [updates] + [handler for handler in (writer, recorder) if handler]
+    try:
+        asyncio.run(watch_channels(client, channels, handlers, duration=duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.stop()
+        if writer:
+            writer.close()
+        if recorder:
+            recorder.close()
+
+
+@tickers.command("watch")
+@click.pass_context
+@stream_options
+@click.option(
+    "--interval",
+    type=click.Choice(["100", "1000"]),
+    default="1000",
+    help="Milliseconds between ticker updates.",
+)
+def watch_tickers(ctx, instrument_names, refresh_rate, jsonl, record, duration, interval):
+    """Stream live tickers."""
+    from lyra.streaming import LatestUpdates, get_ticker_channel, render_tickers
+
+    channels = [get_ticker_channel(name, interval) for name in instrument_names]
+    run_stream(ctx, channels, LatestUpdates(), render_tickers, refresh_rate, jsonl, duration, record)
+
+
+@orderbook.command("watch")
+@click.pass_context
+@stream_options
+@click.option(
+    "--depth",
+    type=click.Choice(["1", "10", "20", "100"]),
+    default="10",
+    help="Number of levels per side in each update.",
+)
+@click.option(
+    "--levels",
+    type=int,
+    default=5,
+    help="Number of levels per side shown in the live view.",
+)
+def watch_order_book(ctx, instrument_names, refresh_rate, jsonl, record, duration, depth, levels):
+    """Stream live order books."""
+    from lyra.streaming import OrderBookUpdates, get_order_book_channel, render_order_books
+
+    channels = [get_order_book_channel(name, depth=depth) for name in instrument_names]
+    render = functools.partial(render_order_books, levels=levels)
+    run_stream(ctx, channels, OrderBookUpdates(), render, refresh_rate, jsonl, duration, record)
+
+
 @collateral.command("transfer")
 @click.pass_context
 @click.option(
@@ -277,7 +520,7 @@ def fetch_tickers(ctx, instrument_name):
 )
 def transfer_collateral(ctx, amount, to, asset):
     """Transfer collateral."""
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     result = client.transfer_collateral(amount=amount, to=to, asset=CollateralAsset(asset))
 
     print(result)
@@ -288,7 +531,7 @@ def transfer_collateral(ctx, amount, to, asset):
 def fetch_subaccounts(ctx):
     """Fetch subaccounts."""
     print("Fetching subaccounts")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     subaccounts = client.fetch_subaccounts()
     print(subaccounts)
 
@@ -316,8 +559,11 @@ def fetch_subaccount(ctx, subaccount_id, underlying_currency, columns):
     print("Fetching subaccount")
     print(f"Subaccount ID: {subaccount_id}")
     print(f"Underlying currency: {underlying_currency}")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     subaccount = client.fetch_subaccount(subaccount_id=subaccount_id)
+    import_pandas()
+    from lyra.analyser import PortfolioAnalyser
+
     analyser = PortfolioAnalyser(subaccount)
     print("Positions")
     analyser.print_positions(underlying_currency=underlying_currency, columns=columns)
@@ -327,6 +573,42 @@ def fetch_subaccount(ctx, subaccount_id, underlying_currency, columns):
     print(f"Portfolio Value: ${analyser.get_subaccount_value():.2f}")
 
 
+@subaccounts.command("portfolio")
+@click.argument(
+    "subaccount_ids",
+    type=int,
+    nargs=-1,
+)
+@click.option(
+    "--underlying-currency",
+    "-u",
+    type=click.Choice([f.value for f in UnderlyingCurrency]),
+    default=UnderlyingCurrency.ETH.value,
+)
+@click.option(
+    "--max-workers",
+    "-w",
+    type=int,
+    default=8,
+    help="Maximum number of subaccounts fetched concurrently.",
+)
+@click.pass_context
+def fetch_portfolio(ctx, subaccount_ids, underlying_currency, max_workers):
+    """Fetch several subaccounts, defaulting to all of them, as a single portfolio."""
+    client = get_client(ctx)
+    subaccounts = client.fetch_many_subaccounts(subaccount_ids=subaccount_ids or None, max_workers=max_workers)
+    print(f"Fetched {len(subaccounts)} subaccounts")
+    import_pandas()
+    from lyra.analyser import PortfolioAnalyser
+
+    analyser = PortfolioAnalyser.from_subaccounts(subaccounts.values())
+    print("Greeks by subaccount")
+    print(analyser.get_greeks_by_subaccount(underlying_currency))
+    print("Total Greeks")
+    print(analyser.get_total_greeks(underlying_currency))
+    print(f"Portfolio Value: ${analyser.get_subaccount_value():.2f}")
+
+
 @subaccounts.command("create")
 @click.pass_context
 @click.option(
@@ -359,7 +641,7 @@ def create_subaccount(ctx, collateral_asset, underlying_currency, subaccount_typ
     subaccount_type = SubaccountType(subaccount_type)
     collateral_asset = CollateralAsset(collateral_asset)
     print(f"Creating subaccount with collateral asset {collateral_asset} and underlying currency {underlying_currency}")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     subaccount_id = client.create_subaccount(
         amount=int(amount * 1e6),
         subaccount_type=subaccount_type,
@@ -384,10 +666,11 @@ def create_subaccount(ctx, collateral_asset, underlying_currency, subaccount_typ
     default=None,
 )
 @click.option(
-    "--page",
-    "-p",
+    "--max-orders",
+    "-m",
     type=int,
-    default=1,
+    default=None,
+    help="Stop after this many orders, the newest first. By default the whole history is fetched.",
 )
 @click.option(
     "--page-size",
@@ -407,56 +690,40 @@ def create_subaccount(ctx, collateral_asset, underlying_currency, subaccount_typ
     type=str,
     default=None,
 )
-def fetch_orders(ctx, instrument_name, label, page, page_size, status, regex):
-    """Fetch orders."""
+def fetch_orders(ctx, instrument_name, label, max_orders, page_size, status, regex):
+    """
+    Fetch orders and analyse the fills across the whole history.
+    With a machine readable format the orders themselves are streamed as each page arrives.
+    """
     print("Fetching orders")
-    client = ctx.obj["client"]
-    orders = client.fetch_orders(
+    client = get_client(ctx)
+    status = OrderStatus(status) if status else None
+    if ctx.find_root().obj["format"] != "table":
+        orders = client.iter_orders(
+            instrument_name=instrument_name, label=label, page_size=page_size, status=status, max_orders=max_orders
+        )
+        write_output(ctx, (o for o in orders if not regex or regex in o["instrument_name"]))
+        return
+    import_pandas()
+    from lyra.analyser import OrderAnalyser
+
+    analyser = OrderAnalyser.from_client(
+        client,
         instrument_name=instrument_name,
+        regex=regex,
         label=label,
-        page=page,
         page_size=page_size,
         status=status,
+        max_orders=max_orders,
     )
-    # apply the regex if exists to filter the orders
-    if regex:
-        orders = [o for o in orders if regex in o["instrument_name"]]
-    df = pd.DataFrame.from_records(orders)
-    print(orders[0])
-    instrument_names = df["instrument_name"].unique()
-    print(f"Found {len(instrument_names)} instruments")
-    print(instrument_names)
-    # print the orders
-    # perform some analysis
-    df['amount'] = pd.to_numeric(df['amount'])
-    df['filled_amount'] = pd.to_numeric(df['filled_amount'])
-    df['limit_price'] = pd.to_numeric(df['limit_price'])
-
-    buys = df[df['direction'] == 'buy']
-    sells = df[df['direction'] == 'sell']
-    print("Buys")
-    print(buys)
-    print("Sells")
-    print(sells)
-
-    print("Average buy cost")
-    # we determine by the average price of the buys by the amount
-    df['cost'] = buys['limit_price'] * buys['amount']
-    print(df['cost'].sum())
-    amount = buys['amount'].sum()
-    print(amount)
-    buy_total_cost = df['cost'].sum()
-    print(f"Price per unit: {buy_total_cost / amount}")
-    print(buy_total_cost / amount)
-    print("Average sell cost")
-    # we determine by the average price of the buys by the amount
-    df['cost'] = sells['limit_price'] * sells['amount']
-    print(df['cost'].sum())
-    amount = sells['amount'].sum()
-    print(amount)
-    sell_total_cost = df['cost'].sum()
-    print(f"Price per unit: {sell_total_cost / amount}")
-    print(sell_total_cost / amount)
+    print(f"Found {len(analyser.orders)} orders")
+    print("Per instrument and side")
+    print(analyser.get_aggregates())
+    print("Per side")
+    print(analyser.get_side_summary())
+    print("Per instrument")
+    print(analyser.get_instrument_summary())
+    print(f"Realised PnL: {analyser.get_realised_pnl():,.4f}")
 
 
 @orders.command("cancel")
@@ -474,7 +741,7 @@ def fetch_orders(ctx, instrument_name, label, page, page_size, status, regex):
 def cancel_order(ctx, order_id, instrument_name):
     """Cancel order."""
     print("Cancelling order")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     result = client.cancel(order_id=order_id, instrument_name=instrument_name)
     print(result)
 
@@ -484,11 +751,38 @@ def cancel_order(ctx, order_id, instrument_name):
 def cancel_all_orders(ctx):
     """Cancel all orders."""
     print("Cancelling all orders")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     result = client.cancel_all()
     print(result)
 
 
+@orders.command("kill_switch")
+@click.pass_context
+@click.option(
+    "--subaccount-id",
+    "subaccount_ids",
+    type=int,
+    multiple=True,
+    help="Subaccounts to cancel, repeat for several. Defaults to the configured subaccount.",
+)
+@click.option(
+    "--instrument-name",
+    "-i",
+    "instrument_names",
+    type=str,
+    multiple=True,
+    help="Only cancel orders of these instruments, each cancelled in parallel.",
+)
+def kill_switch(ctx, subaccount_ids, instrument_names):
+    """Cancel all orders as fast as possible, reporting when each cancel completed."""
+    client = get_client(ctx)
+    results = client.kill_switch(list(subaccount_ids), list(instrument_names))
+    if not write_output(ctx, results):
+        for result in results:
+            target = result["instrument_name"] or "all instruments"
+            print(f"{result['subaccount_id']} {target}: {result['status']} in {result['seconds'] * 1000:.1f}ms")
+
+
 @orders.command("create")
 @click.pass_context
 @click.option(
@@ -524,7 +818,7 @@ def cancel_all_orders(ctx):
 def create_order(ctx, instrument_name, side, price, amount, order_type):
     """Create order."""
     print("Creating order")
-    client = ctx.obj["client"]
+    client = get_client(ctx)
     result = client.create_order(
         instrument_name=instrument_name,
         side=OrderSide(side),
@@ -535,5 +829,53 @@ def create_order(ctx, instrument_name, side, price, amount, order_type):
     print(result)
 
 
+@orders.command("bulk")
+@click.pass_context
+@click.argument("orders_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--results",
+    "-r",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="File to write a result per order to, defaults to `<orders_file>.results` with the same suffix.",
+)
+@click.option(
+    "--window",
+    "-w",
+    type=int,
+    default=32,
+    help="Maximum number of orders awaiting a response.",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=4,
+    help="Number of threads signing orders.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Check and sign the orders without sending them.",
+)
+def bulk_orders(ctx, orders_file, results, window, max_workers, dry_run):
+    """Create orders from a csv or json lines file."""
+    from pathlib import Path
+
+    from lyra.bulk import BulkOrderSubmitter, ResultWriter, read_orders
+
+    path = Path(orders_file)
+    results = results or path.with_suffix(f".results{path.suffix}")
+    client = get_client(ctx)
+    submitter = BulkOrderSubmitter(client, window=window, max_workers=max_workers, dry_run=dry_run)
+    counts = {}
+    with ResultWriter(results) as writer:
+        for result in submitter.submit(read_orders(path)):
+            writer.write(result)
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+    print(counts)
+    print(f"Results written to {results}")
+
+
 if __name__ == "__main__":
     cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,67 @@
+"""
+JSON codec used for all websocket and REST traffic.
+
+orjson is used when it is installed, otherwise we fall back to the stdlib json module.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson decodes integers outside 64 bits as floats, payloads with runs of this many digits go to json instead
+WIDE_INT = 19
+_WIDE_INT_STR = re.compile(r'\d{%d}' % WIDE_INT)
+_WIDE_INT_BYTES = re.compile(rb'\d{%d}' % WIDE_INT)
+
+
+if orjson is not None:
+
+    def dumpb(obj) -> bytes:
+        """Encode an object to json bytes."""
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson refuses ints wider than 64 bits and some custom types.
+            return json.dumps(obj).encode()
+
+    def dumps(obj) -> str:
+        """Encode an object to a json string."""
+        return dumpb(obj).decode()
+
+    def loads(data):
+        """
+        Decode json from str, bytes, bytearray or memoryview.
+        Payloads that may hold integers wider than 64 bits are decoded by json, so they stay exact.
+        """
+        wide_int = _WIDE_INT_STR if isinstance(data, str) else _WIDE_INT_BYTES
+        if wide_int.search(data) is None:
+            return orjson.loads(data)
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+else:
+
+    def dumps(obj) -> str:
+        """Encode an object to a json string."""
+        return json.dumps(obj)
+
+    def dumpb(obj) -> bytes:
+        """Encode an object to json bytes."""
+        return json.dumps(obj).encode()
+
+    def loads(data):
+        """Decode json from str, bytes, bytearray or memoryview."""
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+def decode_response(response):
+    """Decode the body of a `requests` response without an intermediate str."""
+    return loads(response.content)
@@ -86,3 +86,6 @@ class RfqStatus(Enum):
     """RFQ statuses."""
 
     OPEN = "open"
+    FILLED = "filled"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"
@@ -0,0 +1,161 @@
+"""
+Incremental portfolio greeks, kept up to date from position and ticker updates.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from lyra.utils import DELTA_COLUMNS
+
+# perps have no option pricing, a unit of a perp is a unit of delta
+PERP_GREEKS = (1.0, 0.0, 0.0, 0.0)
+
+GroupKey = Tuple[str, Optional[str]]
+
+# the expiry of `get_totals` summing over every expiry, None is the bucket of perps
+ALL_EXPIRIES = 'all'
+
+
+def group_key(instrument_name: str) -> GroupKey:
+    """Return the (currency, expiry) bucket of an instrument, the expiry is None for perps."""
+    parts = instrument_name.split('-')
+    if len(parts) == 4:
+        return parts[0], parts[1]
+    return parts[0], None
+
+
+class GreeksEngine:
+    """
+    Keeps per-instrument greeks and net amounts in arrays and running totals per (currency, expiry).
+    Each position or ticker update costs O(changed rows), never a rebuild of the whole portfolio.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.instruments: Dict[str, int] = {}
+        self.instrument_groups = np.zeros(capacity, dtype=np.int64)
+        self.amounts = np.zeros(capacity)
+        self.greeks = np.zeros((capacity, len(DELTA_COLUMNS)))
+        self.groups: Dict[GroupKey, int] = {}
+        self.totals = np.zeros((0, len(DELTA_COLUMNS)))
+        self.positions: Dict[Tuple[Optional[int], str], float] = {}
+        self.callbacks: List[Callable[[GroupKey, Dict[str, float]], None]] = []
+
+    def on_change(self, callback: Callable[[GroupKey, Dict[str, float]], None]):
+        """Register a callback called with the (currency, expiry) key and its new totals when they change."""
+        self.callbacks.append(callback)
+        return callback
+
+    def _group(self, key: GroupKey) -> int:
+        if key not in self.groups:
+            self.groups[key] = len(self.groups)
+            self.totals = np.vstack([self.totals, np.zeros(len(DELTA_COLUMNS))])
+        return self.groups[key]
+
+    def _row(self, instrument_name: str) -> int:
+        row = self.instruments.get(instrument_name)
+        if row is not None:
+            return row
+        row = len(self.instruments)
+        if row == len(self.amounts):
+            self.instrument_groups = np.concatenate([self.instrument_groups, np.zeros(row, dtype=np.int64)])
+            self.amounts = np.concatenate([self.amounts, np.zeros(row)])
+            self.greeks = np.concatenate([self.greeks, np.zeros((row, len(DELTA_COLUMNS)))])
+        self.instruments[instrument_name] = row
+        self.instrument_groups[row] = self._group(group_key(instrument_name))
+        if instrument_name.endswith('PERP'):
+            self.greeks[row] = PERP_GREEKS
+        return row
+
+    def _set_position(self, instrument_name: str, amount: float, subaccount_id: Optional[int]) -> int:
+        row = self._row(instrument_name)
+        key = (subaccount_id, instrument_name)
+        change = amount - self.positions.get(key, 0.0)
+        if amount:
+            self.positions[key] = amount
+        else:
+            self.positions.pop(key, None)
+        self.amounts[row] += change
+        self.totals[self.instrument_groups[row]] += self.greeks[row] * change
+        return self.instrument_groups[row]
+
+    def _set_greeks(self, instrument_name: str, greeks) -> int:
+        row = self._row(instrument_name)
+        greeks = np.asarray(greeks, dtype=float)
+        self.totals[self.instrument_groups[row]] += (greeks - self.greeks[row]) * self.amounts[row]
+        self.greeks[row] = greeks
+        return self.instrument_groups[row]
+
+    def _notify(self, groups: Iterable[int]):
+        if not self.callbacks:
+            return
+        keys = list(self.groups)
+        for group in set(groups):
+            totals = dict(zip(DELTA_COLUMNS, self.totals[group].tolist()))
+            for callback in self.callbacks:
+                callback(keys[group], totals)
+
+    def apply_position(self, instrument_name: str, amount: float, subaccount_id: Optional[int] = None):
+        """Set the amount held of an instrument, optionally per subaccount."""
+        self._notify([self._set_position(instrument_name, float(amount), subaccount_id)])
+
+    def apply_positions(self, positions: Iterable[dict], subaccount_id: Optional[int] = None):
+        """
+        Apply a batch of positions as returned by `private/get_subaccount` or `private/get_positions`.
+        The per unit greeks of the payload are used until a ticker update replaces them.
+        """
+        changed = []
+        for position in positions:
+            instrument_name = position['instrument_name']
+            if 'delta' in position and not instrument_name.endswith('PERP'):
+                changed.append(self._set_greeks(instrument_name, [position[c] for c in DELTA_COLUMNS]))
+            _subaccount_id = position.get('subaccount_id', subaccount_id)
+            changed.append(self._set_position(instrument_name, float(position['amount']), _subaccount_id))
+        self._notify(changed)
+
+    def apply_greeks(self, instrument_name: str, delta: float, gamma: float, vega: float, theta: float):
+        """Set the per unit greeks of an instrument."""
+        self._notify([self._set_greeks(instrument_name, (delta, gamma, vega, theta))])
+
+    def apply_ticker(self, ticker: dict):
+        """Apply a ticker as returned by `public/get_ticker` or the ticker channel."""
+        ticker = ticker.get('instrument_ticker', ticker)
+        pricing = ticker.get('option_pricing')
+        if not pricing:
+            return
+        self._notify([self._set_greeks(ticker['instrument_name'], [pricing[c] for c in DELTA_COLUMNS])])
+
+    def apply_tickers(self, tickers: Iterable[dict]):
+        """Apply a batch of tickers, callbacks fire once per changed (currency, expiry)."""
+        changed = []
+        for ticker in tickers:
+            ticker = ticker.get('instrument_ticker', ticker)
+            pricing = ticker.get('option_pricing')
+            if pricing:
+                changed.append(self._set_greeks(ticker['instrument_name'], [pricing[c] for c in DELTA_COLUMNS]))
+        self._notify(changed)
+
+    def load_subaccount(self, subaccount: dict):
+        """Seed the engine from a `fetch_subaccount` payload."""
+        self.apply_positions(subaccount['positions'], subaccount_id=subaccount.get('subaccount_id'))
+
+    def get_totals(self, currency: str, expiry: Optional[str] = ALL_EXPIRIES) -> Dict[str, float]:
+        """
+        Return the greeks for a currency, summed over every expiry unless one is given.
+        Expiries are in the `YYYYMMDD` form used by instrument names, None selects the perps.
+        """
+        currency = currency.upper()
+        groups = [i for (c, e), i in self.groups.items() if c == currency and (expiry == ALL_EXPIRIES or e == expiry)]
+        totals = self.totals[groups].sum(axis=0) if groups else np.zeros(len(DELTA_COLUMNS))
+        return dict(zip(DELTA_COLUMNS, totals.tolist()))
+
+    def get_all_totals(self) -> Dict[GroupKey, Dict[str, float]]:
+        """Return the totals of every (currency, expiry) bucket."""
+        return {key: dict(zip(DELTA_COLUMNS, self.totals[i].tolist())) for key, i in self.groups.items()}
+
+    def recompute(self):
+        """Rebuild the running totals from the arrays, to bound floating point drift over long sessions."""
+        rows = len(self.instruments)
+        contributions = self.greeks[:rows] * self.amounts[:rows, None]
+        self.totals = np.zeros_like(self.totals)
+        np.add.at(self.totals, self.instrument_groups[:rows], contributions)
@@ -0,0 +1,234 @@
+"""
+Latency histograms and counters for the clients, with exporters for snapshots, prometheus and json.
+"""
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, Tuple
+
+from lyra.codec import dumps
+
+# upper bounds in seconds, from 50us to 10s, roughly three buckets per decade
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+RPC_LATENCY = "lyra_rpc_latency_seconds"
+REST_LATENCY = "lyra_rest_latency_seconds"
+STAGE_LATENCY = "lyra_stage_latency_seconds"
+QUOTE_LATENCY = "lyra_quote_latency_seconds"
+MESSAGES_RECEIVED = "lyra_messages_received_total"
+MESSAGES_DROPPED = "lyra_messages_dropped_total"
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Counts of observations per bucket, with the last count for those above the largest bound."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts)),
+        }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Timer:
+    """Times a block into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Histograms and counters keyed by name and labels, created on first use.
+    Updates are not locked, under threads a rare lost increment is traded for no contention.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.histograms: Dict[Key, Histogram] = {}
+        self.counters: Dict[Key, Counter] = {}
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets)
+        return self.histograms[key]
+
+    def counter(self, name: str, **labels) -> Counter:
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.counters:
+            self.counters[key] = Counter()
+        return self.counters[key]
+
+    def observe(self, name: str, value: float, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        self.counter(name, **labels).inc(amount)
+
+    def time(self, name: str = STAGE_LATENCY, **labels) -> Timer:
+        return Timer(self.histogram(name, **labels))
+
+    def stage(self, stage: str) -> Timer:
+        """Time a stage of a request, such as define, encode, sign or send."""
+        return self.time(STAGE_LATENCY, stage=stage)
+
+    def snapshot(self) -> dict:
+        """Every metric as plain data, in process."""
+        return snapshot(self)
+
+    def export(self, exporter: str = "snapshot"):
+        return EXPORTERS[exporter](self)
+
+
+class NullMetrics:
+    """The off switch, every call is a no op and nothing is recorded."""
+
+    enabled = False
+    histograms = {}
+    counters = {}
+    _timer = nullcontext()
+
+    def histogram(self, name: str, **labels):
+        return None
+
+    def counter(self, name: str, **labels):
+        return None
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        pass
+
+    def time(self, name: str = STAGE_LATENCY, **labels):
+        return self._timer
+
+    def stage(self, stage: str):
+        return self._timer
+
+    def snapshot(self) -> dict:
+        return {"histograms": [], "counters": []}
+
+    def export(self, exporter: str = "snapshot"):
+        return EXPORTERS[exporter](self)
+
+
+NULL_METRICS = NullMetrics()
+
+
+def snapshot(metrics) -> dict:
+    return {
+        "histograms": [
+            {"name": name, "labels": dict(labels), **histogram.snapshot()}
+            for (name, labels), histogram in metrics.histograms.items()
+        ],
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": counter.value}
+            for (name, labels), counter in metrics.counters.items()
+        ],
+    }
+
+
+def to_json(metrics) -> str:
+    return dumps(snapshot(metrics))
+
+
+def _labels(labels, **extra) -> str:
+    labels = [*labels, *extra.items()]
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def to_prometheus(metrics) -> str:
+    """The prometheus text exposition format."""
+    lines, typed = [], set()
+    for (name, labels), histogram in sorted(metrics.histograms.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    for (name, labels), counter in sorted(metrics.counters.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(labels)} {counter.value}")
+    return "\n".join(lines) + "\n"
+
+
+EXPORTERS = {"snapshot": snapshot, "json": to_json, "prometheus": to_prometheus}
+
+
+def register_exporter(name: str, exporter):
+    """Add an exporter, a callable taking the metrics, usable through `Metrics.export(name)`."""
+    EXPORTERS[name] = exporter
+    return exporter
@@ -0,0 +1,430 @@
+"""
+A local stand-in for the lyra exchange, so that tests and benchmarks run without a network.
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from aiohttp import WSMsgType, web
+
+from lyra.codec import dumps, loads
+from lyra.constants import CONTRACTS
+from lyra.enums import Environment
+from lyra.replay import METHOD_NOT_FOUND_ERROR, ORDER_NOT_FOUND_ERROR, ExchangeMethods, make_instrument
+
+RATE_LIMIT_ERROR = {"code": -32000, "message": "Rate limit exceeded"}
+NOT_AUTHENTICATED_ERROR = {"code": 14000, "message": "Not authenticated"}
+
+DEFAULT_INSTRUMENTS = [
+    make_instrument("ETH-PERP", mark_price="2000"),
+    make_instrument("BTC-PERP", mark_price="40000"),
+    make_instrument("ETH-20240329-2400-C", base_asset_sub_id="39614082287924319838483674368", mark_price="50"),
+]
+
+
+class RateLimiter:
+    """A token bucket allowing `rate` requests a second, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Connection:
+    """The state of a single ws connection."""
+
+    def __init__(self, ws: web.WebSocketResponse, rate_limiter: Optional[RateLimiter]):
+        self.ws = ws
+        self.rate_limiter = rate_limiter
+        self.wallet = None
+        self.channels = set()
+
+    async def send(self, message: dict):
+        if not self.ws.closed:
+            await self.ws.send_str(dumps(message))
+
+
+class MockExchange(ExchangeMethods):
+    """
+    Serves the json rpc ws methods and the REST endpoints used by the clients from memory.
+
+    `latency` delays every response by that many seconds, without holding up other requests.
+    `rate_limit` caps the requests a second per ws connection and for REST overall.
+    Order book and ticker channels publish every `feed_interval` seconds, from `books` when given,
+    otherwise from a book around the mark price of the instrument.
+    """
+
+    def __init__(
+        self,
+        instruments: Optional[List[dict]] = None,
+        subaccount_ids: List[int] = (5,),
+        latency: float = 0.0,
+        rate_limit: Optional[float] = None,
+        feed_interval: float = 0.05,
+        books: Optional[Dict[str, dict]] = None,
+        host: str = "127.0.0.1",
+        rfq_ttl: int = 5000,
+    ):
+        self.instruments = {i["instrument_name"]: i for i in instruments or DEFAULT_INSTRUMENTS}
+        self.subaccount_ids = list(subaccount_ids)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rest_rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.feed_interval = feed_interval
+        self.books = books or {}
+        self.host = host
+        self.port = None
+        self.orders: Dict[str, dict] = {}
+        self.rfqs: Dict[str, dict] = {}
+        self.quotes: List[dict] = []
+        self.rfq_ttl = rfq_ttl
+        self.requests: List[dict] = []
+        self.connections: List[Connection] = []
+        self.publish_ids = itertools.count(1)
+        self.loop = None
+        self.thread = None
+        self.runner = None
+        self.methods = {
+            "public/login": self.login,
+            "public/get_ticker": self.get_ticker,
+            "public/get_instruments": self.get_instruments,
+            "public/create_account": lambda params, connection: {"status": "ok"},
+            "private/order": self.order,
+            "private/cancel": self.cancel,
+            "private/cancel_all": self.cancel_all,
+            "private/cancel_by_instrument": self.cancel_all,
+            "private/replace": self.replace,
+            "private/get_orders": self.get_orders,
+            "private/get_subaccounts": self.get_subaccounts,
+            "private/get_subaccount": self.get_subaccount,
+            "private/get_positions": lambda params, connection: {"positions": []},
+            "private/get_collaterals": lambda params, connection: {"collaterals": [self.collateral()]},
+            "private/send_rfq": self.send_rfq,
+            "private/cancel_rfq": self.cancel_rfq,
+            "private/poll_rfqs": self.poll_rfqs,
+            "private/send_quote": self.send_quote,
+            "subscribe": self.subscribe,
+            "unsubscribe": self.unsubscribe,
+        }
+        # methods which need a logged in ws, REST requests are signed per request instead.
+        self.private_ws_methods = {
+            "private/order",
+            "private/cancel",
+            "private/cancel_all",
+            "private/cancel_by_instrument",
+            "private/replace",
+            "private/send_quote",
+        }
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ws_address(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws"
+
+    def contracts(self, env: Environment = Environment.TEST) -> dict:
+        """The contracts of an environment, pointing at this exchange."""
+        return {**CONTRACTS[env], "BASE_URL": self.base_url, "WS_ADDRESS": self.ws_address}
+
+    def connect(self, client):
+        """Point a client at this exchange."""
+        client.contracts = self.contracts(client.env)
+        return client
+
+    def start(self) -> "MockExchange":
+        """Serve from a background thread with its own event loop."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_post("/{kind}/{name}", self.handle_rest)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, 0)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        self.feed = asyncio.create_task(self.publish_feeds())
+
+    def stop(self):
+        async def _stop():
+            self.feed.cancel()
+            for connection in self.connections:
+                await connection.ws.close()
+            await self.runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(_stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    async def handle_rest(self, request: web.Request) -> web.Response:
+        method = f"{request.match_info['kind']}/{request.match_info['name']}"
+        params = loads(await request.read()) if request.can_read_body else {}
+        if self.rest_rate_limiter and not self.rest_rate_limiter.allow():
+            return web.Response(body=dumps({"error": RATE_LIMIT_ERROR}), status=429, content_type="application/json")
+        response = await self.respond(method, params, None)
+        return web.Response(body=dumps(response), content_type="application/json")
+
+    async def handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        connection = Connection(ws, RateLimiter(self.rate_limit) if self.rate_limit else None)
+        self.connections.append(connection)
+        pending = set()
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                request = loads(message.data)
+                # responses are sent from tasks, so a slow response never holds up the next request.
+                task = asyncio.create_task(self.handle_ws_request(request, connection))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            self.connections.remove(connection)
+        return ws
+
+    async def handle_ws_request(self, request: dict, connection: Connection):
+        if connection.rate_limiter and not connection.rate_limiter.allow():
+            response = {"error": RATE_LIMIT_ERROR}
+        elif request["method"] in self.private_ws_methods and connection.wallet is None:
+            response = {"error": NOT_AUTHENTICATED_ERROR}
+        else:
+            response = await self.respond(request["method"], request.get("params", {}), connection)
+        await connection.send({**response, "id": request["id"]})
+
+    async def respond(self, method: str, params: dict, connection: Optional[Connection]) -> dict:
+        self.requests.append({"method": method, "params": params})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method not in self.methods:
+            return {"error": METHOD_NOT_FOUND_ERROR}
+        result = self.methods[method](params, connection)
+        if asyncio.iscoroutine(result):
+            result = await result
+        if isinstance(result, dict) and set(result) == {"error"}:
+            return result
+        return {"result": result}
+
+    def login(self, params, connection):
+        connection.wallet = params["wallet"]
+        return self.subaccount_ids
+
+    def get_book(self, instrument_name: str) -> dict:
+        if instrument_name in self.books:
+            return self.books[instrument_name]
+        mark = float(self.instruments[instrument_name].get("mark_price", 100))
+        return {
+            "bids": [[f"{mark * (1 - 0.001 * i):.2f}", "1"] for i in range(1, 11)],
+            "asks": [[f"{mark * (1 + 0.001 * i):.2f}", "1"] for i in range(1, 11)],
+        }
+
+    def get_ticker(self, params, connection=None):
+        instrument_name = params["instrument_name"]
+        if instrument_name not in self.instruments:
+            return {"error": {"code": -32602, "message": f"Unknown instrument {instrument_name}"}}
+        book = self.get_book(instrument_name)
+        mark = self.instruments[instrument_name].get("mark_price", "100")
+        return {
+            **self.instruments[instrument_name],
+            "best_bid_price": book["bids"][0][0],
+            "best_bid_amount": book["bids"][0][1],
+            "best_ask_price": book["asks"][0][0],
+            "best_ask_amount": book["asks"][0][1],
+            "mark_price": mark,
+            "index_price": mark,
+            "timestamp": int(time.time() * 1000),
+        }
+
+    def collateral(self) -> dict:
+        return {"asset_name": "USDC", "asset_type": "erc20", "amount": "100000", "mark_price": "1"}
+
+    def get_subaccounts(self, params, connection):
+        return {"subaccount_ids": self.subaccount_ids, "wallet": params.get("wallet")}
+
+    def get_subaccount(self, params, connection):
+        return {
+            "subaccount_id": params["subaccount_id"],
+            "subaccount_value": "100000",
+            "collaterals": [self.collateral()],
+            "positions": [],
+            "open_orders": [o for o in self.orders.values() if o["order_status"] == "open"],
+        }
+
+    async def order(self, params, connection):
+        now = int(time.time() * 1000)
+        order = {
+            **{k: v for k, v in params.items() if k != "signature"},
+            "order_id": str(uuid.uuid4()),
+            "order_status": "open",
+            "filled_amount": "0",
+            "average_price": "0",
+            "order_fee": "0",
+            "creation_timestamp": now,
+            "last_update_timestamp": now,
+            "label": params.get("label", ""),
+        }
+        self.orders[order["order_id"]] = order
+        await self.publish(f"{order['subaccount_id']}.orders", [order])
+        return {"order": order, "trades": []}
+
+    async def cancel(self, params, connection):
+        order = self.orders.get(params.get("order_id"))
+        if order is None or order["order_status"] != "open":
+            return {"error": ORDER_NOT_FOUND_ERROR}
+        order.update(order_status="cancelled", last_update_timestamp=int(time.time() * 1000))
+        await self.publish(f"{order['subaccount_id']}.orders", [order])
+        return order
+
+    def open_orders(self, subaccount_id: int, instrument_name: Optional[str] = None) -> List[dict]:
+        return [
+            order
+            for order in self.orders.values()
+            if order["order_status"] == "open"
+            and order["subaccount_id"] == subaccount_id
+            and instrument_name in (None, order["instrument_name"])
+        ]
+
+    def get_orders(self, params, connection):
+        orders = [
+            o
+            for o in sorted(self.orders.values(), key=lambda o: o["creation_timestamp"], reverse=True)
+            if o["subaccount_id"] == params.get("subaccount_id", o["subaccount_id"])
+            and o["instrument_name"] == (params.get("instrument_name") or o["instrument_name"])
+            and o["label"] == (params.get("label") or o["label"])
+            and o["order_status"] == (params.get("status") or o["order_status"])
+        ]
+        page, page_size = int(params.get("page", 1)), int(params.get("page_size", 100))
+        num_pages = max(1, -(-len(orders) // page_size))
+        return {
+            "subaccount_id": params.get("subaccount_id"),
+            "orders": orders[(page - 1) * page_size :][:page_size],  # noqa: E203
+            "pagination": {"num_pages": num_pages, "count": len(orders)},
+        }
+
+    async def send_rfq(self, params, connection):
+        """Open an RFQ, valid for `rfq_ttl` ms, and publish it to every wallet listening for RFQs."""
+        now = int(time.time() * 1000)
+        rfq = {
+            "rfq_id": str(uuid.uuid4()),
+            "subaccount_id": params["subaccount_id"],
+            "status": "open",
+            "cancel_reason": "",
+            "legs": params["legs"],
+            "creation_timestamp": now,
+            "last_update_timestamp": now,
+            "valid_until": now + self.rfq_ttl,
+        }
+        self.rfqs[rfq["rfq_id"]] = rfq
+        await self.publish_rfq(rfq)
+        return rfq
+
+    async def cancel_rfq(self, params, connection):
+        rfq = self.rfqs.get(params.get("rfq_id"))
+        if rfq is None or rfq["status"] != "open":
+            return {"error": ORDER_NOT_FOUND_ERROR}
+        rfq.update(status="cancelled", cancel_reason="user_request", last_update_timestamp=int(time.time() * 1000))
+        await self.publish_rfq(rfq)
+        return "ok"
+
+    def send_quote(self, params, connection):
+        rfq = self.rfqs.get(params.get("rfq_id"))
+        if rfq is None or rfq["status"] != "open":
+            return {"error": ORDER_NOT_FOUND_ERROR}
+        now = int(time.time() * 1000)
+        quote = {
+            **{k: v for k, v in params.items() if k != "signature"},
+            "quote_id": str(uuid.uuid4()),
+            "status": "open",
+            "creation_timestamp": now,
+            "last_update_timestamp": now,
+        }
+        self.quotes.append(quote)
+        return quote
+
+    def poll_rfqs(self, params, connection):
+        now = int(time.time() * 1000)
+        return {"rfqs": [r for r in self.rfqs.values() if r["status"] == "open" and r["valid_until"] > now]}
+
+    async def publish_rfq(self, rfq: dict):
+        for connection in list(self.connections):
+            channel = f"{connection.wallet}.rfqs"
+            if channel in connection.channels:
+                await connection.send({"method": "subscription", "params": {"channel": channel, "data": [rfq]}})
+
+    def subscribe(self, params, connection):
+        connection.channels.update(params["channels"])
+        return {
+            "status": {channel: "ok" for channel in params["channels"]},
+            "current_subscriptions": sorted(connection.channels),
+        }
+
+    def unsubscribe(self, params, connection):
+        connection.channels.difference_update(params["channels"])
+        return {
+            "status": {channel: "ok" for channel in params["channels"]},
+            "remaining_subscriptions": sorted(connection.channels),
+        }
+
+    async def publish(self, channel: str, data):
+        for connection in list(self.connections):
+            if channel in connection.channels:
+                await connection.send({"method": "subscription", "params": {"channel": channel, "data": data}})
+
+    def feed_update(self, channel: str):
+        """The update published on an order book or ticker channel, None for other channels."""
+        kind, instrument_name = channel.split(".")[:2]
+        if instrument_name not in self.instruments:
+            return None
+        timestamp = int(time.time() * 1000)
+        if kind == "orderbook":
+            depth = int(channel.split(".")[3])
+            book = self.get_book(instrument_name)
+            return {
+                "instrument_name": instrument_name,
+                "publish_id": next(self.publish_ids),
+                "timestamp": timestamp,
+                "bids": book["bids"][:depth],
+                "asks": book["asks"][:depth],
+            }
+        if kind == "ticker":
+            return {"timestamp": timestamp, "instrument_ticker": self.get_ticker({"instrument_name": instrument_name})}
+        return None
+
+    async def publish_feeds(self):
+        while True:
+            await asyncio.sleep(self.feed_interval)
+            channels = {c for connection in self.connections for c in connection.channels}
+            for channel in channels:
+                if channel.startswith(("orderbook.", "ticker.")):
+                    data = self.feed_update(channel)
+                    if data is not None:
+                        await self.publish(channel, data)
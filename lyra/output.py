@@ -0,0 +1,119 @@
+"""
+Record writers for machine readable cli output, which stream records instead of building a DataFrame.
+"""
+import csv
+import sys
+from typing import Iterable, List, Optional
+
+from lyra.codec import dumps
+
+# the formats of the cli, `table` is printed by each command, the others stream records
+FORMATS = ['table', 'jsonl', 'csv', 'parquet']
+
+
+class JsonlRecordWriter:
+    """One json object per line."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, record: dict):
+        self.stream.write(dumps(record) + "\n")
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class CsvRecordWriter:
+    """
+    Csv with a header taken from the first record, or from `columns` when given.
+    Nested values are written as json.
+    """
+
+    def __init__(self, stream=None, columns: Optional[List[str]] = None):
+        self.stream = stream or sys.stdout
+        self.columns = columns
+        self.writer = None
+
+    def write(self, record: dict):
+        if self.writer is None:
+            self.columns = self.columns or list(record)
+            self.writer = csv.DictWriter(self.stream, fieldnames=self.columns, extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow({k: dumps(v) if isinstance(v, (dict, list)) else v for k, v in record.items()})
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class ParquetRecordWriter:
+    """
+    Parquet written as a row group per `batch_size` records, so memory stays bounded.
+    The schema is inferred from the first batch. Needs the optional `pyarrow` dependency.
+    """
+
+    def __init__(self, stream=None, batch_size: int = 10_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as error:
+            raise Exception("Writing parquet needs pyarrow, install it with `pip install pyarrow`") from error
+        self.pa, self.pq = pa, pq
+        stream = stream or sys.stdout
+        self.sink = pa.PythonFile(getattr(stream, 'buffer', stream), mode='w')
+        self.batch_size = batch_size
+        self.batch = []
+        self.writer = None
+
+    def write(self, record: dict):
+        self.batch.append({k: dumps(v) if isinstance(v, (dict, list)) else v for k, v in record.items()})
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        schema = self.writer.schema if self.writer else None
+        table = self.pa.Table.from_pylist(self.batch, schema=schema)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.sink, table.schema)
+        self.writer.write_table(table)
+        self.batch = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+        self.sink.flush()
+
+
+WRITERS = {'jsonl': JsonlRecordWriter, 'csv': CsvRecordWriter, 'parquet': ParquetRecordWriter}
+
+
+def get_writer(output_format: str, stream=None):
+    if output_format not in WRITERS:
+        raise Exception(f"Unsupported output format {output_format}, expected one of {list(WRITERS)}")
+    return WRITERS[output_format](stream)
+
+
+def write_records(records: Iterable[dict], output_format: str, stream=None, flush_every: int = 100) -> int:
+    """
+    Write records as they are produced, flushing every `flush_every` records so that
+    downstream tools see output while a long result is still being fetched.
+    """
+    writer = get_writer(output_format, stream)
+    count = 0
+    try:
+        for count, record in enumerate(records, start=1):
+            writer.write(record)
+            if count % flush_every == 0:
+                writer.flush()
+    finally:
+        writer.close()
+    return count
@@ -0,0 +1,62 @@
+"""
+Vectorised Black-76 pricing for options on the lyra dex.
+"""
+
+import numpy as np
+
+# Abramowitz & Stegun 7.1.26, absolute error below 1.5e-7, which keeps us free of a scipy dependency.
+_ERF_P = 0.3275911
+_ERF_A = (0.254829592, -0.284496736, 1.421413741, -1.453152027, 1.061405429)
+
+MIN_TIME = 1e-9
+MIN_VOL = 1e-6
+
+
+def norm_cdf(x):
+    """Standard normal cumulative distribution function."""
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + _ERF_P * z)
+    a1, a2, a3, a4, a5 = _ERF_A
+    erf = 1.0 - ((((a5 * t + a4) * t + a3) * t + a2) * t + a1) * t * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def norm_pdf(x):
+    """Standard normal probability density function."""
+    return np.exp(-0.5 * x * x) / np.sqrt(2.0 * np.pi)
+
+
+def _d1_d2(forward, strike, time, vol):
+    time = np.maximum(time, MIN_TIME)
+    vol = np.maximum(vol, MIN_VOL)
+    std = vol * np.sqrt(time)
+    d1 = (np.log(forward / strike) + 0.5 * std * std) / std
+    return d1, d1 - std
+
+
+def black76_price(forward, strike, time, vol, is_call, rate=0.0):
+    """
+    Price calls and puts on a forward, all arguments broadcast against each other.
+    `time` is in years and `vol` is annualised.
+    """
+    d1, d2 = _d1_d2(forward, strike, time, vol)
+    discount = np.exp(-rate * np.maximum(time, 0.0))
+    call = discount * (forward * norm_cdf(d1) - strike * norm_cdf(d2))
+    put = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+    return np.where(is_call, call, put)
+
+
+def black76_vega(forward, strike, time, vol, rate=0.0):
+    """Sensitivity of the price to an absolute change in vol."""
+    d1, _ = _d1_d2(forward, strike, time, vol)
+    return np.exp(-rate * np.maximum(time, 0.0)) * forward * norm_pdf(d1) * np.sqrt(np.maximum(time, MIN_TIME))
+
+
+def implied_vol(price, forward, strike, time, is_call, rate=0.0, initial_vol=0.5, iterations=20):
+    """Solve for the vol matching `price` with a vectorised, clamped Newton iteration."""
+    vol = np.full(np.broadcast(price, forward, strike, time, is_call).shape, initial_vol, dtype=float)
+    for _ in range(iterations):
+        diff = black76_price(forward, strike, time, vol, is_call, rate) - price
+        vega = black76_vega(forward, strike, time, vol, rate)
+        vol = np.clip(vol - diff / np.maximum(vega, 1e-8), MIN_VOL, 10.0)
+    return vol
@@ -0,0 +1,314 @@
+"""
+Market data recorder, appending order book and ticker updates to fixed-width binary logs.
+"""
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# a record per order book level, or per price of a ticker
+RECORD_DTYPE = np.dtype(
+    [
+        ('timestamp', '<i8'),
+        ('publish_id', '<i8'),
+        ('price', '<f8'),
+        ('amount', '<f8'),
+        ('instrument', '<u4'),
+        ('kind', 'u1'),
+        ('side', 'u1'),
+        ('level', '<u2'),
+    ]
+)
+
+ORDERBOOK = 0
+TICKER = 1
+
+BID = 0
+ASK = 1
+# ticker prices without an amount
+MARK = 2
+INDEX = 3
+
+FILE_PATTERN = "market-data-*.bin"
+
+# the group, depth and interval of channels are not recorded, rebuilt updates use the defaults
+ORDERBOOK_CHANNEL = "orderbook.{}.1.10"
+TICKER_CHANNEL = "ticker.{}.1000"
+
+
+def to_records(channel: str, data: dict, instrument: int) -> np.ndarray:
+    """Convert an order book or ticker channel update into records, an empty array for other channels."""
+    kind = channel.split('.')[0]
+    if kind == 'orderbook':
+        bids, asks = data.get('bids') or [], data.get('asks') or []
+        records = np.zeros(len(bids) + len(asks), dtype=RECORD_DTYPE)
+        if len(records):
+            levels = np.array(bids + asks, dtype=float).reshape(-1, 2)
+            records['price'], records['amount'] = levels[:, 0], levels[:, 1]
+            records['side'] = [BID] * len(bids) + [ASK] * len(asks)
+            records['level'] = [*range(len(bids)), *range(len(asks))]
+        records['kind'] = ORDERBOOK
+        records['publish_id'] = data.get('publish_id', 0)
+    elif kind == 'ticker':
+        ticker = data.get('instrument_ticker', data)
+        prices = [
+            (BID, ticker.get('best_bid_price'), ticker.get('best_bid_amount')),
+            (ASK, ticker.get('best_ask_price'), ticker.get('best_ask_amount')),
+            (MARK, ticker.get('mark_price'), 0),
+            (INDEX, ticker.get('index_price'), 0),
+        ]
+        prices = [p for p in prices if p[1] is not None]
+        records = np.zeros(len(prices), dtype=RECORD_DTYPE)
+        if prices:
+            records['side'] = [p[0] for p in prices]
+            records['price'] = [float(p[1]) for p in prices]
+            records['amount'] = [float(p[2] or 0) for p in prices]
+        records['kind'] = TICKER
+    else:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    records['timestamp'] = data.get('timestamp', 0)
+    records['instrument'] = instrument
+    return records
+
+
+class MarketDataRecorder:
+    """
+    Records channel updates to `directory`. Used as a channel handler it only enqueues,
+    converting and writing happen on a background thread. Files rotate once they reach
+    `max_file_bytes` or are `max_file_seconds` old, each with a json sidecar naming its instruments.
+    The sidecar is written when a file is opened and again whenever an instrument is added,
+    so files being recorded, or left behind by a crash, can be read.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_file_bytes: int = 256 * 1024 * 1024,
+        max_file_seconds: float = 3600,
+        flush_interval: float = 1.0,
+    ):
+        self.directory = Path(directory)
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.file = None
+        self.path = None
+        self.opened_at = 0.0
+        self.instruments: Dict[str, int] = {}
+        self.files: List[Path] = []
+        self.records = 0
+
+    def __call__(self, channel: str, data: dict):
+        self.queue.put((channel, data))
+
+    def start(self) -> "MarketDataRecorder":
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.thread.start()
+        return self
+
+    async def record(self, client, channels: Iterable[str]):
+        """Subscribe the recorder to channels of an `AsyncClient`."""
+        await client.subscribe_channels(channels, self)
+
+    def close(self):
+        """Write out everything queued and close the current file."""
+        self.queue.put(None)
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _instrument(self, channel: str) -> int:
+        name = channel.split('.')[1]
+        if name not in self.instruments:
+            self.instruments[name] = len(self.instruments)
+            self._write_sidecar()
+        return self.instruments[name]
+
+    def _write_sidecar(self):
+        if self.path is None:
+            return
+        # replaced in one step, so a reader never sees it half written
+        sidecar = self.path.with_suffix('.json')
+        partial = sidecar.with_suffix('.json.tmp')
+        partial.write_text(json.dumps({'dtype': RECORD_DTYPE.descr, 'instruments': self.instruments}))
+        partial.replace(sidecar)
+
+    def _rotate(self):
+        self._close_file()
+        self.path = self.directory / f"market-data-{time.time_ns()}.bin"
+        self.file = open(self.path, 'ab')
+        self.opened_at = time.monotonic()
+        self.files.append(self.path)
+        self._write_sidecar()
+
+    def _close_file(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+
+    def _write(self, batch: List[np.ndarray]):
+        if not batch:
+            return
+        data = np.concatenate(batch).tobytes()
+        too_old = time.monotonic() - self.opened_at >= self.max_file_seconds
+        if self.file is None or too_old or self.file.tell() + len(data) > self.max_file_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.records += len(data) // RECORD_DTYPE.itemsize
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while time.monotonic() < deadline:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                channel, data = item
+                records = to_records(channel, data, self._instrument(channel))
+                if len(records):
+                    batch.append(records)
+            self._write(batch)
+            if self.file is not None:
+                self.file.flush()
+        self._close_file()
+
+
+class MarketDataReader:
+    """
+    Memory maps recorded files, for random access to the records of an instrument over a time range.
+    Instrument ids are per file, the sidecars map them back to names. Files without a sidecar are skipped,
+    and a file still being recorded is read up to its last complete record.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.files = sorted(p for p in self.directory.glob(FILE_PATTERN) if p.with_suffix('.json').exists())
+        self._maps = {}
+
+    def _load(self, path: Path):
+        if path not in self._maps:
+            instruments = json.loads(path.with_suffix('.json').read_text())['instruments']
+            count = path.stat().st_size // RECORD_DTYPE.itemsize
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,)) if count else None
+            # records are appended in arrival order, so timestamps of different channels may interleave
+            is_sorted = records is not None and bool(np.all(np.diff(records['timestamp']) >= 0))
+            self._maps[path] = (records, instruments, is_sorted)
+        return self._maps[path]
+
+    @property
+    def instruments(self) -> List[str]:
+        return sorted({name for path in self.files for name in self._load(path)[1]})
+
+    def read(
+        self,
+        instrument_name: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        kind: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Return the records of an instrument, or all of them, with `start <= timestamp < end` (ms).
+        The time range of a file whose records arrived in time order is found by binary search,
+        otherwise every record of the file is filtered.
+        """
+        parts = []
+        for path in self.files:
+            records, instruments, is_sorted = self._load(path)
+            if records is None or (instrument_name is not None and instrument_name not in instruments):
+                continue
+            timestamps = records['timestamp']
+            mask = np.ones(len(records), dtype=bool)
+            if is_sorted:
+                first = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+                last = len(records) if end is None else np.searchsorted(timestamps, end, side='left')
+                if first >= last:
+                    continue
+                records, mask = records[first:last], mask[first:last]
+            else:
+                if start is not None:
+                    mask &= timestamps >= start
+                if end is not None:
+                    mask &= timestamps < end
+            if instrument_name is not None:
+                mask &= records['instrument'] == instruments[instrument_name]
+            if kind is not None:
+                mask &= records['kind'] == kind
+            parts.append(records[mask])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def book_at(self, instrument_name: str, timestamp: int) -> dict:
+        """
+        The order book of an instrument as of a time, from the last update of each side,
+        since an update may leave one side out.
+        """
+        records = self.read(instrument_name, end=timestamp + 1, kind=ORDERBOOK)
+        book = {'timestamp': None, 'bids': [], 'asks': []}
+        for side, key in [(BID, 'bids'), (ASK, 'asks')]:
+            levels = records[records['side'] == side]
+            if not len(levels):
+                continue
+            last = levels[levels['publish_id'] == levels['publish_id'][-1]]
+            last = last[np.argsort(last['level'], kind='stable')]
+            book[key] = list(zip(last['price'].tolist(), last['amount'].tolist()))
+            book['timestamp'] = max(book['timestamp'] or 0, int(last['timestamp'][-1]))
+        return book
+
+    def updates(
+        self,
+        instrument_names: Optional[Iterable[str]] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> Iterator[Tuple[str, dict]]:
+        """Rebuild the recorded channel updates in time order, as `(channel, data)` pairs."""
+        names = list(instrument_names or self.instruments)
+        parts = [self.read(name, start, end) for name in names]
+        records = np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+        if not len(records):
+            return
+        owners = np.repeat(np.arange(len(names)), [len(part) for part in parts])
+        order = np.argsort(records['timestamp'], kind='stable')
+        records, owners = records[order], owners[order]
+        keys = np.stack([owners, records['kind'], records['timestamp'], records['publish_id']])
+        starts = np.flatnonzero(np.any(keys[:, 1:] != keys[:, :-1], axis=0)) + 1
+        for owner, group in zip(owners[np.r_[0, starts]], np.split(records, starts)):
+            name, timestamp = names[owner], int(group['timestamp'][0])
+            if group['kind'][0] == ORDERBOOK:
+                levels = {
+                    side: [[str(price), str(amount)] for price, amount in zip(rows['price'], rows['amount'])]
+                    for side in (BID, ASK)
+                    for rows in [group[group['side'] == side]]
+                }
+                yield ORDERBOOK_CHANNEL.format(name), {
+                    'timestamp': timestamp,
+                    'instrument_name': name,
+                    'publish_id': int(group['publish_id'][0]),
+                    'bids': levels[BID],
+                    'asks': levels[ASK],
+                }
+            else:
+                ticker = {'instrument_name': name}
+                for side, price, amount in zip(group['side'], group['price'], group['amount']):
+                    if side in (BID, ASK):
+                        prefix = 'best_bid' if side == BID else 'best_ask'
+                        ticker[f'{prefix}_price'], ticker[f'{prefix}_amount'] = str(price), str(amount)
+                    else:
+                        ticker['mark_price' if side == MARK else 'index_price'] = str(price)
+                yield TICKER_CHANNEL.format(name), {'timestamp': timestamp, 'instrument_ticker': ticker}
@@ -0,0 +1,494 @@
+"""
+Replays recorded sessions through the async client, standing in for the ws, with a simulated matcher for orders.
+"""
+import asyncio
+import itertools
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+
+from lyra.codec import dumps, loads
+from lyra.enums import InstrumentType, OrderStatus, TimeInForce
+from lyra.utils import get_instrument_type
+
+REAL_TIME = 1.0
+AS_FAST_AS_POSSIBLE = None
+
+METHOD_NOT_FOUND_ERROR = {"code": -32601, "message": "Method not found"}
+ORDER_NOT_FOUND_ERROR = {"code": 11006, "message": "Does not exist"}
+
+Update = Tuple[str, dict]
+
+
+class ReplayMessage:
+    """A message as returned by `receive` on an aiohttp websocket."""
+
+    __slots__ = ("type", "data")
+
+    def __init__(self, data, type=aiohttp.WSMsgType.TEXT):
+        self.data = data
+        self.type = type
+
+
+def load_session(path) -> List[Update]:
+    """
+    Load the `(channel, data)` updates of a recorded session. Either a directory written by
+    `MarketDataRecorder`, or json lines of raw ws messages or of `--jsonl` output.
+    """
+    path = Path(path)
+    if path.is_dir():
+        from lyra.recorder import MarketDataReader
+
+        return list(MarketDataReader(path).updates())
+    updates = []
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            message = loads(line)
+            message = message.get('params', message)
+            updates.append((message['channel'], message['data']))
+    return updates
+
+
+def make_instrument(instrument_name: str, base_asset_sub_id: str = "0", **kwargs) -> dict:
+    """Build an instrument as returned by `public/get_instruments`, for the exchanges standing in for lyra."""
+    instrument_type = get_instrument_type(instrument_name)
+    instrument = {
+        "instrument_name": instrument_name,
+        "instrument_type": instrument_type.value,
+        "is_active": True,
+        "tick_size": "0.01",
+        "minimum_amount": "0.1",
+        "amount_step": "0.01",
+        "base_asset_sub_id": base_asset_sub_id,
+        "base_currency": instrument_name.split("-")[0],
+        "quote_currency": "USDC",
+    }
+    if instrument_type == InstrumentType.OPTION:
+        _, expiry, strike, option_type = instrument_name.split("-")
+        instrument["option_details"] = {"expiry": expiry, "strike": strike, "option_type": option_type}
+    instrument.update(kwargs)
+    return instrument
+
+
+class ExchangeMethods:
+    """
+    The json rpc methods answered the same way by `ReplayTransport` and the mock exchange, on top of
+    their own `instruments`, `order`, `cancel` and `open_orders`. Methods take the params and the connection.
+    """
+
+    instruments: Dict[str, dict]
+
+    def get_instruments(self, params, connection=None):
+        return [
+            i
+            for i in self.instruments.values()
+            if i["base_currency"] == params.get("currency", i["base_currency"])
+            and i["instrument_type"] == params.get("instrument_type", i["instrument_type"])
+        ]
+
+    async def replace(self, params, connection=None):
+        cancelled = await self.cancel({"order_id": params["order_id_to_cancel"]}, connection)
+        if "error" in cancelled:
+            return cancelled
+        created = await self.order({k: v for k, v in params.items() if k != "order_id_to_cancel"}, connection)
+        return {"cancelled_order": cancelled, **created, "create_order_error": None}
+
+    async def cancel_all(self, params, connection=None):
+        for order in self.open_orders(params["subaccount_id"], params.get("instrument_name")):
+            await self.cancel({"order_id": order["order_id"]}, connection)
+        return "ok"
+
+
+class SimulatedMatcher:
+    """
+    Matches orders against the replayed books. Orders take liquidity from the opposite side up to their
+    limit price, taken liquidity stays gone until the next update of the book. Resting orders fill at
+    their limit price once a later update crosses them.
+    """
+
+    def __init__(self):
+        self.books: Dict[str, dict] = {}
+        self.orders: Dict[str, dict] = {}
+        self.resting: Dict[str, Dict[str, dict]] = {}
+        self.trades: List[dict] = []
+        self.order_ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+
+    def _book(self, instrument_name: str) -> dict:
+        """The book of an instrument with its levels parsed, which is only done once it is matched against."""
+        book = self.books.setdefault(instrument_name, {"bids": [], "asks": [], "parsed": True})
+        if not book["parsed"]:
+            for side in ("bids", "asks"):
+                book[side] = [[Decimal(price), Decimal(amount)] for price, amount in book[side]]
+            book["parsed"] = True
+        return book
+
+    def on_update(self, channel: str, data: dict, timestamp: int) -> Tuple[List[dict], List[dict]]:
+        """Apply a book or ticker update, returning the orders and trades of resting orders it filled."""
+        kind, instrument_name = channel.split(".")[:2]
+        previous = self.books.get(instrument_name)
+        if kind == "orderbook":
+            bids, asks = data["bids"], data["asks"]
+            if previous is not None and previous.get("source") == "orderbook":
+                # an update leaving out a side keeps the previous one
+                bids = bids or self._book(instrument_name)["bids"]
+                asks = asks or self._book(instrument_name)["asks"]
+            self.books[instrument_name] = {
+                "bids": bids,
+                "asks": asks,
+                "parsed": False,
+                "source": "orderbook",
+                "ticker": (previous or {}).get("ticker", {}),
+            }
+        elif kind == "ticker":
+            ticker = data.get("instrument_ticker", data)
+            if previous is not None and previous.get("source") == "orderbook":
+                # the book comes from its own channel, the ticker only adds marks
+                previous["ticker"] = ticker
+                return [], []
+            book = {"parsed": False, "source": "ticker", "ticker": ticker}
+            for side, prefix in (("bids", "best_bid"), ("asks", "best_ask")):
+                price = ticker.get(f"{prefix}_price")
+                book[side] = [[price, ticker.get(f"{prefix}_amount") or "0"]] if price else []
+            self.books[instrument_name] = book
+        else:
+            return [], []
+        orders, trades = [], []
+        for order in list(self.resting.get(instrument_name, {}).values()):
+            filled = self._fill(order, timestamp, liquidity_role="maker")
+            if filled:
+                orders.append(order)
+                trades.extend(filled)
+        return orders, trades
+
+    def _fill(self, order: dict, timestamp: int, liquidity_role: str) -> List[dict]:
+        book = self._book(order["instrument_name"])
+        buy = order["direction"] == "buy"
+        levels = book["asks"] if buy else book["bids"]
+        limit = order["_limit_price"]
+        trades = []
+        while levels and order["_remaining"] > 0:
+            price, amount = levels[0]
+            if (price > limit) if buy else (price < limit):
+                break
+            size = min(amount, order["_remaining"])
+            trade_price = price if liquidity_role == "taker" else limit
+            trades.append(self._trade(order, trade_price, size, timestamp, liquidity_role))
+            levels[0][1] -= size
+            if levels[0][1] <= 0:
+                levels.pop(0)
+        if trades:
+            filled = order["_amount"] - order["_remaining"]
+            order["filled_amount"] = str(filled)
+            order["average_price"] = str(order["_notional"] / filled)
+            order["last_update_timestamp"] = timestamp
+            if order["_remaining"] <= 0:
+                self._close(order, OrderStatus.FILLED)
+        return trades
+
+    def _trade(self, order: dict, price: Decimal, amount: Decimal, timestamp: int, liquidity_role: str) -> dict:
+        order["_remaining"] -= amount
+        order["_notional"] += price * amount
+        trade = {
+            "trade_id": str(next(self.trade_ids)),
+            "order_id": order["order_id"],
+            "subaccount_id": order["subaccount_id"],
+            "instrument_name": order["instrument_name"],
+            "direction": order["direction"],
+            "trade_price": str(price),
+            "trade_amount": str(amount),
+            "trade_fee": "0",
+            "liquidity_role": liquidity_role,
+            "timestamp": timestamp,
+            "label": order["label"],
+        }
+        self.trades.append(trade)
+        return trade
+
+    def _close(self, order: dict, status: OrderStatus):
+        order["order_status"] = status.value
+        self.resting.get(order["instrument_name"], {}).pop(order["order_id"], None)
+
+    def place(self, params: dict, timestamp: int) -> Tuple[dict, List[dict]]:
+        """Match an order, returning it with the trades it took, unfilled gtc orders rest on the book."""
+        amount = Decimal(str(params["amount"]))
+        order = {
+            **{k: v for k, v in params.items() if k != "signature"},
+            "order_id": str(next(self.order_ids)),
+            "order_status": OrderStatus.OPEN.value,
+            "filled_amount": "0",
+            "average_price": "0",
+            "order_fee": "0",
+            "creation_timestamp": timestamp,
+            "last_update_timestamp": timestamp,
+            "label": params.get("label", ""),
+            "_amount": amount,
+            "_remaining": amount,
+            "_notional": Decimal(0),
+        }
+        buy = order["direction"] == "buy"
+        market = order.get("order_type") == "market"
+        if market:
+            limit = Decimal("Infinity") if buy else Decimal(0)
+        else:
+            limit = Decimal(str(params["limit_price"]))
+        order["_limit_price"] = limit
+        self.orders[order["order_id"]] = order
+        time_in_force = order.get("time_in_force", TimeInForce.GTC.value)
+
+        levels = self._book(order["instrument_name"])["asks" if buy else "bids"]
+        available = sum(size for price, size in levels if (price <= limit if buy else price >= limit))
+        if time_in_force == TimeInForce.POST_ONLY.value and available:
+            self._close(order, OrderStatus.REJECTED)
+            return order, []
+        if time_in_force == TimeInForce.FOK.value and available < amount:
+            self._close(order, OrderStatus.CANCELLED)
+            return order, []
+
+        trades = self._fill(order, timestamp, liquidity_role="taker")
+        if order["_remaining"] > 0:
+            if market or time_in_force in (TimeInForce.IOC.value, TimeInForce.FOK.value):
+                self._close(order, OrderStatus.CANCELLED)
+            else:
+                self.resting.setdefault(order["instrument_name"], {})[order["order_id"]] = order
+        return order, trades
+
+    def cancel(self, order_id: str, timestamp: int) -> Optional[dict]:
+        order = self.orders.get(order_id)
+        if order is None or order["order_status"] != OrderStatus.OPEN.value:
+            return None
+        order["last_update_timestamp"] = timestamp
+        self._close(order, OrderStatus.CANCELLED)
+        return order
+
+    def open_orders(self, subaccount_id: int, instrument_name: Optional[str] = None) -> List[dict]:
+        return [
+            order
+            for name, resting in self.resting.items()
+            for order in resting.values()
+            if order["subaccount_id"] == subaccount_id and instrument_name in (None, name)
+        ]
+
+    def ticker(self, instrument_name: str, timestamp: int) -> Optional[dict]:
+        """A ticker from the last ticker update, or from the top of the book."""
+        book = self.books.get(instrument_name)
+        if book is None:
+            return None
+        ticker = {**book.get("ticker", {}), "instrument_name": instrument_name, "timestamp": timestamp}
+        book = self._book(instrument_name)
+        for side, prefix in (("bids", "best_bid"), ("asks", "best_ask")):
+            if book[side]:
+                ticker[f"{prefix}_price"], ticker[f"{prefix}_amount"] = map(str, book[side][0])
+        return ticker
+
+
+def public_order(order: dict) -> dict:
+    """An order without the matcher's own fields."""
+    return {k: v for k, v in order.items() if not k.startswith("_")}
+
+
+class ReplayTransport(ExchangeMethods):
+    """
+    Stands in for the ws of an `AsyncClient`, playing back recorded updates on the channels the
+    client subscribes to and answering requests locally, orders go to a `SimulatedMatcher`.
+
+    Playback starts with the first subscription, or on `start`, at `speed` times real time, or as fast as the client
+    takes messages with `AS_FAST_AS_POSSIBLE`. Then only the client paces the playback, so runs are
+    deterministic. The replay clock is the timestamp of the last update, which orders and trades carry.
+    """
+
+    def __init__(
+        self,
+        updates: Iterable[Update],
+        speed: Optional[float] = AS_FAST_AS_POSSIBLE,
+        instruments: Optional[List[dict]] = None,
+        subaccount_ids: List[int] = (5,),
+        close_at_end: bool = True,
+        autostart: bool = True,
+        buffer: int = 1,
+    ):
+        self.updates = list(updates)
+        self.speed = speed
+        # instrument names hold a dash, unlike the wallet and subaccount of private channels
+        names = {name for channel, _ in self.updates for name in channel.split(".")[1:2] if "-" in name}
+        self.instruments = {name: make_instrument(name) for name in sorted(names)}
+        self.instruments.update({i["instrument_name"]: i for i in instruments or []})
+        self.subaccount_ids = list(subaccount_ids)
+        self.close_at_end = close_at_end
+        self.autostart = autostart
+        self.matcher = SimulatedMatcher()
+        self.buffer = buffer
+        # created in the running loop, older pythons bind them to a loop when made
+        self._messages = None
+        self._finished = None
+        self.subscriptions: Dict[Tuple[str, ...], set] = {}
+        self.methods = {
+            "public/login": lambda params, connection: self.subaccount_ids,
+            "public/get_instruments": self.get_instruments,
+            "public/get_ticker": self.get_ticker,
+            "private/order": self.order,
+            "private/cancel": self.cancel,
+            "private/cancel_all": self.cancel_all,
+            "private/cancel_by_instrument": self.cancel_all,
+            "private/replace": self.replace,
+            "subscribe": self.subscribe,
+            "unsubscribe": self.unsubscribe,
+        }
+        self.closed = False
+        self.now = self.updates[0][1].get("timestamp", 0) if self.updates else 0
+        self.player = None
+        self.requests: List[dict] = []
+        self.delivered = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def messages(self) -> asyncio.Queue:
+        if self._messages is None:
+            self._messages = asyncio.Queue(maxsize=self.buffer)
+        return self._messages
+
+    @property
+    def finished(self) -> asyncio.Event:
+        if self._finished is None:
+            self._finished = asyncio.Event()
+        return self._finished
+
+    def start(self):
+        """Start the playback, done by the first subscription unless `autostart` is off."""
+        if self.player is None:
+            self.player = asyncio.ensure_future(self.play())
+
+    async def wait(self):
+        """Wait until every update has been played back."""
+        await self.finished.wait()
+
+    @classmethod
+    def from_file(cls, path, **kwargs) -> "ReplayTransport":
+        return cls(load_session(path), **kwargs)
+
+    def connect(self, client):
+        """Point a client at this replay, with its instrument cache filled so nothing goes to the network."""
+        client._ws = self
+        client.instruments.update(self.instruments)
+
+        async def connect_ws():
+            raise ConnectionError("the replay has finished")
+
+        client.connect_ws = connect_ws
+        return client
+
+    async def send_json(self, message: dict, dumps=dumps):
+        self.requests.append(message)
+        method = self.methods.get(message["method"])
+        result = method(message.get("params", {}), None) if method else {"error": METHOD_NOT_FOUND_ERROR}
+        if asyncio.iscoroutine(result):
+            result = await result
+        if not (isinstance(result, dict) and "error" in result):
+            result = {"result": result}
+        await self.send({"id": message["id"], **result})
+        if message["method"] == "subscribe" and self.autostart:
+            self.start()
+
+    async def receive(self) -> ReplayMessage:
+        message = await self.messages.get()
+        if message.type == aiohttp.WSMsgType.CLOSE:
+            self.closed = True
+        return message
+
+    async def close(self):
+        self.closed = True
+        if self.player is not None:
+            self.player.cancel()
+        # wake a listener waiting on the queue
+        while self.messages.full():
+            self.messages.get_nowait()
+        self.messages.put_nowait(ReplayMessage(None, aiohttp.WSMsgType.CLOSE))
+
+    async def send(self, message: dict):
+        await self.messages.put(ReplayMessage(dumps(message).encode()))
+
+    async def publish(self, channel: str, data):
+        """Send an update to every subscribed channel it belongs to, whatever their group, depth or interval."""
+        for subscribed in self.subscriptions.get(tuple(channel.split(".")[:2]), ()):
+            await self.send({"method": "subscription", "params": {"channel": subscribed, "data": data}})
+            self.delivered += 1
+
+    async def publish_fills(self, orders: List[dict], trades: List[dict]):
+        for order in orders:
+            await self.publish(f"{order['subaccount_id']}.orders", [public_order(order)])
+        for subaccount_id in sorted({trade["subaccount_id"] for trade in trades}):
+            await self.publish(
+                f"{subaccount_id}.trades", [trade for trade in trades if trade["subaccount_id"] == subaccount_id]
+            )
+
+    async def play(self):
+        self.started_at = time.perf_counter()
+        first = None
+        for channel, data in self.updates:
+            timestamp = data.get("timestamp")
+            if timestamp is not None:
+                first = timestamp if first is None else first
+                self.now = timestamp
+                if self.speed:
+                    delay = self.started_at + (timestamp - first) / 1000 / self.speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+            orders, trades = self.matcher.on_update(channel, data, self.now)
+            await self.publish(channel, data)
+            if orders:
+                await self.publish_fills(orders, trades)
+            if not self.speed:
+                await asyncio.sleep(0)  # let tasks woken by the update run, before the next one
+        self.finished_at = time.perf_counter()
+        self.finished.set()
+        if self.close_at_end and not self.closed:
+            await self.messages.put(ReplayMessage(None, aiohttp.WSMsgType.CLOSE))
+
+    def stats(self) -> dict:
+        """Counts and throughput of the playback so far."""
+        elapsed = ((self.finished_at or time.perf_counter()) - self.started_at) if self.started_at else 0.0
+        return {
+            "updates": len(self.updates),
+            "delivered": self.delivered,
+            "orders": len(self.matcher.orders),
+            "trades": len(self.matcher.trades),
+            "elapsed": elapsed,
+            "updates_per_sec": len(self.updates) / elapsed if self.finished_at and elapsed else 0.0,
+        }
+
+    def subscribe(self, params, connection=None):
+        for channel in params["channels"]:
+            self.subscriptions.setdefault(tuple(channel.split(".")[:2]), set()).add(channel)
+        return {"status": {channel: "ok" for channel in params["channels"]}}
+
+    def unsubscribe(self, params, connection=None):
+        for channel in params["channels"]:
+            self.subscriptions.get(tuple(channel.split(".")[:2]), set()).discard(channel)
+        return {"status": {channel: "ok" for channel in params["channels"]}}
+
+    def get_ticker(self, params, connection=None):
+        ticker = self.matcher.ticker(params["instrument_name"], self.now)
+        if ticker is None:
+            return {"error": {"code": -32602, "message": f"No market data for {params['instrument_name']}"}}
+        return ticker
+
+    def open_orders(self, subaccount_id: int, instrument_name: Optional[str] = None) -> List[dict]:
+        return self.matcher.open_orders(subaccount_id, instrument_name)
+
+    async def order(self, params, connection=None):
+        order, trades = self.matcher.place(params, self.now)
+        asyncio.ensure_future(self.publish_fills([order], trades))
+        return {"order": public_order(order), "trades": trades}
+
+    async def cancel(self, params, connection=None):
+        order = self.matcher.cancel(params.get("order_id"), self.now)
+        if order is None:
+            return {"error": ORDER_NOT_FOUND_ERROR}
+        asyncio.ensure_future(self.publish_fills([order], []))
+        return public_order(order)
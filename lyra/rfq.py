@@ -0,0 +1,293 @@
+"""
+RFQs streamed over the ws, for market makers to quote as soon as an RFQ arrives.
+"""
+import asyncio
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import eth_abi
+
+from lyra.enums import RfqStatus
+from lyra.metrics import QUOTE_LATENCY
+
+QUOTE_DATA_TYPES = ['(uint256,(address,uint256,uint256,int256)[])']
+# words of the encoded quote data: the offset of the tuple, the max fee, the offset and length of the legs,
+# then four words per leg of which the third is the price.
+MAX_FEE_OFFSET = 32
+LEGS_OFFSET = 4 * 32
+LEG_SIZE = 4 * 32
+PRICE_OFFSET = 2 * 32
+
+
+def get_rfq_channel(wallet: str) -> str:
+    return f"{wallet}.rfqs"
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class QuoteTemplates:
+    """
+    Encoded rfq module data of quotes, cached by leg structure. Only the max fee and the leg prices
+    vary between quotes of the same structure, so they are written into a copy of the cached encoding,
+    skipping the instrument lookups, amount conversions and abi encoding of every other word.
+
+    `encode_leg(leg, direction_sign)` returns the abi values of a priced leg.
+    """
+
+    def __init__(self, encode_leg: Callable[[dict, int], tuple], maxsize: int = 1024):
+        self.encode_leg = encode_leg
+        self.maxsize = maxsize
+        self.templates: Dict[tuple, bytes] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(quote: dict) -> tuple:
+        legs = tuple((leg['instrument_name'], leg['direction'], str(leg['amount'])) for leg in quote['legs'])
+        return quote['direction'], legs
+
+    def template(self, quote: dict) -> bytes:
+        key = self.key(quote)
+        template = self.templates.get(key)
+        if template is not None:
+            self.hits += 1
+            return template
+        with self.lock:
+            self.misses += 1
+            direction_sign = 1 if quote['direction'] == 'buy' else -1
+            legs = [self.encode_leg({**leg, 'price': 0}, direction_sign) for leg in quote['legs']]
+            template = eth_abi.encode(QUOTE_DATA_TYPES, [(0, legs)])
+            if len(self.templates) >= self.maxsize:
+                self.templates.pop(next(iter(self.templates)))
+            self.templates[key] = template
+        return template
+
+    def encode(self, quote: dict, to_wei: Callable) -> bytes:
+        """The abi encoding of a priced quote, as `eth_abi.encode(QUOTE_DATA_TYPES, ...)` would give."""
+        encoded = bytearray(self.template(quote))
+        words: List[Tuple[int, int]] = [(MAX_FEE_OFFSET, to_wei(quote['max_fee'], 'ether'))]
+        for i, leg in enumerate(quote['legs']):
+            words.append((LEGS_OFFSET + i * LEG_SIZE + PRICE_OFFSET, to_wei(leg['price'], 'ether')))
+        for offset, value in words:
+            encoded[offset : offset + 32] = value.to_bytes(32, 'big')  # noqa: E203
+        return bytes(encoded)
+
+
+class RfqFeed:
+    """
+    The open RFQs of the `{wallet}.rfqs` channel, replacing `poll_rfqs` loops.
+
+    Every RFQ is delivered once, to `on_rfq` and to anyone iterating the feed with `async for`,
+    however often it is republished. Later updates of an RFQ replace it in `open` without being
+    delivered again. RFQs leave `open` when they are filled or cancelled, or once their `valid_until`
+    (ms) passes, calling `on_close` either way.
+    """
+
+    def __init__(
+        self,
+        client,
+        on_rfq: Optional[Callable[[dict], None]] = None,
+        on_close: Optional[Callable[[dict], None]] = None,
+    ):
+        self.client = client
+        self.on_rfq = on_rfq
+        self.on_close = on_close
+        self.channel = get_rfq_channel(client.wallet)
+        self.open: Dict[str, dict] = {}
+        # rfq ids seen and not yet expired, so republished or late RFQs are not delivered twice
+        self.seen: Dict[str, int] = {}
+        self.expiries: List[tuple] = []
+        self.received = 0
+        self.delivered = 0
+        self._queue = None
+        self._expirer = None
+
+    async def start(self) -> "RfqFeed":
+        """Log in and subscribe, RFQs arriving from then on are delivered."""
+        if self.on_rfq is None:
+            # without a callback, new RFQs queue up for `async for`
+            self._queue = asyncio.Queue()
+        await self.client._ensure_login()
+        await self.client.subscribe_channels([self.channel], self)
+        self._expirer = asyncio.ensure_future(self._expire_forever())
+        return self
+
+    async def close(self):
+        if self._expirer is not None:
+            self._expirer.cancel()
+        if self.client._ws is not None and not self.client._ws.closed:
+            await self.client.unsubscribe_channels([self.channel])
+        if self._queue is not None:
+            self._queue.put_nowait(None)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __call__(self, channel: str, data: List[dict]):
+        for rfq in data:
+            self.apply(rfq)
+
+    def apply(self, rfq: dict, now: Optional[int] = None):
+        """Apply an RFQ update from the channel."""
+        now = now_ms() if now is None else now
+        self.received += 1
+        self.expire(now)
+        rfq_id = rfq["rfq_id"]
+        if rfq["status"] != RfqStatus.OPEN.value:
+            if self.open.pop(rfq_id, None) is not None:
+                self._closed(rfq)
+            elif rfq_id not in self.seen:
+                # remember it until it would have expired, in case an older open update arrives late
+                self._remember(rfq_id, rfq.get("valid_until", now))
+            return
+        if rfq_id in self.open:
+            if rfq.get("last_update_timestamp", 0) >= self.open[rfq_id].get("last_update_timestamp", 0):
+                self.open[rfq_id] = rfq
+            return
+        if rfq_id in self.seen or rfq["valid_until"] <= now:
+            return
+        self.open[rfq_id] = rfq
+        self._remember(rfq_id, rfq["valid_until"])
+        self.delivered += 1
+        if self.on_rfq is not None:
+            self.on_rfq(rfq)
+        if self._queue is not None:
+            self._queue.put_nowait(rfq)
+
+    def _remember(self, rfq_id: str, valid_until: int):
+        self.seen[rfq_id] = valid_until
+        heapq.heappush(self.expiries, (valid_until, rfq_id))
+
+    def expire(self, now: Optional[int] = None) -> List[dict]:
+        """Drop RFQs whose `valid_until` has passed, returning those still open until now."""
+        now = now_ms() if now is None else now
+        expired = []
+        while self.expiries and self.expiries[0][0] <= now:
+            _, rfq_id = heapq.heappop(self.expiries)
+            self.seen.pop(rfq_id, None)
+            rfq = self.open.pop(rfq_id, None)
+            if rfq is not None:
+                rfq = {**rfq, "status": RfqStatus.EXPIRED.value}
+                expired.append(rfq)
+                self._closed(rfq)
+        return expired
+
+    def _closed(self, rfq: dict):
+        if self.on_close is not None:
+            self.on_close(rfq)
+
+    async def _expire_forever(self):
+        while True:
+            delay = (self.expiries[0][0] - now_ms()) / 1000 if self.expiries else 0.1
+            await asyncio.sleep(min(max(delay, 0), 0.1))
+            self.expire()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        """The next new RFQ, skipping any which expired or closed while queued."""
+        if self._queue is None:
+            raise Exception("RfqFeed is iterated without being started, or while delivering to on_rfq")
+        while True:
+            rfq = await self._queue.get()
+            if rfq is None:
+                raise StopAsyncIteration
+            if rfq["rfq_id"] in self.open:
+                return self.open[rfq["rfq_id"]]
+
+
+class QuotePipeline:
+    """
+    Quotes many open RFQs at once. `pricer(rfq, leg)` prices each leg, returning None passes on the RFQ.
+    Quotes are signed for the client's rfq module, or for `rfq_module_address` when given.
+    Instruments come from the client's cache, quotes are signed on a thread pool and sent over the
+    ws without waiting on each other. The client's metrics time the price, encode, sign and send
+    stages, and each quote from pricing to acknowledgement in `QUOTE_LATENCY`.
+    """
+
+    def __init__(
+        self,
+        client,
+        pricer,
+        direction: str = "sell",
+        max_fee: str = "10.0",
+        max_workers: int = 4,
+        rfq_module_address: Optional[str] = None,
+    ):
+        if rfq_module_address:
+            client.rfq_module_address = rfq_module_address
+        if not client.rfq_module_address:
+            raise Exception(f"No rfq module address for {client.env}, pass `rfq_module_address` to sign quotes")
+        self.client = client
+        self.pricer = pricer
+        self.direction = direction
+        self.max_fee = max_fee
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.feed = None
+        self.passed = 0
+        self.stale = 0
+        self.sent = 0
+
+    def price(self, rfq: dict) -> Optional[dict]:
+        """The unsigned quote of an RFQ, None if any leg has no price."""
+        with self.client.metrics.stage('price'):
+            legs = []
+            for leg in rfq["legs"]:
+                price = self.pricer(rfq, leg)
+                if price is None:
+                    return None
+                legs.append({**leg, "price": str(price)})
+        quote = self.client.create_quote_object(rfq["rfq_id"], legs, self.direction)
+        quote["max_fee"] = self.max_fee
+        return quote
+
+    async def quote(self, rfq: dict) -> Optional[dict]:
+        """Price, sign and send a quote, returning the exchange's response or None when passing."""
+        start = time.perf_counter()
+        quote = self.price(rfq)
+        if quote is None:
+            self.passed += 1
+            return None
+        loop = asyncio.get_running_loop()
+        signed = await loop.run_in_executor(self.executor, self.client._sign_quote, quote)
+        if self.feed is not None and rfq["rfq_id"] not in self.feed.open:
+            # closed or expired while we were signing
+            self.stale += 1
+            return None
+        result = await self.client.send_quote(signed)
+        self.sent += 1
+        self.client.metrics.observe(QUOTE_LATENCY, time.perf_counter() - start)
+        return result
+
+    async def quote_many(self, rfqs: Iterable[dict]) -> List:
+        """Quote RFQs concurrently, failures are returned in place of their response."""
+        return await asyncio.gather(*(self.quote(rfq) for rfq in rfqs), return_exceptions=True)
+
+    async def run(self, feed: RfqFeed):
+        """Quote every RFQ of a feed as it arrives, until the feed closes."""
+        self.feed = feed
+        pending = set()
+        async for rfq in feed:
+            task = asyncio.ensure_future(self.quote(rfq))
+            pending.add(task)
+            task.add_done_callback(lambda task, rfq_id=rfq["rfq_id"]: self._done(pending, task, rfq_id))
+        if pending:
+            await asyncio.wait(pending)
+
+    def _done(self, pending: set, task: asyncio.Future, rfq_id: str):
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.client.logger.error(f"Quote for rfq {rfq_id} failed: {task.exception()}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,83 @@
+"""
+Local session cache, so that chained cli calls do not rediscover the same state on every invocation.
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from lyra.codec import dumpb, loads
+from lyra.constants import CONTRACTS
+from lyra.enums import Environment
+
+DEFAULT_CACHE_DIR = Path("~/.cache/lyra")
+
+
+def get_cache_dir() -> Path:
+    """The cache directory, which can be moved with the `LYRA_CACHE_DIR` env var."""
+    return Path(os.environ.get("LYRA_CACHE_DIR", DEFAULT_CACHE_DIR)).expanduser()
+
+
+class SessionCache:
+    """
+    A json file per environment and wallet holding subaccount ids, an instrument snapshot
+    and environment metadata, which expires `ttl` seconds after it was written.
+    """
+
+    def __init__(self, env: Environment, wallet: str, ttl: int = 3600, directory: Path = None):
+        self.env = env
+        self.wallet = wallet
+        self.ttl = ttl
+        self.directory = Path(directory) if directory else get_cache_dir()
+        self.path = self.directory / f"session-{env.value}-{wallet.lower()}.json"
+
+    @property
+    def environment(self) -> dict:
+        """The metadata a session must match to be reused."""
+        return {
+            "env": self.env.value,
+            "wallet": self.wallet,
+            "base_url": CONTRACTS[self.env]["BASE_URL"],
+            "ws_address": CONTRACTS[self.env]["WS_ADDRESS"],
+        }
+
+    def load(self) -> dict:
+        """Return the cached session, or an empty dict when it is missing, expired or stale."""
+        try:
+            state = loads(self.path.read_bytes())
+        except (OSError, ValueError):
+            return {}
+        if state.get("expires_at", 0) < time.time() or state.get("environment") != self.environment:
+            return {}
+        return state
+
+    def save(self, **state) -> dict:
+        """Write the session atomically, so concurrent cli calls never read a partial file."""
+        now = time.time()
+        state = {**state, "environment": self.environment, "created_at": now, "expires_at": now + self.ttl}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            file.write(dumpb(state))
+        os.replace(file.name, self.path)
+        return state
+
+    def clear(self):
+        """Remove the cached session."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def restore(self, client) -> bool:
+        """Seed a client from the cached session, returns whether a session was found."""
+        state = self.load()
+        if not state:
+            return False
+        if not client._subaccount_id and state.get("subaccount_id"):
+            client.subaccount_id = state["subaccount_id"]
+        client.instruments.update(state.get("instruments", {}))
+        return True
+
+    def persist(self, client):
+        """Save the state the client has discovered so far."""
+        return self.save(subaccount_id=client._subaccount_id, instruments=client.instruments)
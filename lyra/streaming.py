@@ -0,0 +1,196 @@
+"""
+Live streams of ws channels, rendered and written out without ever holding up the listener.
+"""
+import asyncio
+import queue
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from rich.console import Console
+from rich.live import Live
+from rich.table import Table
+
+from lyra.codec import dumps
+
+TICKER_COLUMNS = ['best_bid_amount', 'best_bid_price', 'best_ask_price', 'best_ask_amount', 'mark_price', 'index_price']
+
+
+def get_ticker_channel(instrument_name: str, interval: str = "1000") -> str:
+    return f"ticker.{instrument_name}.{interval}"
+
+
+def get_order_book_channel(instrument_name: str, group: str = "1", depth: str = "10") -> str:
+    return f"orderbook.{instrument_name}.{group}.{depth}"
+
+
+def get_instrument_name(channel: str) -> str:
+    """Instrument channels are of the form `{kind}.{instrument_name}.{...}`."""
+    return channel.split(".")[1]
+
+
+class LatestUpdates:
+    """
+    Keeps only the latest update per instrument, so a slow consumer sees the current state
+    instead of falling behind a backlog. Writes come from the event loop, reads from the renderer.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest: Dict[str, dict] = {}
+        self.updates = 0
+        self.changed = False
+
+    def __call__(self, channel: str, data: dict):
+        with self.lock:
+            self.latest[get_instrument_name(channel)] = data
+            self.updates += 1
+            self.changed = True
+
+    def snapshot(self) -> Optional[Dict[str, dict]]:
+        """Return a copy of the latest updates, or None if nothing changed since the last call."""
+        with self.lock:
+            if not self.changed:
+                return None
+            self.changed = False
+            return dict(self.latest)
+
+
+class OrderBookUpdates(LatestUpdates):
+    """Latest order books, where an update with an empty side keeps the previous levels of that side."""
+
+    def __call__(self, channel: str, data: dict):
+        previous = self.latest.get(get_instrument_name(channel))
+        if previous is not None and not (data['bids'] and data['asks']):
+            data = {**data, 'bids': data['bids'] or previous['bids'], 'asks': data['asks'] or previous['asks']}
+        super().__call__(channel, data)
+
+
+class JsonlWriter:
+    """
+    Writes every update as a json line. The listener only enqueues, encoding and writing
+    happen on a background thread which flushes at most every `flush_interval` seconds.
+    """
+
+    def __init__(self, stream=None, flush_interval: float = 0.1):
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __call__(self, channel: str, data: dict):
+        self.queue.put((channel, data))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                channel, data = item
+                self.stream.write(dumps({"channel": channel, "data": data}) + "\n")
+            if time.monotonic() - last_flush >= self.flush_interval or self.queue.empty():
+                self.stream.flush()
+                last_flush = time.monotonic()
+        self.stream.flush()
+
+    def close(self):
+        """Write out whatever is queued and stop the thread."""
+        self.queue.put(None)
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class LiveRenderer:
+    """Renders the latest updates from a background thread, at most `refresh_rate` times a second."""
+
+    def __init__(
+        self,
+        updates: LatestUpdates,
+        render: Callable[[Dict[str, dict]], Table],
+        refresh_rate: float = 4.0,
+        console: Console = None,
+    ):
+        self.updates = updates
+        self.render = render
+        self.refresh_rate = refresh_rate
+        self.console = console or Console()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        with Live(console=self.console, auto_refresh=False) as live:
+            while True:
+                stopping = self.stopped.wait(1 / self.refresh_rate)
+                snapshot = self.updates.snapshot()
+                if snapshot is not None:
+                    live.update(self.render(snapshot), refresh=True)
+                if stopping:
+                    break
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+def render_tickers(tickers: Dict[str, dict]) -> Table:
+    """A row per instrument from ticker channel updates."""
+    table = Table("instrument_name", *TICKER_COLUMNS, "timestamp")
+    for instrument_name in sorted(tickers):
+        data = tickers[instrument_name]
+        ticker = data.get('instrument_ticker', data)
+        table.add_row(instrument_name, *[str(ticker.get(c, "")) for c in TICKER_COLUMNS], str(data.get('timestamp')))
+    return table
+
+
+def render_order_books(books: Dict[str, dict], levels: int = 5) -> Table:
+    """The top `levels` bids and asks of every order book, levels are `[price, amount]` pairs."""
+    table = Table("instrument_name", "bid_amount", "bid_price", "ask_price", "ask_amount")
+    for instrument_name in sorted(books):
+        book = books[instrument_name]
+        bids, asks = book['bids'][:levels], book['asks'][:levels]
+        for level in range(max(len(bids), len(asks), 1)):
+            bid = bids[level] if level < len(bids) else ("", "")
+            ask = asks[level] if level < len(asks) else ("", "")
+            table.add_row(instrument_name if level == 0 else "", str(bid[1]), str(bid[0]), str(ask[0]), str(ask[1]))
+        table.add_section()
+    return table
+
+
+async def watch_channels(
+    client,
+    channels: Iterable[str],
+    handlers: Iterable[Callable[[str, dict], None]],
+    duration: Optional[float] = None,
+):
+    """
+    Subscribe to the channels and feed every update to the handlers, until the connection
+    closes or `duration` seconds have passed.
+    """
+    handlers = list(handlers)
+
+    def handle(channel: str, data: dict):
+        for handler in handlers:
+            handler(channel, data)
+
+    await client.subscribe_channels(channels, handle)
+    try:
+        await asyncio.wait_for(asyncio.shield(client.listener), timeout=duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await client.close()
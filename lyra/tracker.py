@@ -0,0 +1,149 @@
+"""
+Local order state, kept up to date from the private order and trade channels.
+"""
+import asyncio
+from typing import Callable, Dict, Iterable, List, Optional
+
+from lyra.enums import OrderStatus
+
+CLOSED_STATUSES = {
+    OrderStatus.FILLED.value,
+    OrderStatus.CANCELLED.value,
+    OrderStatus.REJECTED.value,
+    OrderStatus.EXPIRED.value,
+}
+
+
+def get_orders_channel(subaccount_id) -> str:
+    return f"{subaccount_id}.orders"
+
+
+def get_trades_channel(subaccount_id) -> str:
+    return f"{subaccount_id}.trades"
+
+
+class OrderTracker:
+    """
+    The orders of a subaccount, indexed by id, instrument, label and status. Updates from the
+    `{subaccount_id}.orders` channel are applied to the order dicts in place, so references stay current.
+    Updates older than the order, or reopening a closed order, are ignored as they arrived out of order.
+    Trades from `{subaccount_id}.trades` are de-duplicated by trade id and passed to `on_fill(trade, order)`,
+    where `order` is None if its update has not arrived yet.
+
+    The indexes are dicts keyed by order id, so lookups, membership and counts take constant time.
+    They are live views, callers should copy them before changing them.
+    """
+
+    def __init__(
+        self,
+        subaccount_id=None,
+        on_fill: Optional[Callable[[dict, Optional[dict]], None]] = None,
+        on_update: Optional[Callable[[dict], None]] = None,
+    ):
+        self.subaccount_id = subaccount_id
+        self.on_fill = on_fill
+        self.on_update = on_update
+        self.orders: Dict[str, dict] = {}
+        self.by_instrument: Dict[str, Dict[str, dict]] = {}
+        self.by_label: Dict[str, Dict[str, dict]] = {}
+        self.by_status: Dict[str, Dict[str, dict]] = {}
+        self.open_by_instrument: Dict[str, Dict[str, dict]] = {}
+        self.trades: Dict[str, dict] = {}
+
+    @property
+    def channels(self) -> List[str]:
+        return [get_orders_channel(self.subaccount_id), get_trades_channel(self.subaccount_id)]
+
+    async def start(self, client, seed: bool = True) -> "OrderTracker":
+        """
+        Subscribe on a logged in ws, then seed the open orders over REST so that orders placed
+        before the subscription are known, later channel updates win over the snapshot.
+        """
+        if self.subaccount_id is None:
+            self.subaccount_id = client.subaccount_id
+        await client._ensure_login()
+        await client.subscribe_channels(self.channels, self)
+        if seed:
+            loop = asyncio.get_running_loop()
+            orders = await loop.run_in_executor(None, lambda: list(client.iter_orders(status=OrderStatus.OPEN)))
+            self.seed(orders)
+        return self
+
+    def __call__(self, channel: str, data: List[dict]):
+        if channel.endswith(".orders"):
+            for order in data:
+                self.apply_order(order)
+        elif channel.endswith(".trades"):
+            for trade in data:
+                self.apply_trade(trade)
+
+    def seed(self, orders: Iterable[dict]):
+        """Apply a snapshot of orders, such as from `fetch_orders`."""
+        for order in orders:
+            self.apply_order(order)
+
+    def apply_order(self, update: dict) -> Optional[dict]:
+        """Apply an order update, returning the tracked order or None if the update was stale."""
+        order_id = update['order_id']
+        order = self.orders.get(order_id)
+        if order is None:
+            order = self.orders[order_id] = dict(update)
+            self._index(order)
+        else:
+            if update.get('last_update_timestamp', 0) < order.get('last_update_timestamp', 0):
+                return None
+            if order['order_status'] in CLOSED_STATUSES and update['order_status'] not in CLOSED_STATUSES:
+                return None
+            self._unindex(order)
+            order.update(update)
+            self._index(order)
+        if self.on_update is not None:
+            self.on_update(order)
+        return order
+
+    def apply_trade(self, trade: dict) -> bool:
+        """Record a trade, returning False if it was already seen."""
+        if trade['trade_id'] in self.trades:
+            return False
+        self.trades[trade['trade_id']] = trade
+        if self.on_fill is not None:
+            self.on_fill(trade, self.orders.get(trade['order_id']))
+        return True
+
+    def _indexes(self, order: dict):
+        yield self.by_instrument, order['instrument_name']
+        yield self.by_label, order.get('label', '')
+        yield self.by_status, order['order_status']
+        if order['order_status'] == OrderStatus.OPEN.value:
+            yield self.open_by_instrument, order['instrument_name']
+
+    def _index(self, order: dict):
+        for index, key in self._indexes(order):
+            index.setdefault(key, {})[order['order_id']] = order
+
+    def _unindex(self, order: dict):
+        for index, key in self._indexes(order):
+            index[key].pop(order['order_id'], None)
+
+    def get(self, order_id: str) -> Optional[dict]:
+        return self.orders.get(order_id)
+
+    def open_orders(self, instrument_name: Optional[str] = None) -> Dict[str, dict]:
+        """The open orders, of an instrument or of all of them, keyed by order id."""
+        if instrument_name is None:
+            return self.with_status(OrderStatus.OPEN)
+        return self.open_by_instrument.setdefault(instrument_name, {})
+
+    def with_label(self, label: str) -> Dict[str, dict]:
+        return self.by_label.setdefault(label, {})
+
+    def with_status(self, status: OrderStatus) -> Dict[str, dict]:
+        return self.by_status.setdefault(status.value if isinstance(status, OrderStatus) else status, {})
+
+    def prune(self) -> int:
+        """Forget closed orders, returning how many were dropped. Their trades are kept."""
+        closed = [order for order in self.orders.values() if order['order_status'] in CLOSED_STATUSES]
+        for order in closed:
+            self._unindex(order)
+            del self.orders[order['order_id']]
+        return len(closed)
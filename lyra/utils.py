@@ -3,9 +3,20 @@ Utils for the lyra package.
 """
 import logging
 import sys
+from datetime import datetime, timezone
+from typing import Optional
 
 from rich.logging import RichHandler
 
+from lyra.enums import InstrumentType
+
+# the greeks of a position or ticker, in the order they are kept in arrays
+DELTA_COLUMNS = ['delta', 'gamma', 'vega', 'theta']
+
+# options expire at 08:00 UTC on the date in their name
+EXPIRY_FORMAT = '%Y%m%d'
+EXPIRY_HOUR = 8
+
 
 def get_logger():
     """Get the logger."""
@@ -30,3 +41,18 @@ def get_logger():
     logger.addHandler(handler)
     logger.setLevel(logging.INFO)
     return logger
+
+
+def get_instrument_type(instrument_name: str) -> InstrumentType:
+    """Get the instrument type from an instrument name such as `ETH-PERP` or `ETH-20240329-2400-C`."""
+    if instrument_name.split("-")[1] == "PERP":
+        return InstrumentType.PERP
+    return InstrumentType.OPTION
+
+
+def get_expiry(instrument_name: str) -> Optional[datetime]:
+    """Get the expiry of an option from its name such as `ETH-20240329-2400-C`, None for perps."""
+    parts = instrument_name.split("-")
+    if len(parts) < 4:
+        return None
+    return datetime.strptime(parts[1], EXPIRY_FORMAT).replace(hour=EXPIRY_HOUR, tzinfo=timezone.utc)
@@ -0,0 +1,185 @@
+"""
+Pre-trade validation of orders against the cached instrument specs, so that orders the exchange would
+reject never cost a signature or a round trip.
+"""
+import time
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from lyra.enums import OrderSide, TimeInForce
+from lyra.utils import get_expiry
+
+ORDER_FIELDS = ['instrument_name', 'side', 'price', 'amount']
+
+# prices and amounts within this fraction of a tick or step of a multiple are on it, absorbing float error
+TOLERANCE = 1e-6
+
+
+class OrderValidationError(Exception):
+    """Orders the exchange would reject, `errors` maps their position in the batch to the reason."""
+
+    def __init__(self, errors: Dict[int, str]):
+        self.errors = errors
+        super().__init__("; ".join(f"order {i}: {error}" for i, error in errors.items()))
+
+
+def _expiry(instrument: dict) -> float:
+    """The expiry of an instrument in unix seconds, from its option details or else its name, infinite for perps."""
+    expiry = (instrument.get('option_details') or {}).get('expiry')
+    if isinstance(expiry, int):
+        return float(expiry)
+    expiry = get_expiry(instrument['instrument_name'])
+    return np.inf if expiry is None else expiry.timestamp()
+
+
+def get_side(order: dict) -> Optional[OrderSide]:
+    """The side of an order from its `side` or `direction`, given as a string or an `OrderSide`, None if invalid."""
+    side = order.get('side', order.get('direction'))
+    try:
+        return OrderSide(getattr(side, 'value', side))
+    except ValueError:
+        return None
+
+
+def _time_in_force(order: dict) -> str:
+    time_in_force = order.get('time_in_force', TimeInForce.GTC)
+    return getattr(time_in_force, 'value', time_in_force)
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class _Batch:
+    """The prices, amounts and instrument specs of a batch of orders, as arrays aligned with the orders."""
+
+    def __init__(self, orders: Sequence[dict], instruments: Dict[str, dict]):
+        # missing names are unknown instruments, and must sort alongside the others in np.unique
+        names = [order.get('instrument_name') or '' for order in orders]
+        self.instruments = [instruments.get(name) for name in names]
+        # specs are read once per instrument of the batch, then spread over its orders
+        unique, inverse = np.unique(np.array(names, dtype=object), return_inverse=True)
+        specs = [instruments.get(name) or {} for name in unique]
+
+        def spec(key):
+            return np.array([_float(s.get(key, 0)) for s in specs])[inverse]
+
+        self.known = np.array([i is not None for i in self.instruments], dtype=bool)
+        self.is_active = np.array([s.get('is_active', True) for s in specs], dtype=bool)[inverse]
+        self.expiry = np.array([_expiry(s) if s else np.inf for s in specs])[inverse]
+        self.tick_size = spec('tick_size')
+        self.minimum_amount = spec('minimum_amount')
+        self.amount_step = spec('amount_step')
+        self.price = np.array([_float(order.get('price')) for order in orders])
+        self.amount = np.array([_float(order.get('amount')) for order in orders])
+
+
+def _off_multiple(values, step):
+    """Where values are not a multiple of a positive step, steps of 0 are not checked."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = values / step
+        return (step > 0) & (np.abs(ratio - np.round(ratio)) > TOLERANCE)
+
+
+def check_orders(
+    orders: Sequence[dict], instruments: Dict[str, dict], now: Optional[float] = None
+) -> List[Optional[str]]:
+    """
+    Why each order of a batch would be rejected by the exchange, None for those that look valid.
+    Orders are dicts with `instrument_name`, `side`, `price` and `amount`, and optionally `time_in_force`,
+    the checks run over the whole batch at once.
+    """
+    now = time.time() if now is None else now
+    batch = _Batch(orders, instruments)
+    specs = batch.instruments
+    missing = [[f for f in ORDER_FIELDS if f not in order] for order in orders]
+    time_in_force = {t.value for t in TimeInForce}
+    with np.errstate(invalid='ignore'):
+        # in order of precedence, an order gets the first error it hits
+        checks = [
+            (np.array([bool(m) for m in missing], dtype=bool), lambda i: f"missing fields {missing[i]}"),
+            (~batch.known, lambda i: f"unknown instrument {orders[i].get('instrument_name')}"),
+            (~batch.is_active, lambda i: f"instrument {orders[i]['instrument_name']} is not active"),
+            (batch.expiry <= now, lambda i: f"instrument {orders[i]['instrument_name']} has expired"),
+            (
+                np.array([get_side(order) is None for order in orders], dtype=bool),
+                lambda i: f"invalid side {orders[i]['side']}",
+            ),
+            (
+                np.array([_time_in_force(order) not in time_in_force for order in orders], dtype=bool),
+                lambda i: f"invalid time in force {orders[i]['time_in_force']}",
+            ),
+            (~(batch.price > 0), lambda i: f"invalid price {orders[i].get('price')}"),
+            (~(batch.amount > 0), lambda i: f"invalid amount {orders[i].get('amount')}"),
+            (
+                batch.amount < batch.minimum_amount,
+                lambda i: f"amount {orders[i]['amount']} is below the minimum of {specs[i]['minimum_amount']}",
+            ),
+            (
+                _off_multiple(batch.amount, batch.amount_step),
+                lambda i: f"amount {orders[i]['amount']} is not a multiple of {specs[i]['amount_step']}",
+            ),
+            (
+                _off_multiple(batch.price, batch.tick_size),
+                lambda i: f"price {orders[i]['price']} is not a multiple of {specs[i]['tick_size']}",
+            ),
+        ]
+    errors: List[Optional[str]] = [None] * len(orders)
+    invalid = np.zeros(len(orders), dtype=bool)
+    for failed, message in checks:
+        for i in np.flatnonzero(failed & ~invalid):
+            errors[i] = message(i)
+        invalid |= failed
+    return errors
+
+
+def round_orders(orders: Sequence[dict], instruments: Dict[str, dict]) -> List[dict]:
+    """
+    Round the prices of a batch of orders onto the tick size, away from the market so rounding never
+    makes an order more aggressive, and the amounts down onto the amount step.
+    Orders of unknown instruments, or with unparseable prices or amounts, are left as they are.
+    Orders without a valid side cannot be rounded safely, they raise an `OrderValidationError`.
+    """
+    sides = [get_side(order) for order in orders]
+    errors = {
+        i: f"invalid side {order.get('side', order.get('direction'))}"
+        for i, (order, side) in enumerate(zip(orders, sides))
+        if side is None
+    }
+    if errors:
+        raise OrderValidationError(errors)
+    batch = _Batch(orders, instruments)
+    is_buy = np.array([side == OrderSide.BUY for side in sides], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ticks = batch.price / batch.tick_size
+        ticks = np.where(is_buy, np.floor(ticks + TOLERANCE), np.ceil(ticks - TOLERANCE))
+        steps = np.floor(batch.amount / batch.amount_step + TOLERANCE)
+    rounded = []
+    for i, order in enumerate(orders):
+        order = dict(order)
+        if batch.known[i] and batch.tick_size[i] > 0 and np.isfinite(ticks[i]):
+            order['price'] = str(int(ticks[i]) * Decimal(batch.instruments[i]['tick_size']))
+        if batch.known[i] and batch.amount_step[i] > 0 and np.isfinite(steps[i]):
+            order['amount'] = str(int(steps[i]) * Decimal(batch.instruments[i]['amount_step']))
+        rounded.append(order)
+    return rounded
+
+
+def validate_orders(
+    orders: Sequence[dict], instruments: Dict[str, dict], round_first: bool = False, now: Optional[float] = None
+) -> List[dict]:
+    """
+    Check a batch of orders, rounding them first when asked, and raise an `OrderValidationError`
+    naming every order that would be rejected. Returns the orders, rounded if asked.
+    """
+    if round_first:
+        orders = round_orders(orders, instruments)
+    errors = {i: error for i, error in enumerate(check_orders(orders, instruments, now)) if error}
+    if errors:
+        raise OrderValidationError(errors)
+    return list(orders)
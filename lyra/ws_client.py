@@ -25,8 +25,3 @@ class WsClient(BaseClient):
             "X-LyraTimestamp": timestamp,
             "X-LyraSignature": Web3.to_hex(signature.signature),
         }
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.ws = self.connect_ws()
-        self.login_client()
@@ -8,11 +8,74 @@ import pytest
 
 from lyra.enums import Environment
 from lyra.lyra import LyraClient
+from lyra.mock_exchange import MockExchange
 from lyra.utils import get_logger
 
 TEST_WALLET = "0x3A5c777edf22107d7FdFB3B02B0Cdfe8b75f3453"
 TEST_PRIVATE_KEY = "0xc14f53ee466dd3fc5fa356897ab276acbef4f020486ec253a23b0d1c3f89d4f4"
 
+REPLAY_BOOK_CHANNEL = "orderbook.ETH-PERP.1.10"
+
+
+def make_replay_book(timestamp, bids, asks):
+    return REPLAY_BOOK_CHANNEL, {"timestamp": timestamp, "publish_id": timestamp, "bids": bids, "asks": asks}
+
+
+# a short ETH-PERP orderbook session for replaying through ReplayTransport
+REPLAY_SESSION = [
+    make_replay_book(1000, [["1999", "1"], ["1998", "2"]], [["2001", "1"], ["2002", "2"]]),
+    make_replay_book(1100, [["1999", "1"]], [["2001", "0.5"]]),
+    make_replay_book(1200, [["2003", "1"]], [["2004", "1"]]),
+]
+
+
+def make_position(instrument_name, amount, delta="0.5", gamma="0.001", vega="2.5", theta="-1.5", **kwargs):
+    """Build a position as returned by `private/get_subaccount`."""
+    position = {
+        "instrument_name": instrument_name,
+        "instrument_type": "perp" if instrument_name.endswith("PERP") else "option",
+        "amount": str(amount),
+        "average_price": "100",
+        "mark_price": "110",
+        "index_price": "2000",
+        "delta": delta,
+        "gamma": gamma,
+        "vega": vega,
+        "theta": theta,
+        "unrealized_pnl": "10",
+        "realized_pnl": "0",
+    }
+    position.update(kwargs)
+    return position
+
+
+def make_subaccount(subaccount_id, positions, subaccount_value="1000"):
+    """Build a subaccount as returned by `private/get_subaccount`."""
+    return {
+        "subaccount_id": subaccount_id,
+        "subaccount_value": subaccount_value,
+        "collaterals": [{"asset_name": "USDC", "amount": subaccount_value}],
+        "positions": positions,
+    }
+
+
+SUBACCOUNT_1 = make_subaccount(
+    1,
+    [
+        make_position("ETH-PERP", 2, delta="1", gamma="0", vega="0", theta="0"),
+        make_position("ETH-20240329-2400-C", 1),
+        make_position("BTC-20240329-40000-P", -1, delta="-0.4"),
+    ],
+)
+SUBACCOUNT_2 = make_subaccount(
+    2,
+    [
+        make_position("ETH-20240329-2400-C", -3),
+        make_position("ETH-20240329-2600-C", 0),
+    ],
+    subaccount_value="500",
+)
+
 
 def freeze_time(lyra_client):
     ts = 1705439697008
@@ -36,3 +99,19 @@ def lyra_client_2():
     lyra_client.subaccount_id = lyra_client.fetch_subaccounts()[-1]['id']
     yield lyra_client
     lyra_client.cancel_all()
+
+
+@pytest.fixture
+def mock_exchange():
+    """A local exchange, so that tests run without a network."""
+    with MockExchange() as exchange:
+        yield exchange
+
+
+@pytest.fixture
+def mock_client(mock_exchange):
+    """A client pointed at the local exchange."""
+    lyra_client = LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST, logger=get_logger(), subaccount_id=5)
+    yield mock_exchange.connect(lyra_client)
+    if hasattr(lyra_client, "_ws"):
+        lyra_client._ws.close()
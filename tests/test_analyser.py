@@ -0,0 +1,134 @@
+"""
+Tests for the portfolio analyser, run against canned subaccount payloads.
+"""
+
+import pandas as pd
+import pytest
+
+from lyra.analyser import OrderAnalyser, PortfolioAnalyser
+from tests.conftest import SUBACCOUNT_1, SUBACCOUNT_2, make_position, make_subaccount
+
+
+def test_single_subaccount():
+    """Test the greeks are scaled by the position size."""
+    analyser = PortfolioAnalyser(SUBACCOUNT_1)
+    greeks = analyser.get_total_greeks("eth")
+    assert greeks["delta"] == pytest.approx(2.5)
+    assert greeks["vega"] == pytest.approx(2.5)
+    assert analyser.get_subaccount_value() == 1000
+
+
+def test_from_subaccounts():
+    """Test several subaccounts merge into a single cross-account view."""
+    analyser = PortfolioAnalyser.from_subaccounts([SUBACCOUNT_1, SUBACCOUNT_2])
+    assert analyser.get_subaccount_value() == 1500
+    assert len(analyser.get_open_positions("eth")) == 3
+    assert analyser.get_total_greeks("eth")["delta"] == pytest.approx(1.0)
+    by_subaccount = analyser.get_greeks_by_subaccount("eth")
+    assert by_subaccount.loc[1, "delta"] == pytest.approx(2.5)
+    assert by_subaccount.loc[2, "delta"] == pytest.approx(-1.5)
+
+
+def test_parse_instrument_names():
+    """Test instrument names are parsed into typed columns once, at construction."""
+    positions = PortfolioAnalyser(SUBACCOUNT_1).positions.set_index("instrument_name")
+    assert positions.loc["ETH-PERP", "currency"] == "ETH"
+    assert pd.isna(positions.loc["ETH-PERP", "expiry"])
+    assert positions.loc["ETH-20240329-2400-C", "strike"] == 2400
+    assert positions.loc["ETH-20240329-2400-C", "option_type"] == "C"
+    assert positions.loc["BTC-20240329-40000-P", "expiry"] == pd.Timestamp("2024-03-29 08:00", tz="UTC")
+    assert positions["amount"].dtype == "float64"
+
+
+def test_greeks_by_expiry():
+    """Test greeks can be grouped by currency and expiry."""
+    analyser = PortfolioAnalyser.from_subaccounts([SUBACCOUNT_1, SUBACCOUNT_2])
+    greeks = analyser.get_greeks_by(["currency", "expiry"])
+    assert greeks.loc[("ETH", pd.Timestamp("2024-03-29 08:00", tz="UTC")), "delta"] == pytest.approx(-1.0)
+    assert analyser.get_greeks_by(["currency", "expiry"]) is greeks
+
+
+def test_empty_portfolio():
+    """Test a subaccount without positions still analyses."""
+    analyser = PortfolioAnalyser(make_subaccount(3, []))
+    assert not len(analyser.get_open_positions("eth"))
+    assert analyser.get_total_greeks("eth")["delta"] == 0
+
+
+def test_scenario_pnl():
+    """Test the stress grid reprices perps and options across spot and vol shocks."""
+    as_of = pd.Timestamp("2024-01-29 08:00", tz="UTC")
+    subaccount = make_subaccount(
+        1,
+        [
+            make_position("ETH-PERP", 2, index_price="2000"),
+            make_position("ETH-20240329-2400-C", 10, index_price="2000", mark_price="60"),
+        ],
+    )
+    tickers = {"ETH-20240329-2400-C": {"option_pricing": {"iv": "0.6", "forward_price": "2010"}}}
+    analyser = PortfolioAnalyser(subaccount)
+    grid = analyser.get_scenario_pnl("eth", [-0.1, 0.0, 0.1], [-0.1, 0.0, 0.1], tickers=tickers, as_of=as_of)
+    assert grid.shape == (3, 3)
+    assert grid.loc[0.0, 0.0] == pytest.approx(0.0, abs=1e-9)
+    assert (grid.loc[0.1] > grid.loc[0.0]).all()
+    assert (grid[0.1] > grid[0.0]).all()
+    perp_only = grid.loc[0.1, 0.0] - grid.loc[0.0, 0.0]
+    assert perp_only > 2 * 2000 * 0.1
+
+    implied = analyser.get_scenario_pnl("eth", [0.0], [0.0], as_of=as_of)
+    assert implied.loc[0.0, 0.0] == pytest.approx(0.0, abs=1e-6)
+
+
+def make_order(instrument_name, direction, amount, filled_amount, average_price, order_fee="0", **kwargs):
+    """Build an order as returned by `private/get_orders`."""
+    order = {
+        "instrument_name": instrument_name,
+        "direction": direction,
+        "amount": str(amount),
+        "filled_amount": str(filled_amount),
+        "limit_price": str(average_price),
+        "average_price": str(average_price),
+        "order_fee": str(order_fee),
+        "order_status": "filled" if amount == filled_amount else "open",
+    }
+    order.update(kwargs)
+    return order
+
+
+ORDERS = [
+    make_order("ETH-PERP", "buy", 2, 2, 100, order_fee="1"),
+    make_order("ETH-PERP", "buy", 2, 1, 130),
+    make_order("ETH-PERP", "sell", 4, 2, 150, order_fee="1"),
+    make_order("BTC-PERP", "sell", 1, 0, 0),
+]
+
+
+def test_order_aggregates():
+    """Test fills are weighted by the filled amount and ratios are per instrument and side."""
+    aggregates = OrderAnalyser(ORDERS).get_aggregates()
+    eth_buys = aggregates.loc[("ETH-PERP", "buy")]
+    assert eth_buys["orders"] == 2
+    assert eth_buys["fill_ratio"] == pytest.approx(0.75)
+    assert eth_buys["average_fill_price"] == pytest.approx(110)
+    assert pd.isna(aggregates.loc[("BTC-PERP", "sell"), "average_fill_price"])
+
+    sides = OrderAnalyser(ORDERS).get_side_summary()
+    assert sides.loc["sell", "fill_ratio"] == pytest.approx(2 / 5)
+
+
+def test_order_realised_pnl():
+    """Test the pnl of the amount bought and sold back, net of fees."""
+    analyser = OrderAnalyser(ORDERS)
+    summary = analyser.get_instrument_summary()
+    assert summary.loc["ETH-PERP", "net_amount"] == 1
+    assert summary.loc["ETH-PERP", "realised_pnl"] == pytest.approx(2 * (150 - 110) - 2)
+    assert summary.loc["BTC-PERP", "realised_pnl"] == 0
+    assert analyser.get_realised_pnl() == pytest.approx(78)
+
+
+def test_order_analyser_without_orders():
+    """Test an empty history gives empty frames."""
+    analyser = OrderAnalyser([])
+    assert analyser.get_aggregates().empty
+    assert analyser.get_instrument_summary().empty
+    assert analyser.get_realised_pnl() == 0
@@ -0,0 +1,30 @@
+"""
+Smoke tests for the benchmark suite, each benchmark runs for a couple of iterations.
+"""
+
+import pytest
+
+from benchmarks.harness import Benchmark, compare_results, measure
+from benchmarks.hot_paths import BENCHMARKS, run
+
+
+def test_measure():
+    """Test throughput counts every operation of an iteration."""
+    result = measure(Benchmark(lambda: None, ops=10), min_time=0, min_iterations=5)
+    assert result["iterations"] == 5
+    assert result["ops_per_sec"] > 0
+    assert result["p50_us"] <= result["p90_us"] <= result["p99_us"]
+
+
+@pytest.mark.parametrize("name", [n for n in BENCHMARKS if n != "cli_import"])
+def test_benchmarks_run_offline(name):
+    """Test every benchmark runs against the fixtures and the mock exchange."""
+    results = run([name], min_time=0, min_iterations=2)
+    assert results["cases"][name]["iterations"] == 2
+
+
+def test_compare_results():
+    """Test ratios are above one when the new results are faster."""
+    baseline = {"cases": {"a": {"ops_per_sec": 100.0, "p50_us": 20.0}}}
+    results = {"cases": {"a": {"ops_per_sec": 200.0, "p50_us": 10.0}, "b": {"ops_per_sec": 1.0, "p50_us": 1.0}}}
+    assert compare_results(results, baseline) == {"a": {"ops_per_sec": 2.0, "p50_us": 2.0}}
@@ -0,0 +1,147 @@
+"""
+Tests for bulk order submission, run against a fake ws.
+"""
+
+import random
+
+from lyra.bulk import BulkOrderSubmitter, ResultWriter, check_order, read_orders
+from lyra.codec import dumps, loads
+from lyra.enums import Environment
+from lyra.lyra import LyraClient
+from tests.conftest import TEST_PRIVATE_KEY
+
+INSTRUMENT = {
+    "instrument_name": "ETH-PERP",
+    "is_active": True,
+    "base_asset_sub_id": "0",
+    "tick_size": "0.01",
+    "minimum_amount": "0.1",
+    "amount_step": "0.01",
+}
+
+ORDERS_CSV = """instrument_name,side,price,amount,label
+ETH-PERP,buy,2000,1,grid
+ETH-PERP,sell,2100.005,1,grid
+ETH-PERP,sell,2100,0.5,
+BTC-FAKE,buy,1,1,
+"""
+
+
+class PipelinedWs:
+    """Answers order requests, but only once asked to receive, so requests pile up in flight."""
+
+    connected = True
+
+    def __init__(self):
+        self.sent = []
+        self.unanswered = []
+        self.max_in_flight = 0
+
+    def send(self, data):
+        message = loads(data)
+        self.sent.append(message)
+        self.unanswered.append(message)
+        self.max_in_flight = max(self.max_in_flight, len(self.unanswered))
+
+    def recv(self):
+        message = self.unanswered.pop(0)
+        if message["method"] != "private/order":
+            return dumps({"id": message["id"], "result": {}})
+        order = {"order_id": f"order-{message['params']['nonce']}", "order_status": "open"}
+        return dumps({"id": message["id"], "result": {"order": order}})
+
+
+def make_client(ws):
+    client = LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    client.instruments["ETH-PERP"] = INSTRUMENT
+    client._ws = ws
+    return client
+
+
+def test_read_orders(tmp_path):
+    """Test orders stream from csv and json lines files, tagged with their line."""
+    csv_path = tmp_path / "orders.csv"
+    csv_path.write_text(ORDERS_CSV)
+    orders = list(read_orders(csv_path))
+    assert len(orders) == 4
+    assert orders[0] == {
+        "instrument_name": "ETH-PERP",
+        "side": "buy",
+        "price": "2000",
+        "amount": "1",
+        "label": "grid",
+        "line": 2,
+    }
+    assert "label" not in orders[2]
+
+    jsonl_path = tmp_path / "orders.jsonl"
+    jsonl_path.write_text("\n".join(dumps(o) for o in orders) + "\n")
+    assert [o["price"] for o in read_orders(jsonl_path)] == [o["price"] for o in orders]
+
+
+def test_check_order():
+    """Test orders are checked against the instrument details."""
+    order = {"instrument_name": "ETH-PERP", "side": "buy", "price": "2000.01", "amount": "0.25"}
+    assert check_order(order, INSTRUMENT) is None
+    assert check_order({**order, "price": "2000.015"}, INSTRUMENT).startswith("price")
+    assert "minimum" in check_order({**order, "amount": "0.05"}, INSTRUMENT)
+    assert check_order({**order, "side": "hold"}, INSTRUMENT) == "invalid side hold"
+    assert check_order(order, None) == "unknown instrument ETH-PERP"
+
+
+def test_bulk_submit(tmp_path):
+    """Test valid orders are pipelined within the window and every order gets a result."""
+    ws = PipelinedWs()
+    client = make_client(ws)
+    client._authenticated_ws = ws
+    orders = [
+        {"instrument_name": "ETH-PERP", "side": "buy", "price": "2000", "amount": "1", "line": i} for i in range(7)
+    ]
+    orders.append({"instrument_name": "ETH-PERP", "side": "buy", "price": "-1", "amount": "1", "line": 7})
+
+    results = list(BulkOrderSubmitter(client, window=3, max_workers=2).submit(orders))
+
+    assert sorted(r["line"] for r in results) == list(range(8))
+    assert [r["status"] for r in results if r["line"] == 7] == ["rejected"]
+    assert {r["status"] for r in results if r["line"] != 7} == {"ok"}
+    assert ws.max_in_flight == 3
+    nonces = [m["params"]["nonce"] for m in ws.sent]
+    assert len(set(nonces)) == len(nonces) == 7
+
+    path = tmp_path / "results.csv"
+    with ResultWriter(path) as writer:
+        for result in results:
+            writer.write(result)
+    assert len(path.read_text().splitlines()) == 9
+
+
+def test_clients_start_nonces_apart():
+    """Test clients on one wallet don't share nonces for orders defined in the same millisecond."""
+    random.seed(0)
+    clients = [make_client(PipelinedWs()) for _ in range(2)]
+    clients[1].subaccount_id = 6
+    nonces = [next(client.nonces) for client in clients]
+    assert nonces[0] != nonces[1]
+    assert all(0 <= nonce < 1000 for nonce in nonces)
+
+
+def test_bulk_dry_run():
+    """Test a dry run signs the orders without sending them."""
+    ws = PipelinedWs()
+    orders = [{"instrument_name": "ETH-PERP", "side": "sell", "price": "2000", "amount": "1", "line": 1}]
+    results = list(BulkOrderSubmitter(make_client(ws), dry_run=True).submit(orders))
+    assert [r["status"] for r in results] == ["signed"]
+    assert ws.sent == []
+
+
+def test_bulk_rejects_expired_options():
+    """Test orders on expired options are rejected before they are signed."""
+    ws = PipelinedWs()
+    client = make_client(ws)
+    client._authenticated_ws = ws
+    client.instruments["ETH-20240329-2400-C"] = {**INSTRUMENT, "instrument_name": "ETH-20240329-2400-C"}
+    orders = [{"instrument_name": "ETH-20240329-2400-C", "side": "buy", "price": "50", "amount": "1", "line": 2}]
+
+    results = list(BulkOrderSubmitter(client).submit(orders))
+    assert [(r["status"], r["error"]) for r in results] == [("rejected", "instrument ETH-20240329-2400-C has expired")]
+    assert ws.sent == []
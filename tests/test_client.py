@@ -0,0 +1,63 @@
+"""
+Tests for the client set up, run without a network.
+"""
+
+import pytest
+
+from lyra import base_client
+from lyra.async_client import AsyncClient
+from lyra.codec import dumps, loads
+from lyra.enums import Environment
+from lyra.lyra import LyraClient
+from tests.conftest import TEST_PRIVATE_KEY
+
+
+class FakeWs:
+    """Stands in for a websocket connection, answering every request with an empty result."""
+
+    connected = True
+
+    def __init__(self):
+        self.sent = []
+        self.responses = []
+
+    def send(self, data):
+        message = loads(data)
+        self.sent.append(message)
+        self.responses.append(dumps({"id": message["id"], "result": {}}))
+
+    def recv(self):
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    """Fail loudly on any network io."""
+
+    def fail(*args, **kwargs):
+        raise AssertionError("unexpected network io")
+
+    monkeypatch.setattr(base_client.requests, "post", fail)
+    monkeypatch.setattr(base_client, "create_connection", fail)
+
+
+@pytest.mark.parametrize("client_class", [LyraClient, AsyncClient])
+def test_construction_is_offline(no_network, client_class):
+    """Test building a client does no network io."""
+    client = client_class(TEST_PRIVATE_KEY, env=Environment.TEST)
+    assert client.wallet == client.signer.address
+
+
+def test_warmup(monkeypatch):
+    """Test warmup discovers the subaccount and logs in, and later requests reuse the login."""
+    ws = FakeWs()
+    monkeypatch.setattr(base_client, "create_connection", lambda *args, **kwargs: ws)
+    client = LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+    monkeypatch.setattr(client, "fetch_subaccounts", lambda: {"subaccount_ids": [42, 43]})
+
+    client.warmup()
+    assert client.subaccount_id == 42
+    assert [m["method"] for m in ws.sent] == ["public/login"]
+
+    client.cancel(order_id="1", instrument_name="ETH-PERP")
+    assert [m["method"] for m in ws.sent] == ["public/login", "private/cancel"]
@@ -0,0 +1,38 @@
+"""
+Tests for the json codec.
+"""
+
+import pytest
+
+from lyra.codec import dumpb, dumps, loads
+
+MESSAGE = {
+    "method": "subscription",
+    "params": {
+        "channel": "orderbook.ETH-PERP.1.100",
+        "data": {"bids": [["2000.5", "1.2"]], "asks": [], "timestamp": 1705439697008, "publish_id": 12},
+    },
+}
+
+
+@pytest.mark.parametrize("encoded", [dumps(MESSAGE), dumpb(MESSAGE), bytearray(dumpb(MESSAGE))])
+def test_round_trip(encoded):
+    """Test we decode str and bytes payloads to the same message."""
+    assert loads(encoded) == MESSAGE
+
+
+def test_decode_memoryview():
+    """Test we decode frames without copying them to a str first."""
+    assert loads(memoryview(dumpb(MESSAGE))) == MESSAGE
+
+
+def test_dumps_wide_ints():
+    """Test ints wider than 64 bits are still encoded."""
+    assert loads(dumps({"sub_id": 2**70}))["sub_id"] == 2**70
+
+
+@pytest.mark.parametrize("value", [2**64, 2**70, -(2**63) - 1, 2**63 - 1, -(2**63)])
+@pytest.mark.parametrize("encode", [dumps, dumpb, lambda obj: memoryview(dumpb(obj))])
+def test_loads_wide_ints_exactly(value, encode):
+    """Test ints at and beyond the 64 bit limits decode exactly, whatever the payload type."""
+    assert loads(encode({"amount": value, "ids": [1, value]})) == {"amount": value, "ids": [1, value]}
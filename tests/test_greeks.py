@@ -0,0 +1,54 @@
+"""
+Tests for the incremental greeks engine.
+"""
+
+import pytest
+
+from lyra.analyser import PortfolioAnalyser
+from lyra.greeks import ALL_EXPIRIES, GreeksEngine
+from tests.conftest import SUBACCOUNT_1, SUBACCOUNT_2
+
+
+def make_ticker(instrument_name, delta, gamma="0.001", vega="2.5", theta="-1.5"):
+    """Build a ticker as published on the ticker channel."""
+    return {
+        "instrument_ticker": {
+            "instrument_name": instrument_name,
+            "option_pricing": {"delta": delta, "gamma": gamma, "vega": vega, "theta": theta},
+        }
+    }
+
+
+def test_matches_analyser():
+    """Test the engine agrees with a full rebuild of the portfolio."""
+    engine = GreeksEngine(capacity=1)
+    for subaccount in (SUBACCOUNT_1, SUBACCOUNT_2):
+        engine.load_subaccount(subaccount)
+    analyser = PortfolioAnalyser.from_subaccounts([SUBACCOUNT_1, SUBACCOUNT_2])
+    for currency in ("eth", "btc"):
+        expected = analyser.get_total_greeks(currency)
+        totals = engine.get_totals(currency)
+        for greek, value in totals.items():
+            assert value == pytest.approx(expected[greek])
+
+
+def test_incremental_updates():
+    """Test position and ticker deltas update the running totals and fire callbacks."""
+    engine = GreeksEngine()
+    changes = []
+    engine.on_change(lambda key, totals: changes.append((key, totals)))
+    engine.load_subaccount(SUBACCOUNT_1)
+    changes.clear()
+
+    engine.apply_ticker(make_ticker("ETH-20240329-2400-C", delta="0.6"))
+    assert changes == [(("ETH", "20240329"), pytest.approx({"delta": 0.6, "gamma": 0.001, "vega": 2.5, "theta": -1.5}))]
+    assert engine.get_totals("eth")["delta"] == pytest.approx(2.6)
+
+    assert engine.get_totals("eth", expiry=None)["delta"] == pytest.approx(2)
+    engine.apply_position("ETH-PERP", 0, subaccount_id=1)
+    assert engine.get_totals("eth", expiry=None)["delta"] == pytest.approx(0)
+    assert engine.get_totals("eth", expiry=ALL_EXPIRIES)["delta"] == pytest.approx(0.6)
+    assert engine.get_totals("eth", expiry="20240329")["delta"] == pytest.approx(0.6)
+
+    engine.recompute()
+    assert engine.get_totals("btc")["delta"] == pytest.approx(0.4)
@@ -0,0 +1,70 @@
+"""
+Tests for the client metrics and their exporters.
+"""
+
+import pytest
+
+from lyra.codec import loads
+from lyra.enums import Environment, OrderSide
+from lyra.lyra import LyraClient
+from lyra.metrics import (
+    EXPORTERS,
+    MESSAGES_RECEIVED,
+    NULL_METRICS,
+    RPC_LATENCY,
+    STAGE_LATENCY,
+    Histogram,
+    Metrics,
+    register_exporter,
+)
+from tests.conftest import TEST_PRIVATE_KEY
+
+
+def test_histogram():
+    """Test observations land in the bucket of their upper bound, quantiles report that bound."""
+    histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+    for value in [0.0005, 0.005, 0.005, 0.05, 1.0]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(1.0) == float("inf")
+    assert histogram.sum == pytest.approx(1.0605)
+
+
+def test_exporters():
+    """Test the prometheus text has cumulative buckets, and custom exporters can be registered."""
+    metrics = Metrics(buckets=(0.01, 0.1))
+    metrics.observe(RPC_LATENCY, 0.05, method="private/order")
+    metrics.inc(MESSAGES_RECEIVED, 3)
+    text = metrics.export("prometheus")
+    assert 'lyra_rpc_latency_seconds_bucket{method="private/order",le="+Inf"} 1' in text
+    assert 'lyra_rpc_latency_seconds_bucket{method="private/order",le="0.01"} 0' in text
+    assert "lyra_messages_received_total 3" in text
+    assert loads(metrics.export("json"))["counters"] == [{"name": MESSAGES_RECEIVED, "labels": {}, "value": 3}]
+
+    register_exporter("count", lambda metrics: len(metrics.histograms))
+    assert metrics.export("count") == 1
+    del EXPORTERS["count"]
+
+
+def test_null_metrics():
+    """Test the off switch records nothing."""
+    with NULL_METRICS.stage("sign"):
+        pass
+    NULL_METRICS.inc(MESSAGES_RECEIVED)
+    assert NULL_METRICS.snapshot() == {"histograms": [], "counters": []}
+    assert LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST).metrics is NULL_METRICS
+
+
+def test_client_records_stages_and_rpc_latency(mock_exchange):
+    """Test placing an order records every stage and the latency of each rpc method."""
+    metrics = Metrics()
+    client = mock_exchange.connect(LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5, metrics=metrics))
+    client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+    client.ws.close()
+
+    stages = {dict(labels)["stage"] for name, labels in metrics.histograms if name == STAGE_LATENCY}
+    assert stages == {"define", "encode", "sign", "send"}
+    methods = {dict(labels)["method"] for name, labels in metrics.histograms if name == RPC_LATENCY}
+    assert methods == {"public/login", "private/order"}
+    assert metrics.counter(MESSAGES_RECEIVED).value == 2
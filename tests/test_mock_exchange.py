@@ -0,0 +1,193 @@
+"""
+Tests running the clients against the local mock exchange.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from lyra import base_client
+from lyra.async_client import AsyncClient
+from lyra.enums import Environment, InstrumentType, OrderSide, UnderlyingCurrency
+from lyra.lyra import LyraClient
+from lyra.mock_exchange import MockExchange
+from lyra.replay import ReplayTransport, make_instrument
+from tests.conftest import TEST_PRIVATE_KEY
+
+
+def test_rest_endpoints(mock_client):
+    """Test the REST endpoints used by the client are served."""
+    instruments = mock_client.fetch_instruments(instrument_type=InstrumentType.PERP, currency=UnderlyingCurrency.ETH)
+    assert [i["instrument_name"] for i in instruments] == ["ETH-PERP"]
+    assert mock_client.fetch_subaccounts()["subaccount_ids"] == [5]
+    assert mock_client.fetch_ticker("ETH-PERP")["best_bid_price"] == "1998.00"
+
+
+def test_order_and_cancel(mock_client, mock_exchange):
+    """Test an order is placed over a logged in ws, shows in the history and can be cancelled."""
+    order = mock_client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+    assert order["order_status"] == "open"
+    assert [r["method"] for r in mock_exchange.requests if not r["method"].startswith("public/get")] == [
+        "public/login",
+        "private/order",
+    ]
+    assert [o["order_id"] for o in mock_client.iter_orders()] == [order["order_id"]]
+    assert mock_client.cancel(order["order_id"], "ETH-PERP")["order_status"] == "cancelled"
+
+
+def test_private_methods_need_login(mock_client):
+    """Test private ws methods are refused on a connection which has not logged in."""
+    id = mock_client._send_rpc("private/cancel_all", {"subaccount_id": 5})
+    assert mock_client._recv_rpc() == {"id": id, "error": {"code": 14000, "message": "Not authenticated"}}
+
+
+def test_rate_limit():
+    """Test requests beyond the rate limit are refused."""
+    with MockExchange(rate_limit=2) as exchange:
+        client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+        exchange.connect(client)
+
+        async def run():
+            futures = [
+                await client._send_request("public/get_ticker", {"instrument_name": "ETH-PERP"}) for _ in range(4)
+            ]
+            responses = await asyncio.gather(*futures)
+            await client.close()
+            return responses
+
+        responses = asyncio.run(run())
+    assert ["error" in r for r in responses] == [False, False, True, True]
+
+
+def test_latency_and_order_book_feed():
+    """Test responses are delayed by the latency, and order book channels publish updates."""
+    with MockExchange(latency=0.05, feed_interval=0.01) as exchange:
+        client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+        exchange.connect(client)
+
+        async def run():
+            start = time.perf_counter()
+            await client.fetch_ticker("ETH-PERP")
+            elapsed = time.perf_counter() - start
+            book = await client.watch_order_book("ETH-PERP", depth="10")
+            await client.close()
+            return elapsed, book
+
+        elapsed, book = asyncio.run(run())
+    assert elapsed == pytest.approx(0.05, abs=0.04)
+    assert len(book["bids"]) == 10
+    assert book["bids"][0] == (1998.0, 1.0)
+
+
+def test_cancel_all_reuses_the_login(mock_client, mock_exchange):
+    """Test cancel all is sent on the already authenticated ws, without logging in again."""
+    mock_client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+    mock_client.cancel_all()
+    assert [r["method"] for r in mock_exchange.requests if not r["method"].startswith("public/get")] == [
+        "public/login",
+        "private/order",
+        "private/cancel_all",
+    ]
+    assert {o["order_status"] for o in mock_exchange.orders.values()} == {"cancelled"}
+
+
+def test_responses_to_other_requests_are_kept(mock_client):
+    """Test waiting on one request keeps the responses of others in flight, rather than dropping them."""
+    first = mock_client._send_rpc("public/get_ticker", {"instrument_name": "ETH-PERP"})
+    second = mock_client._send_rpc("public/get_ticker", {"instrument_name": "ETH-PERP"})
+    assert mock_client._wait_rpc(second)["id"] == second
+    assert mock_client._recv_rpc()["id"] == first
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_kill_switch(mock_exchange, use_async):
+    """Test the kill switch fans out a cancel per subaccount and instrument, timing each."""
+    client_class = AsyncClient if use_async else LyraClient
+    client = mock_exchange.connect(client_class(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+    subaccounts, instruments = [5, 6], ["ETH-PERP", "BTC-PERP"]
+
+    async def run():
+        await client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        results = await client.kill_switch(subaccounts, instruments)
+        await client.close()
+        return results
+
+    if use_async:
+        results = asyncio.run(run())
+    else:
+        client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        results = client.kill_switch(subaccounts, instruments)
+        client.ws.close()
+    assert sorted((r["subaccount_id"], r["instrument_name"]) for r in results) == sorted(
+        (s, i) for s in subaccounts for i in instruments
+    )
+    assert {r["status"] for r in results} == {"ok"}
+    assert all(r["seconds"] > 0 for r in results)
+    assert [r["method"] for r in mock_exchange.requests].count("public/login") == 1
+    assert {o["order_status"] for o in mock_exchange.orders.values()} == {"cancelled"}
+
+
+@pytest.mark.parametrize("supports_replace", [True, False])
+def test_replace_orders(mock_client, mock_exchange, supports_replace):
+    """Test a ladder is replaced in one batch, falling back to a cancel and an order without a replace method."""
+    if not supports_replace:
+        del mock_exchange.methods["private/replace"]
+    ladder = [
+        mock_client.create_order(price=price, amount=1, instrument_name="ETH-PERP", side=OrderSide.SELL)
+        for price in (2010, 2020)
+    ]
+    orders = {order["order_id"]: order for order in ladder}
+    results = mock_client.replace_orders([(order["order_id"], 2005 + i, 2) for i, order in enumerate(ladder)], orders)
+
+    assert [r["order_id_to_cancel"] for r in results] == list(orders)
+    assert [r["cancelled_order"]["order_status"] for r in results] == ["cancelled", "cancelled"]
+    assert [(r["order"]["limit_price"], r["order"]["amount"], r["order"]["direction"]) for r in results] == [
+        ("2005", "2", "sell"),
+        ("2006", "2", "sell"),
+    ]
+    assert not any(r["error"] for r in results)
+    methods = [
+        r["method"] for r in mock_exchange.requests if r["method"] not in ("public/get_instruments", "private/order")
+    ]
+    fallback = ["private/cancel"] * 2 if not supports_replace else []
+    assert methods == ["public/login", "private/replace", "private/replace"] + fallback
+    assert mock_client.supports_replace is supports_replace
+
+
+def test_replace_tracked_orders():
+    """Test the async client replaces the orders it tracks, which follow the replacement."""
+    replay = ReplayTransport([], close_at_end=False, autostart=False, instruments=[make_instrument("ETH-PERP")])
+    client = replay.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+
+    async def settle():
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def run():
+        tracker = await client.track_orders(seed=False)
+        order = await client.create_order(price=1990, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        await settle()
+        [result] = await client.replace_orders([(order["order_id"], 1995, 1.5)])
+        await settle()
+        await client.close()
+        return tracker, order, result
+
+    tracker, order, result = asyncio.run(run())
+    assert tracker.get(order["order_id"])["order_status"] == "cancelled"
+    assert list(tracker.open_orders("ETH-PERP")) == [result["order"]["order_id"]]
+    assert (result["order"]["limit_price"], result["order"]["amount"]) == ("1995", "1.5")
+
+
+def test_async_create_order_fetches_instruments_over_the_ws(mock_exchange, monkeypatch):
+    """Test the async client fills its instrument cache over the ws, never blocking the loop on REST."""
+    client = mock_exchange.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+    monkeypatch.setattr(base_client.requests, "post", lambda *args, **kwargs: pytest.fail("blocking REST request"))
+
+    async def run():
+        order = await client.create_order(price=2000, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        await client.close()
+        return order
+
+    assert asyncio.run(run())["order_status"] == "open"
+    assert "ETH-PERP" in client.instruments
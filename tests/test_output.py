@@ -0,0 +1,97 @@
+"""
+Tests for the machine readable cli output.
+"""
+
+import csv
+import inspect
+import io
+
+from click.testing import CliRunner
+
+from lyra import cli as cli_module
+from lyra import streaming
+from lyra.cli import cli
+from lyra.codec import loads
+from lyra.output import write_records
+
+RECORDS = [
+    {"instrument_name": "ETH-PERP", "amount": "1", "leverage": None},
+    {"instrument_name": "BTC-PERP", "amount": "2", "extra": {"nested": True}},
+]
+
+
+def make_runner():
+    """A runner keeping stderr apart from stdout, which is the default from click 8.2."""
+    if "mix_stderr" in inspect.signature(CliRunner).parameters:
+        return CliRunner(mix_stderr=False)
+    return CliRunner()
+
+
+class FakeClient:
+    """Serves canned orders page by page, recording how far the pages were consumed."""
+
+    def __init__(self, orders):
+        self.orders = orders
+        self.pages = 0
+
+    def fetch_instruments(self, instrument_type, currency):
+        return RECORDS
+
+    def iter_orders(self, instrument_name=None, label=None, page_size=100, status=None, max_orders=None):
+        for start in range(0, len(self.orders), page_size):
+            self.pages += 1
+            yield from self.orders[start:][:page_size]
+
+
+def test_write_jsonl():
+    """Test every record is written as a json line."""
+    stream = io.StringIO()
+    assert write_records(iter(RECORDS), "jsonl", stream) == 2
+    assert [loads(line) for line in stream.getvalue().splitlines()] == RECORDS
+
+
+def test_write_csv():
+    """Test csv takes its header from the first record and writes nested values as json."""
+    stream = io.StringIO()
+    write_records(RECORDS, "csv", stream)
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+    assert list(rows[0]) == ["instrument_name", "amount", "leverage"]
+    assert rows[1] == {"instrument_name": "BTC-PERP", "amount": "2", "leverage": ""}
+
+
+def test_cli_format_jsonl():
+    """Test a machine readable format keeps stdout for the records only."""
+    client = FakeClient([])
+    result = make_runner().invoke(cli, ["--format", "jsonl", "instruments", "fetch"], obj={"client": client})
+    assert result.exit_code == 0, result.output
+    assert [loads(line) for line in result.stdout.splitlines()] == RECORDS
+
+
+def test_cli_orders_stream_every_page():
+    """Test orders are streamed across every page and filtered as they arrive."""
+    orders = [{"order_id": str(i), "instrument_name": "ETH-PERP" if i % 2 else "BTC-PERP"} for i in range(5)]
+    client = FakeClient(orders)
+    args = ["--format", "csv", "orders", "fetch", "--page-size", "2", "--regex", "ETH"]
+    result = make_runner().invoke(cli, args, obj={"client": client})
+    assert result.exit_code == 0, result.output
+    assert client.pages == 3
+    assert [row["order_id"] for row in csv.DictReader(io.StringIO(result.stdout))] == ["1", "3"]
+
+
+def test_cli_watch_format_jsonl(monkeypatch):
+    """Test the global jsonl format writes streamed updates to stdout, as `--jsonl` does."""
+    update = ("ticker.ETH-PERP.1000", {"timestamp": 1, "instrument_ticker": {"instrument_name": "ETH-PERP"}})
+
+    async def watch_channels(client, channels, handlers, duration=None):
+        for handler in handlers:
+            handler(*update)
+
+    monkeypatch.setattr(cli_module, "get_async_client", lambda ctx: None)
+    monkeypatch.setattr(streaming, "watch_channels", watch_channels)
+    for args in (["--format", "jsonl", "tickers", "watch", "ETH-PERP"], ["tickers", "watch", "ETH-PERP", "--jsonl"]):
+        result = make_runner().invoke(cli, args, obj={})
+        assert result.exit_code == 0, result.output
+        assert [loads(line) for line in result.stdout.splitlines()] == [{"channel": update[0], "data": update[1]}]
+
+    result = make_runner().invoke(cli, ["--format", "csv", "tickers", "watch", "ETH-PERP"], obj={})
+    assert result.exit_code != 0
@@ -0,0 +1,49 @@
+"""
+Tests for streaming order pagination.
+"""
+
+import pytest
+
+from lyra.enums import Environment
+from lyra.http_client import HttpClient
+from tests.conftest import TEST_PRIVATE_KEY
+
+NUM_ORDERS = 250
+PAGE_SIZE = 100
+
+
+def fake_orders_page(instrument_name=None, label=None, page=1, page_size=PAGE_SIZE, status=None):
+    """Serve a newest-first order history, one page at a time."""
+    start = (page - 1) * page_size
+    orders = [
+        {"order_id": str(i), "creation_timestamp": 10_000 - i} for i in range(start, min(start + page_size, NUM_ORDERS))
+    ]
+    num_pages = -(-NUM_ORDERS // page_size)
+    return {"orders": orders, "pagination": {"num_pages": num_pages, "count": NUM_ORDERS}}
+
+
+@pytest.fixture
+def paging_client():
+    client = HttpClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    client._fetch_orders_page = fake_orders_page
+    return client
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iter_order_pages(paging_client, prefetch):
+    """Test we walk every page of the history."""
+    pages = list(paging_client.iter_order_pages(page_size=PAGE_SIZE, prefetch=prefetch))
+    assert [len(p) for p in pages] == [100, 100, 50]
+
+
+def test_iter_orders_max_orders(paging_client):
+    """Test we stop at the requested count."""
+    orders = list(paging_client.iter_orders(page_size=PAGE_SIZE, max_orders=120))
+    assert len(orders) == 120
+    assert orders[-1]["order_id"] == "119"
+
+
+def test_iter_orders_since(paging_client):
+    """Test we stop once orders older than the time bound are reached."""
+    orders = list(paging_client.iter_orders(page_size=PAGE_SIZE, since=10_000 - 149))
+    assert len(orders) == 150
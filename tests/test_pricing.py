@@ -0,0 +1,30 @@
+"""
+Tests for the Black-76 pricing helpers.
+"""
+
+import numpy as np
+import pytest
+
+from lyra.pricing import black76_price, implied_vol, norm_cdf
+
+
+def test_norm_cdf():
+    """Test the normal cdf approximation against known values."""
+    assert norm_cdf(np.array([-1.96, 0.0, 1.0])) == pytest.approx([0.0249979, 0.5, 0.8413447], abs=1e-6)
+
+
+def test_black76_put_call_parity():
+    """Test calls and puts price consistently."""
+    forward, strike, time, vol = 100.0, np.array([80.0, 100.0, 120.0]), 1.0, 0.2
+    call = black76_price(forward, strike, time, vol, True)
+    put = black76_price(forward, strike, time, vol, False)
+    assert call[1] == pytest.approx(7.9656, abs=1e-4)
+    assert call - put == pytest.approx(forward - strike)
+
+
+def test_implied_vol_round_trip():
+    """Test we recover the vol used to price an option."""
+    vols = np.array([0.3, 0.6, 1.2])
+    is_call = np.array([True, False, True])
+    prices = black76_price(2000.0, 2200.0, 0.25, vols, is_call)
+    assert implied_vol(prices, 2000.0, 2200.0, 0.25, is_call) == pytest.approx(vols, abs=1e-4)
@@ -0,0 +1,146 @@
+"""
+Tests for recording channel updates and reading them back.
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+from lyra.async_client import AsyncClient
+from lyra.enums import Environment
+from lyra.mock_exchange import MockExchange
+from lyra.recorder import ASK, BID, MARK, ORDERBOOK, RECORD_DTYPE, TICKER, MarketDataReader, MarketDataRecorder
+from lyra.streaming import get_order_book_channel, watch_channels
+from tests.conftest import TEST_PRIVATE_KEY
+
+ETH_BOOK = get_order_book_channel("ETH-PERP")
+BTC_BOOK = get_order_book_channel("BTC-PERP")
+
+
+def make_book(timestamp, publish_id, bids, asks):
+    return {"timestamp": timestamp, "publish_id": publish_id, "bids": bids, "asks": asks}
+
+
+UPDATES = [
+    (ETH_BOOK, make_book(1000, 1, [["2000", "1"], ["1999", "2"]], [["2001", "1.5"]])),
+    (BTC_BOOK, make_book(1001, 1, [["40000", "0.1"]], [["40010", "0.2"]])),
+    (ETH_BOOK, make_book(2000, 2, [["2002", "3"]], [])),
+    (
+        "ticker.ETH-PERP.1000",
+        {
+            "timestamp": 2500,
+            "instrument_ticker": {"best_bid_price": "2002", "best_bid_amount": "3", "mark_price": "2002.5"},
+        },
+    ),
+    (ETH_BOOK, make_book(3000, 3, [["2003", "1"]], [["2004", "1"]])),
+]
+
+
+def record(directory, updates, **kwargs):
+    with MarketDataRecorder(directory, **kwargs) as recorder:
+        for channel, data in updates:
+            recorder(channel, data)
+    return recorder
+
+
+def test_records_are_fixed_width(tmp_path):
+    """Test every level is written as one fixed-width record."""
+    recorder = record(tmp_path, UPDATES)
+    assert RECORD_DTYPE.itemsize == 40
+    assert recorder.records == 10
+    assert recorder.files[0].stat().st_size == 10 * RECORD_DTYPE.itemsize
+
+
+def test_read_by_instrument_and_time(tmp_path):
+    """Test the reader filters the memory mapped records by instrument, time and kind."""
+    record(tmp_path, UPDATES)
+    reader = MarketDataReader(tmp_path)
+    assert reader.instruments == ["BTC-PERP", "ETH-PERP"]
+
+    btc = reader.read("BTC-PERP")
+    assert btc["price"].tolist() == [40000, 40010]
+    assert btc["side"].tolist() == [BID, ASK]
+
+    eth = reader.read("ETH-PERP", start=2000, end=3000)
+    assert eth["timestamp"].tolist() == [2000, 2500, 2500]
+    assert eth["kind"].tolist() == [ORDERBOOK, TICKER, TICKER]
+    assert eth["side"][1:].tolist() == [BID, MARK]
+    assert len(reader.read("ETH-PERP", kind=ORDERBOOK)) == 6
+
+
+def test_read_out_of_order_channels(tmp_path):
+    """Test records of channels whose timestamps interleave are all read back by time."""
+    record(
+        tmp_path,
+        [
+            (ETH_BOOK, make_book(1000, 1, [["2000", "1"]], [])),
+            (ETH_BOOK, make_book(1010, 2, [["2001", "1"]], [])),
+            (ETH_BOOK, make_book(1020, 3, [["2002", "1"]], [])),
+            (BTC_BOOK, make_book(500, 1, [["40000", "1"]], [])),
+            (ETH_BOOK, make_book(1030, 4, [["2003", "1"]], [])),
+        ],
+    )
+    reader = MarketDataReader(tmp_path)
+    assert reader.read("BTC-PERP", end=600)["timestamp"].tolist() == [500]
+    assert reader.read(start=1010, end=1030)["timestamp"].tolist() == [1010, 1020]
+    assert [data["timestamp"] for _, data in reader.updates(end=1015)] == [500, 1000, 1010]
+
+
+def test_book_at(tmp_path):
+    """Test a book is rebuilt from the last update of each side."""
+    record(tmp_path, UPDATES)
+    reader = MarketDataReader(tmp_path)
+    assert reader.book_at("ETH-PERP", 1500) == {
+        "timestamp": 1000,
+        "bids": [(2000.0, 1.0), (1999.0, 2.0)],
+        "asks": [(2001.0, 1.5)],
+    }
+    book = reader.book_at("ETH-PERP", 2999)
+    assert book["bids"] == [(2002.0, 3.0)]
+    assert book["asks"] == [(2001.0, 1.5)]
+    assert reader.book_at("ETH-PERP", 999)["timestamp"] is None
+
+
+def test_rotation(tmp_path):
+    """Test files rotate at the size limit and read back as one log."""
+    recorder = MarketDataRecorder(tmp_path, max_file_bytes=4 * RECORD_DTYPE.itemsize, flush_interval=0.01).start()
+    for channel, data in UPDATES:
+        recorder(channel, data)
+        time.sleep(0.02)  # a batch per update
+    recorder.close()
+    assert len(recorder.files) > 1
+    reader = MarketDataReader(tmp_path)
+    records = reader.read()
+    assert len(records) == 10
+    assert np.all(np.diff(records["timestamp"]) >= 0)
+    assert reader.read("BTC-PERP")["price"].tolist() == [40000, 40010]
+
+
+def test_read_while_recording(tmp_path):
+    """Test a file still being recorded reads back, and files without a sidecar are skipped."""
+    (tmp_path / "market-data-0.bin").write_bytes(b"\0" * RECORD_DTYPE.itemsize)
+    recorder = MarketDataRecorder(tmp_path, flush_interval=0.01).start()
+    for channel, data in UPDATES[:2]:
+        recorder(channel, data)
+    deadline = time.monotonic() + 5
+    while recorder.records < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        reader = MarketDataReader(tmp_path)
+        assert reader.instruments == ["BTC-PERP", "ETH-PERP"]
+        assert len(reader.read()) == 5
+        assert reader.read("ETH-PERP", start=1000, end=1001)["price"].tolist() == [2000, 1999, 2001]
+    finally:
+        recorder.close()
+
+
+def test_record_mock_exchange(tmp_path):
+    """Test recording the order book feed of the mock exchange."""
+    with MockExchange(feed_interval=0.01) as exchange:
+        client = exchange.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST))
+        with MarketDataRecorder(tmp_path) as recorder:
+            asyncio.run(watch_channels(client, [ETH_BOOK], [recorder], duration=0.1))
+    records = MarketDataReader(tmp_path).read("ETH-PERP")
+    assert len(records) >= 20
+    assert set(records["level"].tolist()) == set(range(10))
@@ -0,0 +1,166 @@
+"""
+Tests for replaying recorded sessions through the async client.
+"""
+
+import asyncio
+
+import pytest
+
+from benchmarks.harness import FIXTURES
+from lyra.async_client import AsyncClient
+from lyra.enums import Environment, OrderSide, TimeInForce
+from lyra.mock_exchange import make_instrument
+from lyra.recorder import MarketDataRecorder
+from lyra.replay import ReplayTransport, SimulatedMatcher, load_session
+from tests.conftest import REPLAY_BOOK_CHANNEL, REPLAY_SESSION, TEST_PRIVATE_KEY
+
+
+def make_client(replay):
+    client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    return replay.connect(client)
+
+
+def test_load_session(tmp_path):
+    """Test sessions load from raw ws messages, json lines output and recordings."""
+    messages = load_session(FIXTURES / "orderbook_messages.jsonl")
+    assert len(messages) == 100
+    assert messages[0][0] == REPLAY_BOOK_CHANNEL
+
+    with MarketDataRecorder(tmp_path / "recording") as recorder:
+        for channel, data in REPLAY_SESSION:
+            recorder(channel, data)
+    recorded = load_session(tmp_path / "recording")
+    assert [data["timestamp"] for _, data in recorded] == [1000, 1100, 1200]
+    assert recorded[0][1]["asks"] == [["2001.0", "1.0"], ["2002.0", "2.0"]]
+
+
+def test_replay_through_watch_order_book():
+    """Test a replay feeds the client's own order book handling, as fast as possible."""
+    replay = ReplayTransport.from_file(FIXTURES / "orderbook_messages.jsonl")
+    client = make_client(replay)
+
+    async def run():
+        await client.watch_order_book("ETH-PERP", depth="10")
+        await client.listener
+        return client.current_subscriptions["ETH-PERP"]
+
+    book = asyncio.run(run())
+    assert book["nonce"] == replay.updates[-1][1]["publish_id"]
+    assert replay.stats()["delivered"] == 100
+    assert replay.closed
+
+
+def test_replay_speed():
+    """Test updates are spread over the recorded time divided by the speed."""
+    replay = ReplayTransport(REPLAY_SESSION, speed=2.0)
+    client = make_client(replay)
+
+    async def run():
+        await client.subscribe_channels([REPLAY_BOOK_CHANNEL], lambda channel, data: None)
+        await client.listener
+
+    asyncio.run(run())
+    assert replay.stats()["elapsed"] == pytest.approx(0.1, abs=0.05)
+
+
+def test_orders_fill_against_the_replayed_book():
+    """Test orders rest and fill once the replayed book crosses them."""
+    replay = ReplayTransport(REPLAY_SESSION, close_at_end=False, autostart=False)
+    client = make_client(replay)
+    trades = []
+
+    async def run():
+        await client.login_client()
+        await client.subscribe_channels(["5.trades"], lambda channel, data: trades.extend(data))
+        await client.subscribe_channels([REPLAY_BOOK_CHANNEL], lambda channel, data: None)
+        order = await client.create_order(price=2001, amount=1.5, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        replay.start()
+        await replay.wait()
+        await asyncio.sleep(0.01)
+        await client.close()
+        return order
+
+    order = asyncio.run(run())
+    assert order["order_status"] == "open"
+    assert [(t["trade_price"], t["trade_amount"], t["liquidity_role"]) for t in trades] == [
+        ("2001", "1", "maker"),
+        ("2001", "0.5", "maker"),
+    ]
+    assert replay.matcher.orders[order["order_id"]]["order_status"] == "filled"
+
+
+def test_replay_answers_like_the_mock_exchange():
+    """Test the replay serves the mock exchange's instruments and cancels resting orders with cancel all."""
+    replay = ReplayTransport(REPLAY_SESSION + [("5.orders", {})], close_at_end=False, autostart=False)
+    client = make_client(replay)
+    assert replay.instruments == {"ETH-PERP": make_instrument("ETH-PERP")}
+
+    async def run():
+        await client.login_client()
+        for price in (1990, 1995):
+            await client.create_order(price=price, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        response = await client.cancel_all()
+        await client.close()
+        return response
+
+    assert asyncio.run(run()) == "ok"
+    assert {o["order_status"] for o in replay.matcher.orders.values()} == {"cancelled"}
+    assert not replay.matcher.open_orders(5)
+
+
+def test_time_in_force():
+    """Test post only, fill or kill and immediate or cancel orders against a book."""
+    matcher = SimulatedMatcher()
+    matcher.on_update(*REPLAY_SESSION[0], timestamp=1000)
+
+    def place(amount, price, time_in_force):
+        params = {
+            "instrument_name": "ETH-PERP",
+            "subaccount_id": 5,
+            "direction": "buy",
+            "limit_price": price,
+            "amount": amount,
+            "time_in_force": time_in_force.value,
+        }
+        return matcher.place(params, 1000)
+
+    assert place(1, 2001, TimeInForce.POST_ONLY)[0]["order_status"] == "rejected"
+    assert place(4, 2002, TimeInForce.FOK)[0]["order_status"] == "cancelled"
+    order, trades = place(4, 2002, TimeInForce.IOC)
+    assert (order["order_status"], order["filled_amount"], order["average_price"]) == (
+        "cancelled",
+        "3",
+        "2001.666666666666666666666667",
+    )
+    assert [(t["trade_price"], t["liquidity_role"]) for t in trades] == [("2001", "taker"), ("2002", "taker")]
+    assert not matcher.resting.get("ETH-PERP")
+
+
+def test_replay_is_deterministic():
+    """Test a strategy quoting on every update sees the same fills on every run."""
+    session = load_session(FIXTURES / "orderbook_messages.jsonl")[:30]
+
+    def run_once():
+        replay = ReplayTransport(session, close_at_end=False)
+        client = make_client(replay)
+
+        async def run():
+            await client.login_client()
+            tasks = []
+
+            def quote(channel, data):
+                price = float(data["bids"][0][0]) + 1 if data["bids"] else 2000
+                order = client.create_order(price=price, amount=0.5, instrument_name="ETH-PERP", side=OrderSide.BUY)
+                tasks.append(asyncio.ensure_future(order))
+
+            await client.subscribe_channels([REPLAY_BOOK_CHANNEL], quote)
+            await replay.wait()
+            await asyncio.gather(*tasks)
+            await client.close()
+
+        asyncio.run(run())
+        return [(t["order_id"], t["trade_price"], t["trade_amount"], t["timestamp"]) for t in replay.matcher.trades]
+
+    first = run_once()
+    assert first
+    assert run_once() == first
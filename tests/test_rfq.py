@@ -3,11 +3,20 @@ Implement tests for the RFQ class.
 """
 
 
+import asyncio
 from dataclasses import asdict, dataclass
 
+import eth_abi
 import pytest
 
-from lyra.enums import OrderSide
+from lyra.async_client import AsyncClient
+from lyra.constants import CONTRACTS
+from lyra.enums import Environment, OrderSide
+from lyra.lyra import LyraClient
+from lyra.metrics import QUOTE_LATENCY, STAGE_LATENCY, Metrics
+from lyra.mock_exchange import make_instrument
+from lyra.rfq import QUOTE_DATA_TYPES, QuotePipeline, QuoteTemplates, RfqFeed
+from tests.conftest import TEST_PRIVATE_KEY
 
 LEG_1_NAME = 'ETH-20240329-2400-C'
 LEG_2_NAME = 'ETH-20240329-2600-C'
@@ -67,7 +76,7 @@ def test_lyra_client_create_quote(
     # we now create the quote
     quote = lyra_client.create_quote_object(
         rfq_id=res['rfq_id'],
-        legs=[asdict(leg_1), asdict(leg_2)],
+        legs=[{**asdict(leg_1), 'price': '160'}, {**asdict(leg_2), 'price': '70'}],
         direction='sell',
     )
     # we now sign it
@@ -86,3 +95,181 @@ def test_poll_rfqs(lyra_client):
     assert lyra_client.send_rfq(rfq.to_dict())
     quotes = lyra_client.poll_rfqs()
     assert quotes
+
+
+def make_rfq(rfq_id, status="open", valid_until=10_000, last_update_timestamp=1_000):
+    return {
+        "rfq_id": rfq_id,
+        "status": status,
+        "valid_until": valid_until,
+        "last_update_timestamp": last_update_timestamp,
+        "legs": [{"instrument_name": LEG_1_NAME, "amount": "1", "direction": "buy"}],
+    }
+
+
+def test_rfq_feed_deduplicates_and_expires():
+    """Test RFQs are delivered once, updated in place, and closed by status or by valid_until."""
+    delivered, closed = [], []
+    feed = RfqFeed(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST), on_rfq=delivered.append, on_close=closed.append)
+
+    feed.apply(make_rfq("a"), now=1_000)
+    feed.apply(make_rfq("a"), now=1_100)
+    feed.apply(make_rfq("a", last_update_timestamp=1_200), now=1_200)
+    feed.apply(make_rfq("b", valid_until=2_000), now=1_300)
+    feed.apply(make_rfq("c", valid_until=1_000), now=1_300)
+    assert [r["rfq_id"] for r in delivered] == ["a", "b"]
+    assert feed.open["a"]["last_update_timestamp"] == 1_200
+
+    assert [r["rfq_id"] for r in feed.expire(now=2_000)] == ["b"]
+    feed.apply(make_rfq("a", status="filled"), now=2_100)
+    assert [(r["rfq_id"], r["status"]) for r in closed] == [("b", "expired"), ("a", "filled")]
+    assert not feed.open
+
+    # a cancel overtaking the open update, the late open update is not delivered
+    feed.apply(make_rfq("d", status="cancelled"), now=2_200)
+    feed.apply(make_rfq("d"), now=2_300)
+    assert [r["rfq_id"] for r in delivered] == ["a", "b"]
+
+
+def test_rfq_feed_from_mock_exchange(mock_exchange, mock_client):
+    """Test RFQs sent to the exchange arrive over the ws feed, and cancelled ones close."""
+    client = mock_exchange.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST))
+    legs = [{"instrument_name": LEG_1_NAME, "amount": "1", "direction": "buy"}]
+
+    async def run():
+        closed = []
+        feed = await client.watch_rfqs(on_close=closed.append)
+        loop = asyncio.get_running_loop()
+        sent = await loop.run_in_executor(None, lambda: mock_client.send_rfq({"subaccount_id": 5, "legs": legs}))
+        rfq = await asyncio.wait_for(feed.__anext__(), 1)
+        await client._request("private/cancel_rfq", {"rfq_id": rfq["rfq_id"]})
+        while not closed:
+            await asyncio.sleep(0.01)
+        await feed.close()
+        await client.close()
+        return sent, rfq, closed
+
+    sent, rfq, closed = asyncio.run(run())
+    assert rfq["rfq_id"] == sent["rfq_id"]
+    assert rfq["legs"] == legs
+    assert [r["status"] for r in closed] == ["cancelled"]
+
+
+# no rfq module address ships in the contracts, tests sign with a stand-in
+TEST_RFQ_MODULE_ADDRESS = "0x" + "11" * 20
+BTC_CALL = "BTC-20240329-50000-C"
+INSTRUMENTS = {
+    LEG_1_NAME: make_instrument(LEG_1_NAME, base_asset_sub_id=LEGS_TO_SUB_ID[LEG_1_NAME]),
+    LEG_2_NAME: make_instrument(LEG_2_NAME, base_asset_sub_id=LEGS_TO_SUB_ID[LEG_2_NAME]),
+    BTC_CALL: make_instrument(BTC_CALL, base_asset_sub_id="12345"),
+}
+
+
+def make_quote(client, direction="sell"):
+    legs = [
+        {"instrument_name": LEG_1_NAME, "amount": "1", "direction": "buy", "price": "160"},
+        {"instrument_name": BTC_CALL, "amount": "0.5", "direction": "sell", "price": "70"},
+    ]
+    return client.create_quote_object(rfq_id="rfq", legs=legs, direction=direction)
+
+
+def make_offline_client():
+    client = LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5)
+    client.instruments.update(INSTRUMENTS)
+    return client
+
+
+def test_encode_quote_data():
+    """Test quotes encode each leg's own asset, sub id and price from the instrument cache."""
+    client = make_offline_client()
+    quote = make_quote(client)
+    contracts = CONTRACTS[Environment.TEST]
+    to_wei = client.web3_client.to_wei
+    expected = (
+        to_wei("10.0", "ether"),
+        [
+            (contracts["ETH_OPTION_ADDRESS"], int(LEGS_TO_SUB_ID[LEG_1_NAME]), to_wei("160", "ether"), -(10**18)),
+            (contracts["BTC_OPTION_ADDRESS"], 12345, to_wei("70", "ether"), 5 * 10**17),
+        ],
+    )
+    encoded = eth_abi.encode(["(uint256,(address,uint256,uint256,int256)[])"], [expected])
+    assert client._encode_quote_data(quote) == client.web3_client.keccak(encoded)
+    assert [leg["price"] for leg in quote["legs"]] == ["160", "70"]
+    assert client._encode_quote_data(make_quote(client, "buy")) != client._encode_quote_data(quote)
+
+
+def test_quote_templates_match_eth_abi():
+    """Test quotes encoded from cached templates are byte for byte those of eth_abi, for any prices."""
+    client = make_offline_client()
+    templates = QuoteTemplates(client._encode_quote_leg)
+    to_wei = client.web3_client.to_wei
+    structures = [
+        [(LEG_1_NAME, "buy", "1")],
+        [(LEG_1_NAME, "buy", "1"), (LEG_2_NAME, "sell", "1")],
+        [(LEG_1_NAME, "buy", "1"), (LEG_2_NAME, "sell", "2"), (BTC_CALL, "buy", "0.25")],
+    ]
+    for structure in structures:
+        for direction in ["buy", "sell"]:
+            for price in ["0", "0.01", "160", "123456.789"]:
+                legs = [
+                    {"instrument_name": name, "direction": leg_direction, "amount": amount, "price": price}
+                    for name, leg_direction, amount in structure
+                ]
+                quote = {"direction": direction, "legs": legs, "max_fee": "12.5"}
+                direction_sign = 1 if direction == "buy" else -1
+                expected = eth_abi.encode(
+                    QUOTE_DATA_TYPES,
+                    [(to_wei("12.5", "ether"), [client._encode_quote_leg(leg, direction_sign) for leg in legs])],
+                )
+                assert templates.encode(quote, to_wei) == expected
+    assert (templates.misses, templates.hits) == (6, 18)
+
+
+def test_sign_quote_needs_the_rfq_module():
+    """Test signing a quote fails clearly without an rfq module address, and works with one."""
+    client = make_offline_client()
+    with pytest.raises(Exception, match="rfq module address"):
+        client._sign_quote(make_quote(client))
+    with pytest.raises(Exception, match="rfq module address"):
+        QuotePipeline(client, lambda rfq, leg: None)
+    client.rfq_module_address = TEST_RFQ_MODULE_ADDRESS
+    assert client._sign_quote(make_quote(client))["signature"].startswith("0x")
+
+
+def test_quote_pipeline(mock_exchange, mock_client):
+    """Test the pipeline quotes RFQs from the feed as they arrive, passing on those it cannot price."""
+    client = mock_exchange.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+    client.instruments.update(INSTRUMENTS)
+    client.metrics = Metrics()
+    prices = {LEG_1_NAME: 160, BTC_CALL: 70}
+    pipeline = QuotePipeline(
+        client, lambda rfq, leg: prices.get(leg["instrument_name"]), rfq_module_address=TEST_RFQ_MODULE_ADDRESS
+    )
+    rfqs = [
+        [{"instrument_name": LEG_1_NAME, "amount": "1", "direction": "buy"}],
+        [{"instrument_name": LEG_2_NAME, "amount": "1", "direction": "buy"}],
+        [
+            {"instrument_name": LEG_1_NAME, "amount": "1", "direction": "buy"},
+            {"instrument_name": BTC_CALL, "amount": "2", "direction": "sell"},
+        ],
+    ]
+
+    async def run():
+        feed = await client.watch_rfqs()
+        running = asyncio.ensure_future(pipeline.run(feed))
+        loop = asyncio.get_running_loop()
+        for legs in rfqs:
+            await loop.run_in_executor(None, lambda: mock_client.send_rfq({"subaccount_id": 5, "legs": legs}))
+        while pipeline.sent + pipeline.passed < len(rfqs):
+            await asyncio.sleep(0.01)
+        await feed.close()
+        await running
+        await client.close()
+
+    asyncio.run(run())
+    pipeline.close()
+    assert (pipeline.sent, pipeline.passed) == (2, 1)
+    assert sorted([leg["price"] for leg in quote["legs"]] for quote in mock_exchange.quotes) == [["160"], ["160", "70"]]
+    assert client.metrics.histogram(QUOTE_LATENCY).count == 2
+    assert client.metrics.histogram(STAGE_LATENCY, stage="sign").count == 2
+    assert client.metrics.histogram(STAGE_LATENCY, stage="price").count == 3
@@ -0,0 +1,53 @@
+"""
+Tests for the local session cache.
+"""
+
+import time
+
+import pytest
+
+from lyra.enums import Environment
+from lyra.lyra import LyraClient
+from lyra.session import SessionCache
+from tests.conftest import TEST_PRIVATE_KEY
+
+INSTRUMENT = {"instrument_name": "ETH-PERP", "base_asset_sub_id": "0", "tick_size": "0.01"}
+
+
+@pytest.fixture
+def client():
+    return LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+
+
+def test_round_trip(tmp_path, client):
+    """Test a session written by one client seeds the next one."""
+    client.subaccount_id = 5
+    client.instruments["ETH-PERP"] = INSTRUMENT
+    SessionCache(client.env, client.wallet, directory=tmp_path).persist(client)
+
+    fresh = LyraClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+    assert SessionCache(fresh.env, fresh.wallet, directory=tmp_path).restore(fresh)
+    assert fresh.subaccount_id == 5
+    assert fresh.get_instrument("ETH-PERP") == INSTRUMENT
+
+
+def test_expiry(tmp_path, client, monkeypatch):
+    """Test an expired session is ignored."""
+    cache = SessionCache(client.env, client.wallet, ttl=10, directory=tmp_path)
+    cache.save(subaccount_id=5)
+    assert cache.load()["subaccount_id"] == 5
+    expires_at = cache.load()["expires_at"]
+    monkeypatch.setattr(time, "time", lambda: expires_at + 1)
+    assert cache.load() == {}
+
+
+def test_environment_mismatch(tmp_path, client):
+    """Test a session is not shared between environments, and corrupt files are ignored."""
+    cache = SessionCache(Environment.TEST, client.wallet, directory=tmp_path)
+    cache.save(subaccount_id=5)
+    cache.path.rename(SessionCache(Environment.PROD, client.wallet, directory=tmp_path).path)
+    assert SessionCache(Environment.PROD, client.wallet, directory=tmp_path).load() == {}
+    cache.path.write_text("{not json")
+    assert cache.load() == {}
+    cache.clear()
+    assert not cache.path.exists()
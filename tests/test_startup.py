@@ -0,0 +1,13 @@
+"""
+Tests that the package and cli start without importing heavy dependencies.
+"""
+
+import pytest
+
+from benchmarks.startup import heavy_imports
+
+
+@pytest.mark.parametrize("module", ["lyra", "lyra.cli", "lyra.enums"])
+def test_no_heavy_imports(module):
+    """Test importing the module does not pull in pandas, web3 or the client."""
+    assert heavy_imports(module) == []
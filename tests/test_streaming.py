@@ -0,0 +1,126 @@
+"""
+Tests for the async client subscriptions and the live streams, run without a network.
+"""
+
+import asyncio
+import io
+
+import aiohttp
+
+from lyra.async_client import AsyncClient
+from lyra.codec import dumps, loads
+from lyra.enums import Environment
+from lyra.streaming import (
+    JsonlWriter,
+    LatestUpdates,
+    OrderBookUpdates,
+    get_order_book_channel,
+    get_ticker_channel,
+    render_order_books,
+    render_tickers,
+    watch_channels,
+)
+from tests.conftest import TEST_PRIVATE_KEY
+
+TICKER = {
+    "timestamp": 1700000000000,
+    "instrument_ticker": {"instrument_name": "ETH-PERP", "best_bid_price": "2000", "best_ask_price": "2001"},
+}
+
+
+class FakeMessage:
+    def __init__(self, data, type=aiohttp.WSMsgType.TEXT):
+        self.data = data
+        self.type = type
+
+
+class FakeAsyncWs:
+    """Stands in for an aiohttp websocket, answering requests and then playing back channel updates."""
+
+    def __init__(self, updates=()):
+        self.sent = []
+        self.messages = asyncio.Queue()
+        self.updates = list(updates)
+        self.closed = False
+
+    async def send_json(self, message, dumps=dumps):
+        message = loads(dumps(message))
+        self.sent.append(message)
+        result = {}
+        if message["method"] == "subscribe":
+            result = {"status": {channel: "ok" for channel in message["params"]["channels"]}}
+        await self.messages.put(FakeMessage(dumps({"id": message["id"], "result": result}).encode()))
+        for channel, data in self.updates:
+            await self.messages.put(FakeMessage(dumps({"params": {"channel": channel, "data": data}}).encode()))
+        self.updates = []
+
+    async def receive(self):
+        return await self.messages.get()
+
+    async def close(self):
+        self.closed = True
+        await self.messages.put(FakeMessage(None, aiohttp.WSMsgType.CLOSED))
+
+
+def make_client(ws):
+    client = AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST)
+
+    async def connect_ws():
+        client._ws = ws
+        return ws
+
+    client.connect_ws = connect_ws
+    return client
+
+
+def test_dispatch_routes_updates_by_channel():
+    """Test channel updates reach only the handlers of their channel."""
+    client = make_client(FakeAsyncWs())
+    received = []
+    channel = get_ticker_channel("ETH-PERP")
+    client.channel_handlers[channel] = [lambda *args: received.append(args)]
+    client.dispatch({"params": {"channel": channel, "data": TICKER}})
+    client.dispatch({"params": {"channel": get_ticker_channel("BTC-PERP"), "data": TICKER}})
+    assert received == [(channel, TICKER)]
+
+
+def test_watch_channels():
+    """Test subscribing feeds every update to every handler and stops after the duration."""
+    channel = get_ticker_channel("ETH-PERP", "100")
+    updates = [(channel, {**TICKER, "timestamp": TICKER["timestamp"] + i}) for i in range(3)]
+    ws = FakeAsyncWs(updates)
+    client = make_client(ws)
+    latest, stream = LatestUpdates(), io.StringIO()
+    writer = JsonlWriter(stream).start()
+
+    asyncio.run(watch_channels(client, [channel], [latest, writer], duration=0.1))
+    writer.close()
+
+    assert [m["method"] for m in ws.sent] == ["subscribe"]
+    assert ws.closed
+    assert latest.updates == 3
+    assert latest.snapshot()["ETH-PERP"]["timestamp"] == TICKER["timestamp"] + 2
+    assert [loads(line)["data"] for line in stream.getvalue().splitlines()] == [data for _, data in updates]
+
+
+def test_latest_updates_conflates():
+    """Test a snapshot only holds the latest update per instrument, and only when something changed."""
+    latest = LatestUpdates()
+    assert latest.snapshot() is None
+    for i in range(5):
+        latest(get_ticker_channel("ETH-PERP"), {"timestamp": i})
+    assert latest.snapshot() == {"ETH-PERP": {"timestamp": 4}}
+    assert latest.snapshot() is None
+    assert render_tickers({"ETH-PERP": TICKER}).row_count == 1
+
+
+def test_order_book_updates_keep_empty_sides():
+    """Test an update with an empty side keeps the previous levels of that side."""
+    books = OrderBookUpdates()
+    channel = get_order_book_channel("ETH-PERP")
+    books(channel, {"bids": [["2000", "1"]], "asks": [["2001", "2"], ["2002", "3"]]})
+    books(channel, {"bids": [["1999", "4"]], "asks": []})
+    book = books.snapshot()["ETH-PERP"]
+    assert book["bids"] == [["1999", "4"]]
+    assert book["asks"] == [["2001", "2"], ["2002", "3"]]
+    assert render_order_books({"ETH-PERP": book}, levels=1).row_count == 1
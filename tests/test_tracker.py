@@ -0,0 +1,99 @@
+"""
+Tests for tracking order state from the private channels.
+"""
+
+import asyncio
+
+from lyra.async_client import AsyncClient
+from lyra.enums import Environment, OrderSide
+from lyra.replay import ReplayTransport
+from lyra.tracker import OrderTracker
+from tests.conftest import REPLAY_SESSION, TEST_PRIVATE_KEY
+
+
+def make_order(order_id, status="open", timestamp=1000, instrument_name="ETH-PERP", label=""):
+    return {
+        "order_id": order_id,
+        "instrument_name": instrument_name,
+        "order_status": status,
+        "last_update_timestamp": timestamp,
+        "label": label,
+        "filled_amount": "0",
+    }
+
+
+def test_indexes_follow_updates():
+    """Test orders are indexed by instrument, label and status, and updates move them between indexes."""
+    tracker = OrderTracker(5)
+    tracker("5.orders", [make_order("a", label="quotes"), make_order("b", instrument_name="BTC-PERP")])
+    open_eth = tracker.open_orders("ETH-PERP")
+    reference = tracker.get("a")
+    assert list(open_eth) == ["a"]
+    assert list(tracker.open_orders()) == ["a", "b"]
+    assert list(tracker.with_label("quotes")) == ["a"]
+
+    tracker("5.orders", [{**make_order("a", status="filled", timestamp=2000, label="quotes"), "filled_amount": "1"}])
+    assert reference["filled_amount"] == "1"
+    assert not open_eth
+    assert list(tracker.with_status("filled")) == ["a"]
+    assert list(tracker.with_label("quotes")) == ["a"]
+    assert tracker.prune() == 1
+    assert tracker.get("a") is None and not tracker.with_label("quotes")
+
+
+def test_out_of_order_updates_are_ignored():
+    """Test older updates, and updates reopening a closed order, do not apply."""
+    tracker = OrderTracker(5)
+    tracker.apply_order(make_order("a", timestamp=2000))
+    assert tracker.apply_order(make_order("a", status="cancelled", timestamp=1000)) is None
+    assert tracker.apply_order(make_order("a", status="cancelled", timestamp=2000))
+    assert tracker.apply_order(make_order("a", timestamp=3000)) is None
+    assert tracker.get("a")["order_status"] == "cancelled"
+
+
+def test_trades_are_deduplicated():
+    """Test fills are reported once per trade id, with the order when it is known."""
+    fills = []
+    tracker = OrderTracker(
+        5, on_fill=lambda trade, order: fills.append((trade["trade_id"], order and order["order_id"]))
+    )
+    tracker.apply_order(make_order("a"))
+    tracker("5.trades", [{"trade_id": "1", "order_id": "a"}, {"trade_id": "2", "order_id": "b"}])
+    tracker("5.trades", [{"trade_id": "1", "order_id": "a"}])
+    assert fills == [("1", "a"), ("2", None)]
+
+
+def test_track_orders_from_a_replay():
+    """Test the tracker follows orders placed, filled and cancelled through the client, without polling."""
+    replay = ReplayTransport(REPLAY_SESSION, close_at_end=False, autostart=False)
+    client = replay.connect(AsyncClient(TEST_PRIVATE_KEY, env=Environment.TEST, subaccount_id=5))
+    fills = []
+
+    async def settle():
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def run():
+        tracker = await client.track_orders(
+            on_fill=lambda trade, order: fills.append(trade["trade_amount"]), seed=False
+        )
+        buy = await client.create_order(price=2001, amount=1.5, instrument_name="ETH-PERP", side=OrderSide.BUY)
+        sell = await client.create_order(price=2100, amount=1, instrument_name="ETH-PERP", side=OrderSide.SELL)
+        await settle()
+        assert set(tracker.open_orders("ETH-PERP")) == {buy["order_id"], sell["order_id"]}
+
+        replay.start()
+        await replay.wait()
+        await settle()
+        assert tracker.get(buy["order_id"])["order_status"] == "filled"
+        assert list(tracker.open_orders("ETH-PERP")) == [sell["order_id"]]
+
+        await client._request("private/cancel", {"order_id": sell["order_id"]})
+        await settle()
+        await client.close()
+        return tracker
+
+    tracker = asyncio.run(run())
+    assert fills == ["1", "0.5"]
+    assert not tracker.open_orders()
+    assert len(tracker.with_status("cancelled")) == 1
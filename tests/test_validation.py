@@ -0,0 +1,117 @@
+"""
+Tests for validating orders against the cached instrument specs.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from lyra.enums import OrderSide
+from lyra.mock_exchange import make_instrument
+from lyra.validation import OrderValidationError, check_orders, round_orders, validate_orders
+
+INSTRUMENTS = {
+    i["instrument_name"]: i
+    for i in [
+        make_instrument("ETH-PERP"),
+        make_instrument("BTC-PERP", tick_size="0.5", is_active=False),
+        make_instrument("ETH-20240329-2400-C"),
+    ]
+}
+
+BEFORE_EXPIRY = datetime(2024, 3, 29, 7, tzinfo=timezone.utc).timestamp()
+AFTER_EXPIRY = datetime(2024, 3, 29, 9, tzinfo=timezone.utc).timestamp()
+
+
+def make_order(price, amount, instrument_name="ETH-PERP", side="buy"):
+    return {"instrument_name": instrument_name, "side": side, "price": price, "amount": amount}
+
+
+ORDERS = [
+    make_order("2000.01", "1"),
+    make_order("2000.005", "1"),
+    make_order("2000", "0.05"),
+    make_order("2000", "1.005"),
+    make_order("-1", "1"),
+    make_order("2000", "abc"),
+    make_order("40000", "1", "BTC-PERP"),
+    make_order("1", "1", "BTC-FAKE"),
+    make_order("1", "1", None),
+    make_order("50.5", "1", "ETH-20240329-2400-C"),
+]
+
+
+def test_check_orders():
+    """Test every order of a batch gets the first reason it would be rejected for."""
+    assert check_orders(ORDERS, INSTRUMENTS, now=BEFORE_EXPIRY) == [
+        None,
+        "price 2000.005 is not a multiple of 0.01",
+        "amount 0.05 is below the minimum of 0.1",
+        "amount 1.005 is not a multiple of 0.01",
+        "invalid price -1",
+        "invalid amount abc",
+        "instrument BTC-PERP is not active",
+        "unknown instrument BTC-FAKE",
+        "unknown instrument None",
+        None,
+    ]
+    assert check_orders([{"instrument_name": "ETH-PERP", "price": "1"}], INSTRUMENTS) == [
+        "missing fields ['side', 'amount']"
+    ]
+    assert check_orders([make_order("1", "1", side="hold"), {**ORDERS[0], "time_in_force": "day"}], INSTRUMENTS) == [
+        "invalid side hold",
+        "invalid time in force day",
+    ]
+
+
+def test_expired_instruments():
+    """Test orders on options past their 08:00 UTC expiry are refused."""
+    order = make_order("50.5", "1", "ETH-20240329-2400-C")
+    assert check_orders([order], INSTRUMENTS, now=BEFORE_EXPIRY) == [None]
+    assert check_orders([order], INSTRUMENTS, now=AFTER_EXPIRY) == ["instrument ETH-20240329-2400-C has expired"]
+    option = {**INSTRUMENTS["ETH-20240329-2400-C"], "option_details": {"expiry": int(BEFORE_EXPIRY)}}
+    assert check_orders([order], {"ETH-20240329-2400-C": option}, now=BEFORE_EXPIRY) == [
+        "instrument ETH-20240329-2400-C has expired"
+    ]
+
+
+def test_round_orders():
+    """Test prices round away from the market onto the tick, and amounts down onto the step."""
+    orders = [
+        make_order(2000.016, 1.239, side="buy"),
+        make_order(2000.011, 1.2, side="sell"),
+        make_order(1.5, 1, "BTC-FAKE"),
+        make_order(2000.005, 1, side=OrderSide.BUY),
+        make_order(2000.005, 1, side=OrderSide.SELL),
+    ]
+    rounded = round_orders(orders, INSTRUMENTS)
+    assert [(o["price"], o["amount"]) for o in rounded] == [
+        ("2000.01", "1.23"),
+        ("2000.02", "1.20"),
+        (1.5, 1),
+        ("2000.00", "1.00"),
+        ("2000.01", "1.00"),
+    ]
+    assert check_orders(rounded[:2], INSTRUMENTS) == [None, None]
+    with pytest.raises(OrderValidationError) as error:
+        round_orders([make_order(2000.005, 1, side=None)], INSTRUMENTS)
+    assert error.value.errors == {0: "invalid side None"}
+
+
+def test_validate_orders():
+    """Test every bad order of a batch is reported at once, and rounding can fix them first."""
+    orders = [make_order("2000.01", "1"), make_order("2000.005", "1"), make_order("2000", "0.05")]
+    with pytest.raises(OrderValidationError) as error:
+        validate_orders(orders, INSTRUMENTS)
+    assert list(error.value.errors) == [1, 2]
+    with pytest.raises(OrderValidationError) as error:
+        validate_orders(orders, INSTRUMENTS, round_first=True)
+    assert list(error.value.errors) == [2]
+    assert validate_orders(orders[:2], INSTRUMENTS, round_first=True)[1]["price"] == "2000.00"
+
+
+def test_bad_orders_are_never_signed(mock_client, mock_exchange):
+    """Test the client refuses an order off the tick before signing or sending it."""
+    with pytest.raises(OrderValidationError):
+        mock_client.create_order(price=2000.005, amount=1, instrument_name="ETH-PERP", side=OrderSide.BUY)
+    assert [r["method"] for r in mock_exchange.requests] == ["public/get_instruments"]